@@ -1,7 +1,6 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import zipfile
 import plotly.express as px
 import streamlit.components.v1 as components
 import plotly.io as pio
@@ -11,42 +10,6 @@ pio.kaleido.scope.default_scale = 2
 pio.kaleido.scope.default_width = 600
 pio.kaleido.scope.default_height = 400
 
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-from io import BytesIO
-
-from datetime import datetime
-from reportlab.platypus import Paragraph
-from reportlab.lib.styles import ParagraphStyle
-
-import json
-import uuid
-
-def guardar_vista(filtros):
-
-    view_id = uuid.uuid4().hex[:8]  # 8 caracteres
-
-    ruta = f"data/views/{view_id}.json"
-
-    with open(ruta, "w") as f:
-        json.dump(filtros, f)
-
-    return view_id
-
-def cargar_vista(view_id):
-
-    ruta = f"data/views/{view_id}.json"
-
-    if os.path.exists(ruta):
-
-        with open(ruta) as f:
-            return json.load(f)
-
-    return None
-
 st.set_page_config(page_title="Control de Caja 2026", layout="wide")
 st.markdown("""
 <style>
@@ -323,53 +286,32 @@ if "filtros_guardados" in st.session_state:
 import os
 from urllib.parse import urlencode
 
+from utils.data_loader import (
+    cargar_excel, guardar_archivo, eliminar_archivo, resumen_ingesta,
+    normalizar_parametros
+)
+from utils.indice import indice_fechas, indice_filtros
+from utils.cubo import datos_agregables
+from utils.agregacion import agregar
+from utils.imagenes import parametros_imagen
+from utils.exportaciones import (
+    clave_vista, boton_exportacion, estadisticas_exportaciones, resumen_exportaciones
+)
+from utils.reportes import exportar_dashboard, exportar_pdf_ejecutivo
+from utils.vistas import cargar_vista, boton_url_corta, hash_vista, vista_filtros
+from utils.pipeline import Pipeline
+from utils.detalle import detalle_paginado
+from utils.tablas import mostrar_tabla
+from utils.panel_filtros import filtros_por_lote, panel_filtros
+
 # --------------------------------------------------
 # CREAR CARPETA DATA SI NO EXISTE
 # --------------------------------------------------
 if not os.path.exists("data"):
     os.makedirs("data")
 
-if not os.path.exists("data/views"):
-    os.makedirs("data/views")
-
 ruta_excel = "data/control_caja_proyectado.xlsx"
 
-# --------------------------------------------------
-# Utilidades
-# --------------------------------------------------
-def normalizar(col):
-    return (
-        col.lower()
-        .replace(" ", "_")
-        .replace("/", "")
-        .replace("°", "")
-    )
-
-# --------------------------------------------------
-# Cargar Excel
-# --------------------------------------------------
-def cargar_excel(archivo):
-    df = pd.read_excel(archivo)
-    df.columns = [normalizar(c) for c in df.columns]
-
-    obligatorias = ["fecha", "total_general_s"]
-    for c in obligatorias:
-        if c not in df.columns:
-            st.error(f"❌ Falta la columna obligatoria: {c}")
-            st.stop()
-
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-    df["total_general_s"] = (
-        df["total_general_s"]
-        .astype(str)
-        .str.replace(",", "", regex=False)
-        .astype(float)
-    )
-
-    df["anio_mes"] = df["fecha"].dt.to_period("M").astype(str)
-
-    return df
-
 # --------------------------------------------------
 # UI
 # --------------------------------------------------
@@ -454,8 +396,7 @@ if es_admin:
 
     if st.sidebar.button("🗑️ Limpiar archivos guardados"):
 
-        if os.path.exists(ruta_excel):
-            os.remove(ruta_excel)
+        eliminar_archivo(ruta_excel)
 
         # limpiar filtros
         for key in list(st.session_state.keys()):
@@ -479,14 +420,16 @@ else:
 # --------------------------------------------------
 if archivo is not None and not st.session_state.get("archivo_guardado", False):
 
-    with open(ruta_excel, "wb") as f:
-        f.write(archivo.getbuffer())
+    estadisticas = guardar_archivo(archivo, ruta_excel)
 
     st.session_state["archivo_guardado"] = True
     st.session_state["mensaje_mostrado"] = False
 
     st.success("Archivo guardado correctamente")
 
+    if estadisticas:
+        st.caption(resumen_ingesta(estadisticas))
+
 # --------------------------------------------------
 # CARGAR ARCHIVO SI EXISTE
 # --------------------------------------------------
@@ -538,7 +481,7 @@ if os.path.exists(ruta_excel):
     columnas_filtro = []
     mes_seleccionado = "Todos"
     modo = "Sin comparación"
-    df_filtrado = df.copy()
+    df_filtrado = df
 
     def guardar_parametro(nombre, valor):
 
@@ -554,294 +497,313 @@ if os.path.exists(ruta_excel):
 
     def obtener_parametro(nombre):
         return query_params.get(nombre)
+    # links y vistas guardados con ingresoegreso como venía en el Excel
+    normalizar_parametros(st.query_params)
+
     # --------------------------------------------------
     # CONFIGURACIÓN DE FILTROS
     # --------------------------------------------------
-    if not modo_lectura:
-        st.sidebar.header("🎛️ Configuración De Filtros")
+    # Los filtros se dibujan en dibujar_filtros(); por lote (ver
+    # utils.panel_filtros) el panel se vuelve a ejecutar solo y la página
+    # se recalcula al aplicar
+    def dibujar_filtros():
 
+        if not modo_lectura:
+            st.header("🎛️ Configuración De Filtros")
 
-    columnas_disponibles = [
-        c for c in df.columns
-        if c not in ["total_general_s", "anio_mes"]
-    ]
 
-    # --------------------------------------------------
-    # COLUMNAS PARA FILTRAR (ARREGLADO SIN DOBLE CLICK)
-    # --------------------------------------------------
+        columnas_disponibles = [
+            c for c in df.columns
+            if c not in ["total_general_s", "anio_mes", "mes_num", "mes_nombre"]
+        ]
+
+        # --------------------------------------------------
+        # COLUMNAS PARA FILTRAR (ARREGLADO SIN DOBLE CLICK)
+        # --------------------------------------------------
 
-    if "columnas_filtro" not in st.session_state:
+        if "columnas_filtro" not in st.session_state:
 
-        columnas_url = obtener_parametro("columnas")
+            columnas_url = obtener_parametro("columnas")
 
-        if columnas_url:
-            if isinstance(columnas_url, str):
-                columnas_url = columnas_url.split(",")
+            if columnas_url:
+                if isinstance(columnas_url, str):
+                    columnas_url = columnas_url.split(",")
 
-            st.session_state["columnas_filtro"] = [
-                c for c in columnas_url if c in columnas_disponibles
-            ]
+                st.session_state["columnas_filtro"] = [
+                    c for c in columnas_url if c in columnas_disponibles
+                ]
+            else:
+                st.session_state["columnas_filtro"] = [
+                    c for c in [
+                        "costo__gasto",
+                        "clasificacion_1",
+                        "clasificacion_flujo2"
+                    ] if c in columnas_disponibles
+                ]
+        if not modo_lectura:
+            columnas_filtro = st.multiselect(
+                "Selecciona columnas para filtrar",
+                columnas_disponibles,
+                default=st.session_state.get("columnas_filtro", []),
+                key="columnas_filtro"
+            )
         else:
-            st.session_state["columnas_filtro"] = [
-                c for c in [
-                    "costo__gasto",
-                    "clasificacion_1",
-                    "clasificacion_flujo2"
-                ] if c in columnas_disponibles
-            ]
-    if not modo_lectura:
-        columnas_filtro = st.sidebar.multiselect(
-            "Selecciona columnas para filtrar",
-            columnas_disponibles,
-            default=st.session_state.get("columnas_filtro", []),
-            key="columnas_filtro"
-        )
-    else:
-        columnas_url = st.query_params.get("columnas")
+            columnas_url = st.query_params.get("columnas")
 
-        if columnas_url:
-            if isinstance(columnas_url, str):
-                columnas_url = columnas_url.split(",")
+            if columnas_url:
+                if isinstance(columnas_url, str):
+                    columnas_url = columnas_url.split(",")
 
-            columnas_filtro = [
-                c for c in columnas_url if c in columnas_disponibles
-            ]
+                columnas_filtro = [
+                    c for c in columnas_url if c in columnas_disponibles
+                ]
+            else:
+                columnas_filtro = []
+
+        # Guardar en URL
+        if columnas_filtro:
+            st.query_params["columnas"] = ",".join(columnas_filtro)
         else:
-            columnas_filtro = []
+            if "columnas" in st.query_params:
+                del st.query_params["columnas"]
 
-    # Guardar en URL
-    if columnas_filtro:
-        st.query_params["columnas"] = ",".join(columnas_filtro)
-    else:
-        if "columnas" in st.query_params:
-            del st.query_params["columnas"]
+        if not modo_lectura:
+            st.divider()
+            st.subheader("🔍 Filtros")
 
-    if not modo_lectura:
-        st.sidebar.divider()
-        st.sidebar.subheader("🔍 Filtros")
+        # --------------------------------------------------
+        # UTILIDAD: seleccionar todos los valores del filtro
+        # --------------------------------------------------
+        def seleccionar_todos(col, valores):
+            st.session_state[f"filtro_{col}"] = valores.copy()
+        # --------------------------------------------------
+        # FILTRO POR MES
+        # --------------------------------------------------
 
-    # --------------------------------------------------
-    # UTILIDAD: seleccionar todos los valores del filtro
-    # --------------------------------------------------
-    def seleccionar_todos(col, valores):
-        st.session_state[f"filtro_{col}"] = valores.copy()
-    # --------------------------------------------------
-    # FILTRO POR MES
-    # --------------------------------------------------
+        meses_es = {
+            1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+            5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+            9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+        }
 
-    meses_es = {
-        1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-        5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-        9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-    }
 
-    df["mes_num"] = df["fecha"].dt.month
-    df["mes_nombre"] = df["mes_num"].map(meses_es)
+        # El DataFrame viene ordenado por fecha: meses y rangos de fechas se
+        # resuelven con búsqueda binaria sobre este índice
+        fechas_idx = indice_fechas(df)
 
-    df_filtrado = df.copy()
+        meses_disponibles = [meses_es[m] for m in sorted(fechas_idx.tramos_por_mes)]
 
-    meses_disponibles = sorted(
-        df["mes_nombre"].dropna().unique(),
-        key=lambda x: list(meses_es.values()).index(x)
-    )
+        # Inicializar mes desde URL solo una vez
+        if "mes_seleccionado" not in st.session_state:
+            st.session_state["mes_seleccionado"] = st.query_params.get("mes", "Todos")
 
-    # Inicializar mes desde URL solo una vez
-    if "mes_seleccionado" not in st.session_state:
-        st.session_state["mes_seleccionado"] = st.query_params.get("mes", "Todos")
+        if not modo_lectura:
+            mes_seleccionado = st.selectbox(
+                "📅 Seleccionar mes",
+                ["Todos"] + meses_disponibles,
+                key="mes_seleccionado"
+            )
+        else:
+            mes_seleccionado = st.session_state.get(
+                "mes_seleccionado",
+                st.query_params.get("mes", "Todos")
+            )
 
-    if not modo_lectura:
-        mes_seleccionado = st.sidebar.selectbox(
-            "📅 Seleccionar mes",
-            ["Todos"] + meses_disponibles,
-            key="mes_seleccionado"
-        )
-    else:
-        mes_seleccionado = st.session_state.get(
-            "mes_seleccionado",
-            st.query_params.get("mes", "Todos")
-        )
 
+        guardar_parametro("mes", mes_seleccionado)
 
-    guardar_parametro("mes", mes_seleccionado)
+        # --------------------------------------------------
+        # CALCULAR RANGO BASE SEGÚN MES
+        # --------------------------------------------------
 
-    # --------------------------------------------------
-    # CALCULAR RANGO BASE SEGÚN MES
-    # --------------------------------------------------
+        if mes_seleccionado != "Todos":
+            tramos_mes = fechas_idx.tramos_mes(mes_seleccionado)
+        else:
+            tramos_mes = fechas_idx.todas()
 
-    if mes_seleccionado != "Todos":
+        fecha_min, fecha_max = fechas_idx.rango(tramos_mes)
 
-        df_mes = df[df["mes_nombre"] == mes_seleccionado]
+        min_date = fecha_min.date()
+        max_date = fecha_max.date()
 
-        fecha_min = df_mes["fecha"].min()
-        fecha_max = df_mes["fecha"].max()
+        # --------------------------------------------------
+        # RESETEAR RANGO SI CAMBIA MES
+        # --------------------------------------------------
 
-    else:
-        fecha_min = df["fecha"].min()
-        fecha_max = df["fecha"].max()
+        if "mes_anterior" not in st.session_state:
+            st.session_state["mes_anterior"] = mes_seleccionado
 
-    min_date = fecha_min.date()
-    max_date = fecha_max.date()
+        if st.session_state["mes_anterior"] != mes_seleccionado:
 
-    # --------------------------------------------------
-    # RESETEAR RANGO SI CAMBIA MES
-    # --------------------------------------------------
+            if "fecha_inicio" in st.query_params:
+                del st.query_params["fecha_inicio"]
 
-    if "mes_anterior" not in st.session_state:
-        st.session_state["mes_anterior"] = mes_seleccionado
+            if "fecha_fin" in st.query_params:
+                del st.query_params["fecha_fin"]
 
-    if st.session_state["mes_anterior"] != mes_seleccionado:
+            st.session_state["mes_anterior"] = mes_seleccionado
 
-        if "fecha_inicio" in st.query_params:
-            del st.query_params["fecha_inicio"]
+        ## FIN de FILTRO POR MES
+        ################################
 
-        if "fecha_fin" in st.query_params:
-            del st.query_params["fecha_fin"]
+        # Cascada sobre bitmaps: cada filtro es un AND y las opciones de cada
+        # multiselect salen de las filas que ya pasaron los filtros anteriores
+        # El mes se aplica primero, como tramos del índice de fechas
+        indice = indice_filtros(df)
+        if mes_seleccionado != "Todos":
+            mascara = fechas_idx.mascara(tramos_mes)
+        else:
+            mascara = indice.todos()
 
-        st.session_state["mes_anterior"] = mes_seleccionado
-        
-    ## FIN de FILTRO POR MES
-    ################################
-    for col in columnas_filtro:
-
-        valores = (
-            df_filtrado[col]
-            .dropna()
-            .astype(str)
-            .sort_values()
-            .unique()
-            .tolist()
-        )
+        # selecciones aplicadas, para repetirlas sobre el cubo
+        filtros_activos = {}
 
+        for col in columnas_filtro:
 
-        key = f"filtro_{col}"
+            valores = indice.opciones(col, mascara)
 
-        # LEER filtros desde URL
-        valores_url = st.query_params.get(col)
-        if valores_url:
-            if isinstance(valores_url, str):
-                valores_url = valores_url.split(",")  # 🔹 separar múltiples valores
-            seleccion_actual = [v for v in valores_url if v in valores]
-        else:
-            seleccion_actual = []
 
-        # -----------------------------
-        # Botón seleccionar todos
-        # -----------------------------
-        if not modo_lectura:
+            key = f"filtro_{col}"
 
-            if st.sidebar.button("✔ Todos", key=f"btn_all_{col}"):
-                st.session_state[key] = valores.copy()
-                st.rerun()
+            # LEER filtros desde URL
+            valores_url = st.query_params.get(col)
+            if valores_url:
+                if isinstance(valores_url, str):
+                    valores_url = valores_url.split(",")  # 🔹 separar múltiples valores
+                seleccion_actual = [v for v in valores_url if v in valores]
+            else:
+                seleccion_actual = []
 
-            # Si el filtro no existe en session_state, reconstruir desde URL
-            if key not in st.session_state:
+            # -----------------------------
+            # Botón seleccionar todos
+            # -----------------------------
+            if not modo_lectura:
 
-                valores_url = st.query_params.get(col)
+                # con callback y sin st.rerun(): por lote solo se redibuja el panel
+                st.button(
+                    "✔ Todos", key=f"btn_all_{col}",
+                    on_click=seleccionar_todos, args=(col, valores)
+                )
 
-                if valores_url:
-                    if isinstance(valores_url, str):
-                        valores_url = [valores_url]
+                # Si el filtro no existe en session_state, reconstruir desde URL
+                if key not in st.session_state:
 
-                    st.session_state[key] = [
-                        v for v in valores_url if v in valores
-                    ]
-                else:
-                    st.session_state[key] = []
+                    valores_url = st.query_params.get(col)
 
-            opciones_validas = sorted(
-                df_filtrado[col].dropna().astype(str).unique()
-            )
+                    if valores_url:
+                        if isinstance(valores_url, str):
+                            valores_url = [valores_url]
 
-            # 🔥 Limpiar valores inválidos del session_state
-            valores_guardados = st.session_state.get(key, [])
+                        st.session_state[key] = [
+                            v for v in valores_url if v in valores
+                        ]
+                    else:
+                        st.session_state[key] = []
 
-            valores_limpios = [
-                v for v in valores_guardados
-                if v in opciones_validas
-            ]
+                opciones_validas = valores
 
-            # Actualizar session_state si hubo limpieza
-            st.session_state[key] = valores_limpios
+                # 🔥 Limpiar valores inválidos del session_state
+                valores_guardados = st.session_state.get(key, [])
 
-            seleccion_actual = st.sidebar.multiselect(
-                f"{col.replace('_', ' ').title()}",
-                options=opciones_validas,
-                default=valores_limpios,
-                key=key
-            )
+                valores_limpios = [
+                    v for v in valores_guardados
+                    if v in opciones_validas
+                ]
 
+                # Actualizar session_state si hubo limpieza
+                st.session_state[key] = valores_limpios
 
-        if modo_lectura:
-            valores_url = st.query_params.get(col)
-            if valores_url:
-                if isinstance(valores_url, str):
-                    valores_url = valores_url.split(",")  # 🔹 separar varios valores
-                seleccion_actual = [v for v in valores_url if v in valores]
-            else:
-                seleccion_actual = []
+                seleccion_actual = st.multiselect(
+                    f"{col.replace('_', ' ').title()}",
+                    options=opciones_validas,
+                    default=valores_limpios,
+                    key=key
+                )
 
-            # Mostrar los filtros en la barra lateral (solo lectura)
-            st.sidebar.markdown(f"**{col.replace('_',' ').title()}:** {', '.join(seleccion_actual) if seleccion_actual else 'Todos'}")
 
-        # Guardar solo los valores seleccionados en URL
-        if seleccion_actual:
-            st.query_params[col] = ",".join(seleccion_actual)  # 🔹 join para multi-selección
-        else:
-            if col in st.query_params:
-                del st.query_params[col]
+            if modo_lectura:
+                valores_url = st.query_params.get(col)
+                if valores_url:
+                    if isinstance(valores_url, str):
+                        valores_url = valores_url.split(",")  # 🔹 separar varios valores
+                    seleccion_actual = [v for v in valores_url if v in valores]
+                else:
+                    seleccion_actual = []
 
-        # Aplicar filtro
-        if seleccion_actual:
-            df_filtrado = df_filtrado[
-                df_filtrado[col].isin(seleccion_actual)
-            ]
+                # Mostrar los filtros en la barra lateral (solo lectura)
+                st.markdown(f"**{col.replace('_',' ').title()}:** {', '.join(seleccion_actual) if seleccion_actual else 'Todos'}")
 
-    # --------------------------------------------------
-    # RANGO DE FECHAS
-    # --------------------------------------------------
+            # Guardar solo los valores seleccionados en URL
+            if seleccion_actual:
+                st.query_params[col] = ",".join(seleccion_actual)  # 🔹 join para multi-selección
+            else:
+                if col in st.query_params:
+                    del st.query_params[col]
 
-    fecha_inicio_url = st.query_params.get("fecha_inicio")
-    fecha_fin_url = st.query_params.get("fecha_fin")
+            # Aplicar filtro
+            if seleccion_actual:
+                mascara &= indice.bitmap(col, seleccion_actual)
+                filtros_activos[col] = seleccion_actual
 
-    if fecha_inicio_url and fecha_fin_url and mes_seleccionado == "Todos":
-        try:
-            fecha_inicio = pd.to_datetime(fecha_inicio_url).date()
-            fecha_fin = pd.to_datetime(fecha_fin_url).date()
-            fechas_default = (fecha_inicio, fecha_fin)
-        except:
-            fechas_default = (min_date, max_date)
-    else:
-        fechas_default = (min_date, max_date)
+        # --------------------------------------------------
+        # RANGO DE FECHAS
+        # --------------------------------------------------
 
-    if not modo_lectura:
-        fechas = st.sidebar.date_input(
-            "Rango de fechas",
-            value=fechas_default,
-            min_value=min_date,
-            max_value=max_date
-        )
-    else:
         fecha_inicio_url = st.query_params.get("fecha_inicio")
         fecha_fin_url = st.query_params.get("fecha_fin")
 
-        if fecha_inicio_url and fecha_fin_url:
-            fechas = (
-                pd.to_datetime(fecha_inicio_url).date(),
-                pd.to_datetime(fecha_fin_url).date()
+        if fecha_inicio_url and fecha_fin_url and mes_seleccionado == "Todos":
+            try:
+                fecha_inicio = pd.to_datetime(fecha_inicio_url).date()
+                fecha_fin = pd.to_datetime(fecha_fin_url).date()
+                fechas_default = (fecha_inicio, fecha_fin)
+            except:
+                fechas_default = (min_date, max_date)
+        else:
+            fechas_default = (min_date, max_date)
+
+        if not modo_lectura:
+            fechas = st.date_input(
+                "Rango de fechas",
+                value=fechas_default,
+                min_value=min_date,
+                max_value=max_date
             )
         else:
-            fechas = fechas_default
+            fecha_inicio_url = st.query_params.get("fecha_inicio")
+            fecha_fin_url = st.query_params.get("fecha_fin")
+
+            if fecha_inicio_url and fecha_fin_url:
+                fechas = (
+                    pd.to_datetime(fecha_inicio_url).date(),
+                    pd.to_datetime(fecha_fin_url).date()
+                )
+            else:
+                fechas = fechas_default
 
 
-    if len(fechas) == 2:
+        if len(fechas) == 2:
 
-        guardar_parametro("fecha_inicio", str(fechas[0]))
-        guardar_parametro("fecha_fin", str(fechas[1]))
+            guardar_parametro("fecha_inicio", str(fechas[0]))
+            guardar_parametro("fecha_fin", str(fechas[1]))
+
+            # tramo [inicio, fin] ubicado con búsqueda binaria
+            mascara &= fechas_idx.mascara(fechas_idx.tramo(fechas[0], fechas[1]))
+
+        return (
+            (columnas_filtro, mes_seleccionado, filtros_activos, fechas),
+            (columnas_filtro, mes_seleccionado, filtros_activos, fechas, mascara)
+        )
+
+    por_lote = filtros_por_lote(df, modo_lectura)
+    columnas_filtro, mes_seleccionado, filtros_activos, fechas, mascara = panel_filtros(
+        dibujar_filtros, por_lote, df
+    )
+
+    # las filas se toman una vez, con los filtros aplicados (por lote, el
+    # borrador del panel no llega hasta aquí)
+    df_filtrado = indice_filtros(df).aplicar(df, mascara)
 
-        df_filtrado = df_filtrado[
-            (df_filtrado["fecha"] >= pd.to_datetime(fechas[0])) &
-            (df_filtrado["fecha"] <= pd.to_datetime(fechas[1]))
-        ]
     # --------------------------------------------------
     # COMPARACIONES
     # --------------------------------------------------
@@ -853,6 +815,90 @@ if os.path.exists(ruta_excel):
     else:
         modo = st.query_params.get("modo", "Sin comparación")
 
+    # Agregados, tabla y gráficos se comparten entre sesiones, etapa por
+    # etapa (ver utils.pipeline): cada etapa se recalcula solo si cambian
+    # sus entradas o las de una etapa anterior
+    pipeline = Pipeline(df, "individual")
+    pipeline.paso("filtros", hash_vista(vista_filtros(
+        columnas_filtro, filtros_activos, mes_seleccionado, fechas, modo
+    )))
+
+    # KPIs, tabla y gráfico se calculan sobre un cubo pre-agregado con
+    # los mismos filtros; si alguna columna no está en el cubo, sobre
+    # las filas de df_filtrado. "fecha" entra en la agrupación por día
+    # o cuando no hay columnas elegidas (ver TABLA DINÁMICA)
+    columnas_cubo = columnas_filtro + ["ingresoegreso"]
+    if modo == "Por día" or not columnas_filtro:
+        columnas_cubo.append("fecha")
+
+    df_agregado = pipeline.etapa("datos", columnas_cubo)
+    if df_agregado is None:
+        df_agregado = datos_agregables(
+            df,
+            df_filtrado,
+            filtros_activos,
+            columnas_cubo,
+            mes=mes_seleccionado if mes_seleccionado != "Todos" else None,
+            fechas=fechas if len(fechas) == 2 else None
+        )
+        # solo celdas del cubo: las filas crudas no se fijan en la cache
+        # compartida (las etapas siguientes guardan el agregado)
+        if df_agregado is not df_filtrado:
+            pipeline.guardar("datos", df_agregado)
+
+    # --------------------------------------------------
+    # COLUMNAS DE LA TABLA DINÁMICA
+    # --------------------------------------------------
+
+    columnas_grupo = columnas_filtro.copy()
+
+    # ------------------------------------------
+    # 🔹 AGREGAR MES SI:
+    # 1) Se seleccionó un mes específico
+    # 2) O el rango de fechas cubre más de un mes
+    # ------------------------------------------
+
+    fecha_inicio = pd.to_datetime(fechas[0])
+    fecha_fin = pd.to_datetime(fechas[1])
+
+    meses_en_rango = df_agregado["mes_nombre"].nunique()
+
+    if mes_seleccionado != "Todos" or meses_en_rango > 1:
+        if "mes_nombre" not in columnas_grupo:
+            columnas_grupo.append("mes_nombre")
+
+    # ------------------------------------------
+
+    if modo == "Por día":
+        columnas_grupo.append("fecha")
+
+    if modo == "Por mes":
+        columnas_grupo.append("anio_mes")
+
+    if not columnas_grupo:
+        columnas_grupo = ["fecha"]
+
+    columnas_groupby = columnas_grupo.copy()
+
+    if "ingresoegreso" not in columnas_groupby:
+        columnas_groupby.append("ingresoegreso")
+
+    # --------------------------------------------------
+    # AGREGACIÓN FUSIONADA
+    # --------------------------------------------------
+    # Una sola pasada agrupada por columnas_groupby (+ mes_num, que
+    # depende del mes): KPIs, tabla y gráfico salen de este resultado.
+    # El gráfico siempre agrupa por columnas de la tabla.
+
+    claves_agregado = columnas_groupby.copy()
+    if "mes_nombre" in claves_agregado and "mes_num" in df_agregado.columns:
+        claves_agregado.append("mes_num")
+
+    agregado = pipeline.etapa("agregado", claves_agregado)
+    if agregado is None:
+        agregado = agregar(df_agregado, claves_agregado)
+        pipeline.guardar("agregado", agregado)
+
     
     # --------------------------------------------------
     # INGRESOS / EGRESOS / SALDO
@@ -872,16 +918,13 @@ if os.path.exists(ruta_excel):
 
     st.markdown('</div>', unsafe_allow_html=True)
 
-    if "ingresoegreso" not in df_filtrado.columns:
+    if "ingresoegreso" not in df_agregado.columns:
         st.error("❌ No existe la columna INGRESO/EGRESO en el Excel")
     else:
-        total_ingresos = df_filtrado[
-            df_filtrado["ingresoegreso"].str.upper() == "INGRESO"
-        ]["total_general_s"].sum()
+        totales_ie = agregado.totales("ingresoegreso")
 
-        total_egresos = df_filtrado[
-            df_filtrado["ingresoegreso"].str.upper() == "EGRESO"
-        ]["total_general_s"].sum()
+        total_ingresos = totales_ie.get("INGRESO", 0.0)
+        total_egresos = totales_ie.get("EGRESO", 0.0)
 
         saldo = total_ingresos + total_egresos
 
@@ -922,47 +965,49 @@ if os.path.exists(ruta_excel):
     # --------------------------------------------------
     st.subheader("💼 Distribución de Ingresos y Egresos")
 
-    df_ie = pd.DataFrame({
-        "Tipo": ["Ingresos", "Egresos"],
-        "Monto": [total_ingresos, abs(total_egresos)]
-    })
-
-    fig_pie = px.pie(
-        df_ie,
-        names="Tipo",
-        values="Monto",
-        hole=0.5,
-        title="Ingresos vs Egresos",
-        color="Tipo",
-        color_discrete_map={
-            "Ingresos": "#5095B4",
-            "Egresos": "#BE2323"
-        }
-    )
-
-    # Hacer porcentajes más grandes y visibles
-    fig_pie.update_traces(
-        textinfo="percent",
-        textfont_size=30,          # 🔹 tamaño más grande
-        textposition="inside",     # dentro del gráfico
-        insidetextorientation="radial"
-    )
+    fig_pie = pipeline.etapa("fig_pie")
+    if fig_pie is None:
+        df_ie = pd.DataFrame({
+            "Tipo": ["Ingresos", "Egresos"],
+            "Monto": [total_ingresos, abs(total_egresos)]
+        })
+
+        fig_pie = px.pie(
+            df_ie,
+            names="Tipo",
+            values="Monto",
+            hole=0.5,
+            title="Ingresos vs Egresos",
+            color="Tipo",
+            color_discrete_map={
+                "Ingresos": "#5095B4",
+                "Egresos": "#BE2323"
+            }
+        )
 
-    fig_pie.update_layout(
-        uniformtext_minsize=15,
-        uniformtext_mode="hide"
-    )
-    fig_pie.update_layout(
-        annotations=[
-            dict(
-                text=f"<b>S/ {saldo:,.0f}</b><br>Saldo",
-                x=0.5, y=0.5,
-                font_size=15,
-                showarrow=False
-            )
-        ]
-    )
+        # Hacer porcentajes más grandes y visibles
+        fig_pie.update_traces(
+            textinfo="percent",
+            textfont_size=30,          # 🔹 tamaño más grande
+            textposition="inside",     # dentro del gráfico
+            insidetextorientation="radial"
+        )
 
+        fig_pie.update_layout(
+            uniformtext_minsize=15,
+            uniformtext_mode="hide"
+        )
+        fig_pie.update_layout(
+            annotations=[
+                dict(
+                    text=f"<b>S/ {saldo:,.0f}</b><br>Saldo",
+                    x=0.5, y=0.5,
+                    font_size=15,
+                    showarrow=False
+                )
+            ]
+        )
+        pipeline.guardar("fig_pie", fig_pie)
 
     st.plotly_chart(fig_pie, use_container_width=True)
 
@@ -972,730 +1017,469 @@ if os.path.exists(ruta_excel):
     st.markdown("## 📊 Resultado Financiero")
     st.caption("Análisis dinámico basado en filtros aplicados")
 
-    columnas_grupo = columnas_filtro.copy()
-
-    # ------------------------------------------
-    # 🔹 AGREGAR MES SI:
-    # 1) Se seleccionó un mes específico
-    # 2) O el rango de fechas cubre más de un mes
-    # ------------------------------------------
-
-    fecha_inicio = pd.to_datetime(fechas[0])
-    fecha_fin = pd.to_datetime(fechas[1])
-
-    meses_en_rango = df_filtrado["mes_nombre"].nunique()
-
-    if mes_seleccionado != "Todos" or meses_en_rango > 1:
-        if "mes_nombre" not in columnas_grupo:
-            columnas_grupo.append("mes_nombre")
-
-    # ------------------------------------------
-
-    if modo == "Por día":
-        columnas_grupo.append("fecha")
-
-    if modo == "Por mes":
-        columnas_grupo.append("anio_mes")
-
-    if not columnas_grupo:
-        columnas_grupo = ["fecha"]
-
     # --------------------------------------------------
     # TABLA DINÁMICA ORDENADA + EGRESOS EN ROJO
     # --------------------------------------------------
 
-    columnas_groupby = columnas_grupo.copy()
-
-    if "ingresoegreso" not in columnas_groupby:
-        columnas_groupby.append("ingresoegreso")
-
-    tabla = (
-        df_filtrado
-        .groupby(columnas_groupby, as_index=False)["total_general_s"]
-        .sum()
-    )
-    # Formato especial para deuda_pendiente
-    if "deuda_pendiente" in tabla.columns:
-        tabla["deuda_pendiente"] = (
-            pd.to_numeric(tabla["deuda_pendiente"], errors="coerce")
-            .fillna(0)
-            .map(lambda x: f"{x:,.2f}")
-        )
-
-    # Ordenar por costo__gasto si existe
-    if "costo__gasto" in tabla.columns:
-        tabla = tabla.sort_values(
-            by=["costo__gasto", "total_general_s"],
-            ascending=[True, False]
-        )
-    else:
-        tabla = tabla.sort_values("total_general_s", ascending=False)
-
-    # Formato moneda
-    tabla["total_general_s_fmt"] = tabla["total_general_s"].map(
-        lambda x: f"S/ {x:,.2f}"
-    )
+    tabla = pipeline.etapa("tabla", columnas_groupby)
+    if tabla is None:
+        tabla = agregado.por(columnas_groupby)
+        # Formato especial para deuda_pendiente
+        if "deuda_pendiente" in tabla.columns:
+            tabla["deuda_pendiente"] = (
+                pd.to_numeric(tabla["deuda_pendiente"], errors="coerce")
+                .fillna(0)
+                .map(lambda x: f"{x:,.2f}")
+            )
 
-    # --- Estilo condicional ---
-    def pintar_egresos(row):
-        if row["ingresoegreso"].upper() == "EGRESO":
-            return ["color: #BE2323"] * len(row)
-        return [""] * len(row)
-
-    tabla_estilizada = (
-        tabla
-        .drop(columns=["total_general_s"])
-        .rename(columns={"total_general_s_fmt": "TOTAL"})
-        .style
-        .apply(pintar_egresos, axis=1)
-        .set_properties(subset=["TOTAL"], **{"font-weight": "bold"})
+        # Ordenar por costo__gasto si existe
+        if "costo__gasto" in tabla.columns:
+            tabla = tabla.sort_values(
+                by=["costo__gasto", "total_general_s"],
+                ascending=[True, False]
+            )
+        else:
+            tabla = tabla.sort_values("total_general_s", ascending=False)
+
+        pipeline.guardar("tabla", tabla)
+
+    # TOTAL numérico al final; EGRESO en rojo (ver utils.tablas)
+    mostrar_tabla(
+        tabla.drop(columns=["total_general_s"]).assign(TOTAL=tabla["total_general_s"]),
+        moneda=["TOTAL"],
+        # ingresoegreso ya viene en mayúsculas (codificar_categorias)
+        filas_rojas=tabla["ingresoegreso"].eq("EGRESO"),
+        negrita=["TOTAL"],
+        use_container_width=True
     )
 
-    st.dataframe(tabla_estilizada, use_container_width=True)
-
         # --------------------------------------------------
         # DETALLE
         # --------------------------------------------------
-    with st.expander("🔍 Ver detalle completo"):
-            st.dataframe(df_filtrado, use_container_width=True)
+    # solo se envía al abrirlo, de a una página (ver utils.detalle)
+    detalle_paginado(df_filtrado, pipeline.clave("filtros"))
 
     # --------------------------------------------------
     # 📈 Visualización de Gráfico por columna seleccionada
     # --------------------------------------------------
-    st.subheader("📈 Visualización de Gráfico")
+    # El gráfico, el link y las exportaciones forman un fragmento
+    # (st.fragment): cambiar la agrupación vuelve a ejecutar solo esta
+    # sección, no los filtros, KPIs ni la tabla. Las exportaciones son un
+    # fragmento dentro del gráfico: dependen de la figura y se vuelven a
+    # armar con ella, pero preparar una descarga solo ejecuta su panel.
 
-    # Colores profesionales financieros
-    color_financiero = {
-        "INGRESO": "#16a34a",
-        "EGRESO": "#dc2626"
-    }
-    # Paleta ejecutiva para gráficos
-    paleta_ejecutiva = [
-        "#5B9BD5",  # azul corporativo 5B9BD5
-        "#A5A5A5",  # azul claro
-        "#70AD47",  # violeta elegante
-        "#FFC000",  # teal
-        "#ED7D31",  # ámbar
-        "#4472C4",  # gris corporativo
-        "#9E480E",  # púrpura
-        "#636363", 
-        "#997300",
-        "#255E91",
-        "#43682B",
-        "#722E2E", # verde ejecutivo
-    ]
-    # --------------------------------------------------
-    # AGRUPACIÓN PARA GRÁFICO (modo lectura o edición)
-    # --------------------------------------------------
+    if not modo_lectura:
+        st.sidebar.divider()
 
-    columnas_posibles = [c for c in tabla.columns if c not in ["total_general_s", "total_general_s_fmt"]]
+    @st.fragment
+    def seccion_grafico():
+        st.subheader("📈 Visualización de Gráfico")
 
-    # Leer agrupación desde URL si es lectura
-    if modo_lectura:
-        param_agrupacion = st.query_params.get("agrupacion", ["clasificacion_1"])
-        if isinstance(param_agrupacion, str):
-            param_agrupacion = param_agrupacion.split(",")
-        ejes_x = [c for c in param_agrupacion if c in columnas_posibles][:2]  # máximo 2 columnas
-        if not ejes_x:
-            ejes_x = ["clasificacion_1"] if "clasificacion_1" in columnas_posibles else [columnas_posibles[0]]
-    else:
-        ejes_x = st.multiselect(
-            "Agrupar gráfico por (máx. 2 columnas):",
-            options=columnas_posibles,
-            default=st.session_state.get("agrupacion_multi", ["clasificacion_1"]),
-            max_selections=2,
-            key="agrupacion_multi",
-            disabled=modo_lectura
-        )
-        st.query_params["agrupacion"] = ",".join(ejes_x)
+        # Colores profesionales financieros
+        color_financiero = {
+            "INGRESO": "#16a34a",
+            "EGRESO": "#dc2626"
+        }
+        # Paleta ejecutiva para gráficos
+        paleta_ejecutiva = [
+            "#5B9BD5",  # azul corporativo 5B9BD5
+            "#A5A5A5",  # azul claro
+            "#70AD47",  # violeta elegante
+            "#FFC000",  # teal
+            "#ED7D31",  # ámbar
+            "#4472C4",  # gris corporativo
+            "#9E480E",  # púrpura
+            "#636363", 
+            "#997300",
+            "#255E91",
+            "#43682B",
+            "#722E2E", # verde ejecutivo
+        ]
+        # --------------------------------------------------
+        # AGRUPACIÓN PARA GRÁFICO (modo lectura o edición)
+        # --------------------------------------------------
 
-    # --------------------------------------------------
-    # Preparación de datos para gráfico
-    # --------------------------------------------------
+        columnas_posibles = [c for c in tabla.columns if c not in ["total_general_s"]]
 
-    df_filtrado["total_general_s"] = pd.to_numeric(df_filtrado["total_general_s"], errors="coerce").fillna(0)
+        # Leer agrupación desde URL si es lectura
+        if modo_lectura:
+            param_agrupacion = st.query_params.get("agrupacion", ["clasificacion_1"])
+            if isinstance(param_agrupacion, str):
+                param_agrupacion = param_agrupacion.split(",")
+            ejes_x = [c for c in param_agrupacion if c in columnas_posibles][:2]  # máximo 2 columnas
+            if not ejes_x:
+                ejes_x = ["clasificacion_1"] if "clasificacion_1" in columnas_posibles else [columnas_posibles[0]]
+        else:
+            ejes_x = st.multiselect(
+                "Agrupar gráfico por (máx. 2 columnas):",
+                options=columnas_posibles,
+                default=st.session_state.get("agrupacion_multi", ["clasificacion_1"]),
+                max_selections=2,
+                key="agrupacion_multi",
+                disabled=modo_lectura
+            )
+            st.query_params["agrupacion"] = ",".join(ejes_x)
 
-    graf_pivot = (
-        df_filtrado
-        .copy()
-        .fillna("Sin categoría")
-        .groupby(ejes_x + ["ingresoegreso"], as_index=False)["total_general_s"]
-        .sum()
-    )
+        # --------------------------------------------------
+        # Preparación de datos para gráfico
+        # --------------------------------------------------
 
-    if graf_pivot.empty:
-        st.info("No hay datos para mostrar con los filtros actuales.")
-        st.stop()
-
-    # Limitar categorías Top + Otros solo si es 1 columna
-    MAX_CATEGORIAS = 15
-    if len(ejes_x) == 1:
-        col = ejes_x[0]
-        totales = graf_pivot.groupby(col)["total_general_s"].sum().sort_values(ascending=False)
-        if len(totales) > MAX_CATEGORIAS:
-            top = totales.head(MAX_CATEGORIAS).index
-            graf_pivot[col] = graf_pivot[col].apply(lambda x: x if x in top else "Otros")
-            graf_pivot = graf_pivot.groupby([col, "ingresoegreso"], as_index=False)["total_general_s"].sum()
-   # --------------------------------------------------
-    # Ordenar categorías correctamente para Plotly
-    # --------------------------------------------------
+        # única etapa que depende de "Agrupar gráfico por": al cambiarlo se
+        # reutilizan los datos filtrados, el agregado y la tabla
+        graf_pivot = pipeline.etapa("graf_pivot", ejes_x, desde="tabla")
+        if graf_pivot is None:
+            # rollup del agregado, con los vacíos como "Sin categoría"
+            graf_pivot = agregado.por(ejes_x + ["ingresoegreso"], rellenar="Sin categoría")
+
+            # Limitar categorías Top + Otros solo si es 1 columna
+            MAX_CATEGORIAS = 15
+            if len(ejes_x) == 1 and not graf_pivot.empty:
+                col = ejes_x[0]
+                totales = graf_pivot.groupby(col, observed=True)["total_general_s"].sum().sort_values(ascending=False)
+                if len(totales) > MAX_CATEGORIAS:
+                    top = totales.head(MAX_CATEGORIAS).index
+                    graf_pivot[col] = graf_pivot[col].astype(object).where(graf_pivot[col].isin(top), "Otros")
+                    graf_pivot = graf_pivot.groupby([col, "ingresoegreso"], as_index=False, observed=True)["total_general_s"].sum()
+            pipeline.guardar("graf_pivot", graf_pivot)
+
+        if graf_pivot.empty:
+            st.info("No hay datos para mostrar con los filtros actuales.")
+            st.stop()
+       # --------------------------------------------------
+        # Ordenar categorías correctamente para Plotly
+        # --------------------------------------------------
 
-    category_orders = {}
+        fig_bar = pipeline.etapa("fig_bar")
+        if fig_bar is None:
+            category_orders = {}
 
-    for col in ejes_x:
-        if col == "mes_nombre":
-            # Mantener orden de Enero a Diciembre
-            category_orders[col] = [
-                "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-                "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
-            ]
-        else:
-            # Orden descendente por total_general_s
-            orden = (
-                graf_pivot.groupby(col)["total_general_s"]
-                .sum()
-                .sort_values(ascending=False)
-                .index
-                .tolist()
-            )
-            category_orders[col] = orden
+            for col in ejes_x:
+                if col == "mes_nombre":
+                    # Mantener orden de Enero a Diciembre
+                    category_orders[col] = [
+                        "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+                        "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+                    ]
+                else:
+                    # Orden descendente por total_general_s
+                    orden = (
+                        graf_pivot.groupby(col, observed=True)["total_general_s"]
+                        .sum()
+                        .sort_values(ascending=False)
+                        .index
+                        .tolist()
+                    )
+                    category_orders[col] = orden
 
     
 
-    # --------------------------------------------------
-    # Cálculo profesional de barras por grupo
-    # --------------------------------------------------
+            # --------------------------------------------------
+            # Cálculo profesional de barras por grupo
+            # --------------------------------------------------
 
-    if len(ejes_x) == 1:
-        barras_por_grupo = graf_pivot["ingresoegreso"].nunique()
-    else:
-        barras_por_grupo = graf_pivot[ejes_x[1]].nunique()
+            if len(ejes_x) == 1:
+                barras_por_grupo = graf_pivot["ingresoegreso"].nunique()
+            else:
+                barras_por_grupo = graf_pivot[ejes_x[1]].nunique()
 
-    # --------------------------------------------------
-    # Cálculo de barras
-    # --------------------------------------------------
+            # --------------------------------------------------
+            # Cálculo de barras
+            # --------------------------------------------------
 
-    cantidad_barras = graf_pivot[ejes_x[0]].nunique()
+            cantidad_barras = graf_pivot[ejes_x[0]].nunique()
 
-    if cantidad_barras <= 10:
-        text_pos = "outside"
-        text_angle = -90
-        text_size = 13
+            if cantidad_barras <= 10:
+                text_pos = "outside"
+                text_angle = -90
+                text_size = 13
 
-    elif cantidad_barras <= 18:
-        text_pos = "outside"
-        text_angle = -90
-        text_size = 11
+            elif cantidad_barras <= 18:
+                text_pos = "outside"
+                text_angle = -90
+                text_size = 11
 
-    elif cantidad_barras <= 28:
-        text_pos = "inside"
-        text_angle = 0
-        text_size = 10
+            elif cantidad_barras <= 28:
+                text_pos = "inside"
+                text_angle = 0
+                text_size = 10
 
-    else:
-        text_pos = "outside"
-        text_angle = -90
-        text_size = 5
-    # ancho máximo permitido por plotly es 1
-    #ancho_barra = min(0.9 / barras_por_grupo, 0.35)
-    barras_total = cantidad_barras*barras_por_grupo
-    ancho_barra = min(0.9 / barras_total, 0.35)
-    # --------------------------------------------------
-    # Construcción del gráfico con category_orders
-    # --------------------------------------------------
-    if len(ejes_x) == 1:
-        columna_x = ejes_x[0]
-
-        fig_bar = px.bar(
-            graf_pivot,
-            x=columna_x,
-            y="total_general_s",
-            color="ingresoegreso",
-            color_discrete_map=color_financiero,
-            text=graf_pivot["total_general_s"].map(lambda x: f"S/ {x:,.0f}"),
-            labels={"total_general_s": "Total S/"},
-            barmode="group",
-            title="Total por " + columna_x.replace("_", " ").title(),
-            hover_data={columna_x: True, "ingresoegreso": True, "total_general_s": ":,.2f"},
-            category_orders={columna_x: category_orders[columna_x]}  # 🔹 aplicar orden
-        )
+            else:
+                text_pos = "outside"
+                text_angle = -90
+                text_size = 5
+            # ancho máximo permitido por plotly es 1
+            #ancho_barra = min(0.9 / barras_por_grupo, 0.35)
+            barras_total = cantidad_barras*barras_por_grupo
+            ancho_barra = min(0.9 / barras_total, 0.35)
+            # --------------------------------------------------
+            # Construcción del gráfico con category_orders
+            # --------------------------------------------------
+            if len(ejes_x) == 1:
+                columna_x = ejes_x[0]
+
+                fig_bar = px.bar(
+                    graf_pivot,
+                    x=columna_x,
+                    y="total_general_s",
+                    color="ingresoegreso",
+                    color_discrete_map=color_financiero,
+                    text=graf_pivot["total_general_s"].map(lambda x: f"S/ {x:,.0f}"),
+                    labels={"total_general_s": "Total S/"},
+                    barmode="group",
+                    title="Total por " + columna_x.replace("_", " ").title(),
+                    hover_data={columna_x: True, "ingresoegreso": True, "total_general_s": ":,.2f"},
+                    category_orders={columna_x: category_orders[columna_x]}  # 🔹 aplicar orden
+                )
 
-        for trace in fig_bar.data:
-            trace.textfont = dict(color=trace.marker.color)
-            trace.texttemplate = "<b>%{text}</b>"
-    elif len(ejes_x) == 2:
-        col1, col2 = ejes_x
-
-        fig_bar = px.bar(
-            graf_pivot,
-            x=col1,
-            y="total_general_s",
-            color=col2,
-            color_discrete_sequence=paleta_ejecutiva,
-            text=graf_pivot["total_general_s"].map(lambda x: f"S/ {x:,.0f}"),
-            labels={"total_general_s": "Total S/"},
-            barmode="group",
-            title="Total por " + " + ".join(ejes_x).replace("_", " ").title(),
-            hover_data={col1: True, col2: True, "total_general_s": ":,.2f"},
-            category_orders={
-                col1: category_orders[col1],
-                col2: category_orders[col2]
-            }  # 🔹 aplicar orden a ambas columnas
-        )
-        for trace in fig_bar.data:
-            trace.textfont = dict(color=trace.marker.color)
-            trace.texttemplate = "<b>%{text}</b>"
+                for trace in fig_bar.data:
+                    trace.textfont = dict(color=trace.marker.color)
+                    trace.texttemplate = "<b>%{text}</b>"
+            elif len(ejes_x) == 2:
+                col1, col2 = ejes_x
+
+                fig_bar = px.bar(
+                    graf_pivot,
+                    x=col1,
+                    y="total_general_s",
+                    color=col2,
+                    color_discrete_sequence=paleta_ejecutiva,
+                    text=graf_pivot["total_general_s"].map(lambda x: f"S/ {x:,.0f}"),
+                    labels={"total_general_s": "Total S/"},
+                    barmode="group",
+                    title="Total por " + " + ".join(ejes_x).replace("_", " ").title(),
+                    hover_data={col1: True, col2: True, "total_general_s": ":,.2f"},
+                    category_orders={
+                        col1: category_orders[col1],
+                        col2: category_orders[col2]
+                    }  # 🔹 aplicar orden a ambas columnas
+                )
+                for trace in fig_bar.data:
+                    trace.textfont = dict(color=trace.marker.color)
+                    trace.texttemplate = "<b>%{text}</b>"
 
-    else:
-        st.warning("Máximo 2 columnas permitidas.")
-        st.stop()
+            else:
+                st.warning("Máximo 2 columnas permitidas.")
+                st.stop()
 
-    # --------------------------------------------------
-    # Ajuste automático de textos para evitar colisiones
-    # --------------------------------------------------
+            # --------------------------------------------------
+            # Ajuste automático de textos para evitar colisiones
+            # --------------------------------------------------
     
     
-    fig_bar.update_traces(
-        #width=ancho_barra,
-        textposition=text_pos,
-        textangle=text_angle,
-        textfont=dict(size=text_size),
-        cliponaxis=False
-    )
+            fig_bar.update_traces(
+                #width=ancho_barra,
+                textposition=text_pos,
+                textangle=text_angle,
+                textfont=dict(size=text_size),
+                cliponaxis=False
+            )
     
-    fig_bar.update_traces(
-        hovertemplate="<b>%{x}</b><br>Total: S/ %{y:,.2f}<extra></extra>"
-    )
-    # --------------------------------------------------
-    # ESCALA INTELIGENTE DEL EJE Y
-    # --------------------------------------------------
-
-    max_valor = graf_pivot["total_general_s"].max()
-    min_valor = graf_pivot["total_general_s"].min()
-
-    # Detectar diferencia entre valores
-    if min_valor == 0:
-        ratio = max_valor
-    else:
-        ratio = max_valor / min_valor
-
-    # Espacio superior dinámico
-    if ratio > 1000:
-        espacio_superior = 1.9
-    elif ratio > 200:
-        espacio_superior = 1.7
-    elif ratio > 50:
-        espacio_superior = 1.55
-    elif ratio > 10:
-        espacio_superior = 1.45
-    else:
-        espacio_superior = 1.35
-
-    fig_bar.update_yaxes(range=[0, max_valor * espacio_superior])
-    fig_bar.update_yaxes(automargin=True)
-    # --------------------------------------------------
-    # Ajustes dinámicos
-    # --------------------------------------------------
-
-    num_conceptos = graf_pivot[ejes_x[-1]].nunique()
-
-    margen_superior = 170 + (num_conceptos * 6)
-
-    if margen_superior > 260:
-        margen_superior = 260
-
-    altura_grafico = 500 + (cantidad_barras * 35)
-
-    if altura_grafico > 1100:
-        altura_grafico = 1100
-    # --------------------------------------------------
-    # ESPACIO DINÁMICO ENTRE BARRAS
-    # --------------------------------------------------
-
-    if cantidad_barras <= 4:
-        gap_barras = 0.55
-    elif cantidad_barras <= 8:
-        gap_barras = 0.45
-    elif cantidad_barras <= 15:
-        gap_barras = 0.35
-    else:
-        gap_barras = 0.25
-
-    fig_bar.update_layout(
-        xaxis_title=None,
-        yaxis_title="Total S/",
-        height=altura_grafico,
-
-        title=dict(
-            text="Total por " + " + ".join(ejes_x).replace("_", " ").title(),
-            #y=0.95,           # 🔹 bajar un poco el título para dejar espacio a la leyenda arriba
-            x=0,
-            y=1,
-            xanchor="left",
-            yanchor="top"
-        ),
-
-        legend=dict(
-            title="Conceptos",
-            orientation="h",
-            yanchor="bottom",  # el punto y= se refiere al fondo de la leyenda
-            y=1.30,            # 🔹 colocar la leyenda por encima del título
-            xanchor="center",
-            x=0.5
-        ),
-
-        margin=dict(
-            t=margen_superior + 40,  # 🔹 aumentar margen superior si es necesario
-            b=80,
-            l=60,
-            r=40
-        ),
-        barmode="group",
-        bargap=0.25,
-        bargroupgap=0.05,
-        uniformtext_minsize=12,
-        uniformtext_mode="show",
-        plot_bgcolor="white",
-        paper_bgcolor="white"
-    )
-    #st.divider()
-    # Grid suave
-    fig_bar.update_yaxes(
-        showgrid=True,
-        gridcolor="rgba(200,200,200,0.25)"
-    )
-
-    # Formato monetario
-    fig_bar.update_yaxes(
-        tickprefix="S/ ",
-        separatethousands=True
-    )
+            fig_bar.update_traces(
+                hovertemplate="<b>%{x}</b><br>Total: S/ %{y:,.2f}<extra></extra>"
+            )
+            # --------------------------------------------------
+            # ESCALA INTELIGENTE DEL EJE Y
+            # --------------------------------------------------
 
-    fig_bar.update_xaxes(tickangle=-45)
+            max_valor = graf_pivot["total_general_s"].max()
+            min_valor = graf_pivot["total_general_s"].min()
 
-    st.plotly_chart(fig_bar, use_container_width=True)
+            # Detectar diferencia entre valores
+            if min_valor == 0:
+                ratio = max_valor
+            else:
+                ratio = max_valor / min_valor
+
+            # Espacio superior dinámico
+            if ratio > 1000:
+                espacio_superior = 1.9
+            elif ratio > 200:
+                espacio_superior = 1.7
+            elif ratio > 50:
+                espacio_superior = 1.55
+            elif ratio > 10:
+                espacio_superior = 1.45
+            else:
+                espacio_superior = 1.35
 
-    #Exportacion
+            fig_bar.update_yaxes(range=[0, max_valor * espacio_superior])
+            fig_bar.update_yaxes(automargin=True)
+            # --------------------------------------------------
+            # Ajustes dinámicos
+            # --------------------------------------------------
 
-    def exportar_dashboard(tabla, total_ingresos, total_egresos, saldo, fig_pie, fig_bar):
-        zip_buffer = BytesIO()
+            num_conceptos = graf_pivot[ejes_x[-1]].nunique()
 
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+            margen_superior = 170 + (num_conceptos * 6)
 
-            # -----------------------------
-            # Excel
-            # -----------------------------
-            excel_buffer = BytesIO()
-
-            with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-                # Resumen
-                df_resumen = pd.DataFrame({
-                    "Concepto": ["Total Ingresos", "Total Egresos", "Saldo"],
-                    "Monto": [
-                        f"S/ {total_ingresos:,.2f}",
-                        f"S/ {total_egresos:,.2f}",
-                        f"S/ {saldo:,.2f}"
-                    ]
-                })
+            if margen_superior > 260:
+                margen_superior = 260
 
-                df_resumen.to_excel(writer, sheet_name="Resumen", index=False)
+            altura_grafico = 500 + (cantidad_barras * 35)
 
-                # Resultado filtrado
-                tabla_export = tabla.copy()
-                tabla_export["total_general_s"] = tabla_export["total_general_s"].map(
-                    lambda x: f"S/ {x:,.2f}"
-                )
+            if altura_grafico > 1100:
+                altura_grafico = 1100
+            # --------------------------------------------------
+            # ESPACIO DINÁMICO ENTRE BARRAS
+            # --------------------------------------------------
 
-                tabla_export.to_excel(
-                    writer,
-                    sheet_name="Resultado_Filtrado",
-                    index=False
-                )
-
-            excel_buffer.seek(0)
-            zipf.writestr("control_caja_proyectado.xlsx", excel_buffer.read())
-
-            # -----------------------------
-            # Gráficos
-            # -----------------------------
-            zipf.writestr(
-                "grafico_ingresos_egresos.png",
-                fig_pie.to_image(format="png", engine="kaleido", scale=2)
+            if cantidad_barras <= 4:
+                gap_barras = 0.55
+            elif cantidad_barras <= 8:
+                gap_barras = 0.45
+            elif cantidad_barras <= 15:
+                gap_barras = 0.35
+            else:
+                gap_barras = 0.25
+
+            fig_bar.update_layout(
+                xaxis_title=None,
+                yaxis_title="Total S/",
+                height=altura_grafico,
+
+                title=dict(
+                    text="Total por " + " + ".join(ejes_x).replace("_", " ").title(),
+                    #y=0.95,           # 🔹 bajar un poco el título para dejar espacio a la leyenda arriba
+                    x=0,
+                    y=1,
+                    xanchor="left",
+                    yanchor="top"
+                ),
+
+                legend=dict(
+                    title="Conceptos",
+                    orientation="h",
+                    yanchor="bottom",  # el punto y= se refiere al fondo de la leyenda
+                    y=1.30,            # 🔹 colocar la leyenda por encima del título
+                    xanchor="center",
+                    x=0.5
+                ),
+
+                margin=dict(
+                    t=margen_superior + 40,  # 🔹 aumentar margen superior si es necesario
+                    b=80,
+                    l=60,
+                    r=40
+                ),
+                barmode="group",
+                bargap=0.25,
+                bargroupgap=0.05,
+                uniformtext_minsize=12,
+                uniformtext_mode="show",
+                plot_bgcolor="white",
+                paper_bgcolor="white"
             )
-
-            zipf.writestr(
-                "grafico_resultados.png",
-                fig_bar.to_image(format="png", engine="kaleido",scale=2)
+            #st.divider()
+            # Grid suave
+            fig_bar.update_yaxes(
+                showgrid=True,
+                gridcolor="rgba(200,200,200,0.25)"
             )
 
-        zip_buffer.seek(0)
-        return zip_buffer
+            # Formato monetario
+            fig_bar.update_yaxes(
+                tickprefix="S/ ",
+                separatethousands=True
+            )
 
-        #boton
+            fig_bar.update_xaxes(tickangle=-45)
+            pipeline.guardar("fig_bar", fig_bar)
 
-    st.divider()
-    # --------------------------------------------------
-    # LINK COMPARTIBLE
-    # --------------------------------------------------
+        st.plotly_chart(fig_bar, use_container_width=True)
 
-    if not modo_lectura:
+        st.divider()
+        # --------------------------------------------------
+        # LINK COMPARTIBLE
+        # --------------------------------------------------
 
-        st.sidebar.divider()
+        if not modo_lectura:
 
-        filtros_compartir = {}
+            filtros_compartir = {}
 
-        for k, v in st.query_params.items():
-            if isinstance(v, list):
-                filtros_compartir[k] = v
-            else:
-                if "," in str(v):
-                    filtros_compartir[k] = str(v).split(",")
-                else:
+            for k, v in st.query_params.items():
+                if isinstance(v, list):
                     filtros_compartir[k] = v
+                else:
+                    if "," in str(v):
+                        filtros_compartir[k] = str(v).split(",")
+                    else:
+                        filtros_compartir[k] = v
 
 
-        # generar id de vista
-        view_id = guardar_vista(filtros_compartir)
-
-        components.html(f"""
-        <div style="margin-top:10px">
-
-        <button onclick="copyUrl()" style="
-        background:#2E8B57;
-        color:white;
-        border:none;
-        padding:10px 16px;
-        border-radius:8px;
-        cursor:pointer;
-        font-size:14px;
-        width:100%;
-        ">
-        🔗 Generar y copiar URL corta
-        </button>
-
-        </div>
-
-        <script>
-
-        function copyUrl() {{
-
-        const base = window.parent.location.origin + window.parent.location.pathname;
-        const url = base + "?v={view_id}";
-
-        navigator.clipboard.writeText(url).then(function() {{
-            alert("✅ URL copiada:\\n" + url);
-        }});
-
-        }}
+            # el id se genera (y la vista se guarda) solo al pedir la URL
+            boton_url_corta(filtros_compartir)
 
-        </script>
-        """, height=80)
+        seccion_exportaciones(fig_bar)
 
-    st.divider()
-    st.subheader("📤 Exportar Excel + Gráficos")
-
-    zip_file = exportar_dashboard(
-        tabla=tabla,
-        total_ingresos=total_ingresos,
-        total_egresos=total_egresos,
-        saldo=saldo,
-        fig_pie=fig_pie,
-        fig_bar=fig_bar
-    )
+    @st.fragment
+    def seccion_exportaciones(fig_bar):
+        st.divider()
+        st.subheader("📤 Exportar Excel + Gráficos")
 
-    st.download_button(
-        label="📦 Descargar Excel + Gráficos",
-        data=zip_file,
-        file_name="Control_Caja_Excel_Proyectado.zip",
-        mime="application/zip"
-    )
+        # kaleido se configura arriba: el worker usa los mismos parámetros
+        imagen_exportacion = parametros_imagen(scale=2)
 
-    #Generacion pdf
-    def exportar_pdf_ejecutivo(
-        total_ingresos,
-        total_egresos,
-        saldo,
-        tabla_resumen,
-        fig_pie,
-        fig_bar,
-        ultima_fecha,
-        fecha_inicio,
-        fecha_fin
-    ):
-        buffer = BytesIO()
-
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=2*cm,
-            leftMargin=2*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm
+        # El ZIP se arma en un proceso de exportación y queda en disco por vista;
+        # la vista se identifica por la clave de la última etapa (sin volver
+        # a hashear tabla y figuras en cada rerun)
+        clave_zip = clave_vista(
+            "zip", "control_caja_proyectado.xlsx",
+            pipeline.identidad(tabla, total_ingresos, total_egresos, saldo, fig_pie, fig_bar),
+            imagen_exportacion
         )
 
-        styles = getSampleStyleSheet()
-        story = []
-
-    # -------------------------------
-    # TÍTULO DEL PDF
-    # -------------------------------
-        story.append(Paragraph("<b>REPORTE EJECUTIVO – CONTROL DE CAJA</b>", styles["Title"]))
-        story.append(Spacer(1, 12))
-
-        fecha_generacion = datetime.now().strftime("%d/%m/%Y %H:%M")
-
-        fecha_inicio_fmt = pd.to_datetime(fecha_inicio).strftime("%d/%m/%Y")
-        fecha_fin_fmt = pd.to_datetime(fecha_fin).strftime("%d/%m/%Y")
-
-        story.append(
-            Paragraph(
-                f"<b>Fecha de generación:</b> {fecha_generacion}",
-                styles["Normal"]
-            )
+        boton_exportacion(
+            "📦 Descargar Excel + Gráficos",
+            "Control_Caja_Excel_Proyectado.zip",
+            "application/zip",
+            clave_zip,
+            exportar_dashboard,
+            tabla=tabla,
+            total_ingresos=total_ingresos,
+            total_egresos=total_egresos,
+            saldo=saldo,
+            fig_pie=fig_pie,
+            fig_bar=fig_bar,
+            nombre_excel="control_caja_proyectado.xlsx",
+            imagen=imagen_exportacion
         )
 
-        story.append(Spacer(1, 6))
-
-        story.append(
-            Paragraph(
-                f"<b>Rango de Análisis:</b> {fecha_inicio_fmt} al {fecha_fin_fmt}",
-                styles["Normal"]
-            )
-        )
-        story.append(Spacer(1, 12))
-        # -------------------------------
-        # KPIs
-        # -------------------------------
-        kpi_data = [
-            ["Total Ingresos", f"S/ {total_ingresos:,.2f}"],
-            ["Total Egresos", f"S/ {abs(total_egresos):,.2f}"],
-            ["Saldo", f"S/ {saldo:,.2f}"]
-        ]
+        st.subheader("📤 Exportar PDF")
 
-        tabla_kpi = Table(kpi_data, colWidths=[7*cm, 6*cm])
-        tabla_kpi.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
-            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
-            ("FONT", (0,0), (-1,-1), "Helvetica"),
-            ("ALIGN", (1,0), (-1,-1), "RIGHT"),
-        ]))
-
-        story.append(tabla_kpi)
-        story.append(Spacer(1, 16))
-
-        # -------------------------------
-        # EXPORTAR GRÁFICOS A IMAGEN
-        # -------------------------------
-        pie_img = BytesIO(
-        fig_pie.to_image(format="png", engine="kaleido", scale=2)
+        # TOTAL numérico: el PDF lo formatea y calcula subtotales por página
+        tabla_pdf = (
+            tabla
+            .drop(columns=["total_general_s"])
+            .assign(TOTAL=tabla["total_general_s"])
         )
+        ultima_fecha = df_filtrado["fecha"].max()
 
-        bar_img = BytesIO(
-        fig_bar.to_image(format="png", engine="kaleido", scale=2)
+        # El PDF (ReportLab + gráficos) se arma en un proceso de exportación
+        clave_pdf = clave_vista(
+            "pdf",
+            pipeline.identidad(tabla_pdf, total_ingresos, total_egresos, saldo, fig_pie, fig_bar),
+            ultima_fecha, fechas[0], fechas[1], imagen_exportacion
         )
 
-        story.append(Paragraph("<b>Distribución de Ingresos y Egresos</b>", styles["Heading2"]))
-        story.append(Spacer(1, 8))
-        story.append(Image(pie_img, width=14*cm, height=9*cm))
-        story.append(Spacer(1, 16))
-
-        story.append(Paragraph("<b>Resultados según filtros</b>", styles["Heading2"]))
-        story.append(Spacer(1, 8))
-        story.append(Image(bar_img, width=15*cm, height=9*cm))
-        story.append(Spacer(1, 16))
-
-    # -------------------------------
-    # TABLA RESUMEN
-    # -------------------------------
-        story.append(Paragraph("<b>Resumen de Resultados</b>", styles["Heading2"]))
-        story.append(Spacer(1, 8))
-
-        # Estilo para celdas (wrap automático)
-        cell_style = ParagraphStyle(
-            name="CellStyle",
-            fontSize=9,
-            leading=11
+        boton_exportacion(
+            "📄 Descargar PDF",
+            "reporte_control_caja_proyectado.pdf",
+            "application/pdf",
+            clave_pdf,
+            exportar_pdf_ejecutivo,
+            total_ingresos=total_ingresos,
+            total_egresos=total_egresos,
+            saldo=saldo,
+            tabla_resumen=tabla_pdf,
+            fig_pie=fig_pie,
+            fig_bar=fig_bar,
+            ultima_fecha=ultima_fecha,
+            fecha_inicio=fechas[0],
+            fecha_fin=fechas[1],
+            imagen=imagen_exportacion
         )
 
-    # Convertir dataframe a tabla con Paragraph (wrap)
-    #tabla_resumen = tabla_resumen.drop(columns=["ingresoegreso"])
+        # workers de exportación y renderizador (kaleido) del servidor
+        st.caption(resumen_exportaciones(estadisticas_exportaciones()))
 
-        data = []
-        data.append([
-            Paragraph(f"<b>{col}</b>", cell_style)
-            for col in tabla_resumen.columns
-        ])
-
-        for _, row in tabla_resumen.iterrows():
-
-            es_egreso = (
-                str(row.get("ingresoegreso", "")).upper() == "EGRESO"
-            )
-
-            fila = []
-            for val in row:
-                color = "#BE2323" if es_egreso else "#269161"
-                fila.append(
-                    Paragraph(
-                        f'<font color="{color}">{val}</font>',
-                        cell_style
-                    )
-                )
-
-            data.append(fila)
-
-
-        # Definir anchos proporcionales (AJUSTA SI QUIERES)
-        num_cols = len(tabla_resumen.columns)
-        page_width = A4[0] - 4*cm   # márgenes
-        col_widths = [page_width / num_cols] * num_cols
-
-        tabla_res = Table(
-            data,
-            colWidths=col_widths,
-            repeatRows=1
-        )
-
-        tabla_res.setStyle(TableStyle([
-            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
-            ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
-            ("FONT", (0,0), (-1,0), "Helvetica-Bold"),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-            ("ALIGN", (1,1), (-1,-1), "LEFT"),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 6),
-            ("TOPPADDING", (0,0), (-1,-1), 6),
-        ]))
-
-        story.append(tabla_res)
-        # -------------------------------
-        doc.build(story)
-        buffer.seek(0)
-
-        return buffer
-
-    st.subheader("📤 Exportar PDF")
-
-    tabla_pdf = (
-        tabla
-        .drop(columns=["total_general_s"])
-        .rename(columns={"total_general_s_fmt": "TOTAL"})
-    )
-    ultima_fecha = df_filtrado["fecha"].max()
-
-    pdf_buffer = exportar_pdf_ejecutivo(
-        total_ingresos=total_ingresos,
-        total_egresos=total_egresos,
-        saldo=saldo,
-        tabla_resumen=tabla_pdf,
-        fig_pie=fig_pie,
-        fig_bar=fig_bar,
-        ultima_fecha=ultima_fecha,
-        fecha_inicio=fechas[0],
-        fecha_fin=fechas[1]
-    )
-    st.download_button(
-        "📄 Descargar PDF",
-        data=pdf_buffer,
-        file_name="reporte_control_caja_proyectado.pdf",
-        mime="application/pdf"
-    )
\ No newline at end of file
+    seccion_grafico()
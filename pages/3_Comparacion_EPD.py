@@ -11,8 +11,26 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 import os
-import uuid
-import json
+
+from utils.data_loader import (
+    cargar_excel, guardar_archivo, eliminar_archivo, resumen_ingesta,
+    concatenar, normalizar_parametros
+)
+from utils.indice import indice_fechas, indice_filtros
+from utils.cubo import datos_agregables
+from utils.agregacion import agregar
+from utils import comparacion
+from utils.imagenes import parametros_imagen, kaleido_disponible
+from utils.exportaciones import (
+    clave_vista, boton_exportacion, estadisticas_exportaciones, resumen_exportaciones
+)
+from utils.reportes import exportar_excel_comparativo, exportar_png
+from utils.excel import MIME_XLSX, formato_detalle
+from utils.vistas import cargar_vista, boton_url_corta, hash_vista, vista_filtros
+from utils.pipeline import Pipeline
+from utils.detalle import detalle_paginado
+from utils.tablas import mostrar_tabla
+from utils.panel_filtros import filtros_por_lote, panel_filtros
 # --------------------------------------------------
 # CONFIGURACIÓN
 # --------------------------------------------------
@@ -321,9 +339,6 @@ else:
 
 if not os.path.exists("data"):
     os.makedirs("data")
-# Carpeta para vistas compartidas
-if not os.path.exists("data/views"):
-    os.makedirs("data/views")
 
 pio.kaleido.scope.default_format = "png"
 pio.kaleido.scope.default_scale = 2
@@ -332,60 +347,6 @@ pio.kaleido.scope.default_scale = 2
 # UTILIDADES
 # --------------------------------------------------
 
-# --------------------------------------------------
-# SISTEMA DE VISTAS COMPARTIDAS
-# --------------------------------------------------
-
-def guardar_vista(filtros):
-
-    view_id = uuid.uuid4().hex[:8]
-
-    ruta = f"data/views/{view_id}.json"
-
-    with open(ruta, "w") as f:
-        json.dump(filtros, f)
-
-    return view_id
-
-
-def cargar_vista(view_id):
-
-    ruta = f"data/views/{view_id}.json"
-
-    if os.path.exists(ruta):
-
-        with open(ruta) as f:
-            return json.load(f)
-
-    return None
-
-def normalizar(col):
-    return col.lower().replace(" ", "_").replace("/", "").replace("°", "")
-
-def cargar_excel(archivo, tipo):
-    df = pd.read_excel(archivo)
-    df.columns = [normalizar(c) for c in df.columns]
-
-    obligatorias = ["fecha", "total_general_s"]
-    for c in obligatorias:
-        if c not in df.columns:
-            st.error(f"❌ Falta la columna obligatoria: {c}")
-            st.stop()
-
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-    df = df.dropna(subset=["fecha"])
-
-    df["total_general_s"] = (
-        df["total_general_s"]
-        .astype(str)
-        .str.replace(",", "", regex=False)
-        .astype(float)
-    )
-
-    df["anio_mes"] = df["fecha"].dt.to_period("M").astype(str)
-    df["tipo_archivo"] = tipo
-
-    return df
 
 def formato_moneda(x):
     return f"S/ {x:,.2f}"
@@ -427,14 +388,11 @@ if st.session_state["rol"] == "admin":
     if st.sidebar.button("🗑️ Limpiar archivos guardados"):
 
         # 🔹 Eliminar archivos
-        if os.path.exists(ruta_ej):
-            os.remove(ruta_ej)
+        eliminar_archivo(ruta_ej)
 
-        if os.path.exists(ruta_pr):
-            os.remove(ruta_pr)
+        eliminar_archivo(ruta_pr)
 
-        if os.path.exists(ruta_de):
-            os.remove(ruta_de)
+        eliminar_archivo(ruta_de)
         # 🔹 Limpiar session_state completo
         for key in list(st.session_state.keys()):
             del st.session_state[key]
@@ -459,18 +417,20 @@ with col1:
 
 
     if archivo_ej:
-        with open(ruta_ej, "wb") as f:
-            f.write(archivo_ej.getbuffer())
+        estadisticas = guardar_archivo(archivo_ej, ruta_ej)
         st.success("Ejecutado guardado correctamente")
+        if estadisticas:
+            st.caption(resumen_ingesta(estadisticas))
 
 with col2:
     archivo_pr = st.file_uploader("📂 Cargar Excel Proyectado", type=["xlsx"],
         disabled=not es_admin
     )
     if archivo_pr:
-        with open(ruta_pr, "wb") as f:
-            f.write(archivo_pr.getbuffer())
+        estadisticas = guardar_archivo(archivo_pr, ruta_pr)
         st.success("Proyectado guardado correctamente")
+        if estadisticas:
+            st.caption(resumen_ingesta(estadisticas))
 with col3:
     archivo_de = st.file_uploader(
         "📂 Cargar Excel Deuda",
@@ -478,9 +438,10 @@ with col3:
         disabled=not es_admin
     )
     if archivo_de:
-        with open(ruta_de, "wb") as f:
-            f.write(archivo_de.getbuffer())
+        estadisticas = guardar_archivo(archivo_de, ruta_de)
         st.success("Deuda guardada correctamente")
+        if estadisticas:
+            st.caption(resumen_ingesta(estadisticas))
 
 
 if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_de):
@@ -489,17 +450,9 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
     df_pr = cargar_excel(ruta_pr, "Proyectado")
     df_de = cargar_excel(ruta_de, "Deuda")
 
-    df = pd.concat([df_ej, df_pr, df_de], ignore_index=True)
-
-    # Crear columnas auxiliares de mes UNA SOLA VEZ en el dataframe base
-    meses_es = {
-        1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-        5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-        9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-    }
+    df = concatenar([df_ej, df_pr, df_de])
 
-    df["mes_num"] = df["fecha"].dt.month
-    df["mes_nombre"] = df["mes_num"].map(meses_es)
+    # mes_num / mes_nombre ya vienen calculados desde el sidecar
 
     # --------------------------------------------------
     # MANEJO GLOBAL DE ESTADO EN URL (COMPARTIBLE)
@@ -573,219 +526,211 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
 
     if obtener_parametro("view") == "1":
         st.session_state["rol"] = "lectura"
+    # links y vistas guardados con ingresoegreso como venía en el Excel
+    normalizar_parametros(st.query_params)
+
     # --------------------------------------------------
     # CONFIGURACIÓN DE FILTROS
     # --------------------------------------------------
+    # Los filtros se dibujan en dibujar_filtros(); por lote (ver
+    # utils.panel_filtros) el panel se vuelve a ejecutar solo y la página
+    # se recalcula al aplicar
+    def dibujar_filtros():
 
-    st.sidebar.header("🎛️ Configuración de filtros")
-
-    columnas_disponibles = [
-        c for c in df.columns
-        if c not in ["total_general_s", "tipo_archivo"]
-    ]
-
-    columnas_url = obtener_parametro("columnas")
+        st.header("🎛️ Configuración de filtros")
 
-    if columnas_url:
-        if isinstance(columnas_url, str):
-            columnas_url = columnas_url.split(",")
+        columnas_disponibles = [
+            c for c in df.columns
+            if c not in ["total_general_s", "tipo_archivo"]
+        ]
 
-    # Inicializar columnas en session_state solo una vez
-    if "columnas_filtro" not in st.session_state:
+        columnas_url = obtener_parametro("columnas")
 
         if columnas_url:
-            st.session_state.columnas_filtro = columnas_url
-        else:
-            st.session_state.columnas_filtro = [
-                c for c in [
-                    "costo__gasto",
-                    "clasificacion_1",
-                    "clasificacion_flujo2"
-                ] if c in columnas_disponibles
-            ]
-
-    columnas_filtro = st.sidebar.multiselect(
-        "Selecciona columnas para filtrar",
-        columnas_disponibles,
-        key="columnas_filtro",
-        disabled=modo_lectura
-    )
+            if isinstance(columnas_url, str):
+                columnas_url = columnas_url.split(",")
 
+        # Inicializar columnas en session_state solo una vez
+        if "columnas_filtro" not in st.session_state:
 
-    guardar_parametro("columnas", columnas_filtro)
+            if columnas_url:
+                st.session_state.columnas_filtro = columnas_url
+            else:
+                st.session_state.columnas_filtro = [
+                    c for c in [
+                        "costo__gasto",
+                        "clasificacion_1",
+                        "clasificacion_flujo2"
+                    ] if c in columnas_disponibles
+                ]
 
+        columnas_filtro = st.multiselect(
+            "Selecciona columnas para filtrar",
+            columnas_disponibles,
+            key="columnas_filtro",
+            disabled=modo_lectura
+        )
 
-    st.sidebar.divider()
-    st.sidebar.subheader("🔍 Filtros")
 
-    df_filtrado = df.copy()
+        guardar_parametro("columnas", columnas_filtro)
 
-    # --------------------------------------------------
-    # RECUPERAR FILTROS DESDE URL
-    # --------------------------------------------------
 
-    query_params = st.query_params
-    modo_ejecutivo = obtener_parametro("ejecutivo") == "1"
+        st.divider()
+        st.subheader("🔍 Filtros")
 
-    # --------------------------------------------------
-    # FILTRO POR MES (COMBOBOX)
-    # --------------------------------------------------
 
-    # Diccionario meses en español
-    meses_es = {
-        1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-        5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-        9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-    }
+        # --------------------------------------------------
+        # RECUPERAR FILTROS DESDE URL
+        # --------------------------------------------------
 
-    # Crear columnas auxiliares si no existen
-    # df_filtrado["mes_num"] = df_filtrado["fecha"].dt.month
-    # df_filtrado["mes_nombre"] = df_filtrado["mes_num"].map(meses_es)
+        query_params = st.query_params
+        modo_ejecutivo = obtener_parametro("ejecutivo") == "1"
 
-    st.sidebar.divider()
-    st.sidebar.subheader("📅 Filtro por Mes")
+        # --------------------------------------------------
+        # FILTRO POR MES (COMBOBOX)
+        # --------------------------------------------------
 
-    meses_disponibles = (
-        df_filtrado["mes_nombre"]
-        .dropna()
-        .unique()
-        .tolist()
-    )
+        # Diccionario meses en español
+        meses_es = {
+            1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+            5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+            9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+        }
 
-    # Ordenar meses correctamente
-    meses_disponibles = sorted(
-        meses_disponibles,
-        key=lambda x: list(meses_es.values()).index(x)
-    )
-    mes_url = obtener_parametro("mes")
+        # Crear columnas auxiliares si no existen
+        # df_filtrado["mes_num"] = df_filtrado["fecha"].dt.month
+        # df_filtrado["mes_nombre"] = df_filtrado["mes_num"].map(meses_es)
 
-    opciones_mes = ["Todos"] + meses_disponibles
+        st.divider()
+        st.subheader("📅 Filtro por Mes")
 
-    if mes_url in opciones_mes:
-        index_mes = opciones_mes.index(mes_url)
-    else:
-        index_mes = 0
+        # El DataFrame viene ordenado por fecha: meses y rangos de fechas se
+        # resuelven con búsqueda binaria sobre este índice
+        fechas_idx = indice_fechas(df)
 
-    mes_seleccionado = st.sidebar.selectbox(
-        "Seleccionar mes",
-        options=opciones_mes,
-        index=index_mes,
-        disabled=modo_lectura,
-        key="mes_selector"
-    )
+        # Meses presentes, ya en orden de calendario
+        meses_disponibles = [meses_es[m] for m in sorted(fechas_idx.tramos_por_mes)]
+        mes_url = obtener_parametro("mes")
 
-    if not modo_lectura:
-        guardar_parametro("mes", mes_seleccionado)
+        opciones_mes = ["Todos"] + meses_disponibles
 
+        if mes_url in opciones_mes:
+            index_mes = opciones_mes.index(mes_url)
+        else:
+            index_mes = 0
 
-    # Detectar cambio de mes
-    if not modo_lectura:
+        mes_seleccionado = st.selectbox(
+            "Seleccionar mes",
+            options=opciones_mes,
+            index=index_mes,
+            disabled=modo_lectura,
+            key="mes_selector"
+        )
 
-        if mes_seleccionado != "Todos":
+        if not modo_lectura:
+            guardar_parametro("mes", mes_seleccionado)
 
-            df_mes_temp = df[df["mes_nombre"] == mes_seleccionado]
 
+        if mes_seleccionado != "Todos":
+            tramos_mes = fechas_idx.tramos_mes(mes_seleccionado)
         else:
             # 🔥 Cuando es "Todos", usar todo el dataset
-            df_mes_temp = df.copy()
+            tramos_mes = fechas_idx.todas()
 
-        if not df_mes_temp.empty:
+        fecha_min, fecha_max = fechas_idx.rango(tramos_mes)
 
-            nueva_fecha_inicio = df_mes_temp["fecha"].min().date()
-            nueva_fecha_fin = df_mes_temp["fecha"].max().date()
+        # Detectar cambio de mes
+        if not modo_lectura:
 
-            guardar_parametro("fecha_inicio", nueva_fecha_inicio)
-            guardar_parametro("fecha_fin", nueva_fecha_fin)
+            if pd.notna(fecha_min):
 
-    # 🔥 IMPORTANTE:
-    # Si es "Todos" NO borramos fecha_inicio ni fecha_fin
-    # Dejamos que el date_input controle eso
+                nueva_fecha_inicio = fecha_min.date()
+                nueva_fecha_fin = fecha_max.date()
 
-    if mes_seleccionado != "Todos":
-        df_filtrado = df_filtrado[
-            df_filtrado["mes_nombre"] == mes_seleccionado
-        ]
-    # 🔹 Guardar versión solo con filtro de mes
-    df_para_fechas = df_filtrado.copy()
+                guardar_parametro("fecha_inicio", nueva_fecha_inicio)
+                guardar_parametro("fecha_fin", nueva_fecha_fin)
 
+        # 🔥 IMPORTANTE:
+        # Si es "Todos" NO borramos fecha_inicio ni fecha_fin
+        # Dejamos que el date_input controle eso
 
-    # --------------------------------------------------
-    # --------------------------------------------------
-    # FILTROS DINÁMICOS EN CASCADA (COMO SISTEMA ORIGINAL)
-    # --------------------------------------------------
+        # Mes (tramos del índice de fechas) y filtros en cascada se
+        # resuelven como ANDs de bitmaps
+        indice = indice_filtros(df)
+        mascara = indice.todos()
 
-    for col in columnas_filtro:
+        if mes_seleccionado != "Todos":
+            mascara = fechas_idx.mascara(tramos_mes)
 
-       #  valores = sorted(df_filtrado[col].dropna().unique())
-        valores = (
-            df_filtrado[col]
-            .dropna()
-            .astype(str)
-            .sort_values()
-            .unique()
-            .tolist()
-        )
-        key = f"filtro_{col}"
-        opciones = ["Todos"] + list(valores)
+        # selecciones y rango aplicados, para repetirlos sobre el cubo
+        filtros_activos = {}
+        rango_fechas = None
 
-        def actualizar_columnas():
-            st.session_state.columnas_visibles = st.session_state.columnas_selector
 
-        # Callback para comportamiento "Todos"
-        def on_change_callback(col=col, valores=valores, key=key):
+        # --------------------------------------------------
+        # --------------------------------------------------
+        # FILTROS DINÁMICOS EN CASCADA (COMO SISTEMA ORIGINAL)
+        # --------------------------------------------------
 
-            seleccion = st.session_state[key]
+        for col in columnas_filtro:
 
-            if "Todos" in seleccion:
-                # Reemplazar por todos los valores reales
-                st.session_state[key] = list(valores)
+           #  valores = sorted(df_filtrado[col].dropna().unique())
+            valores = indice.opciones(col, mascara)
+            key = f"filtro_{col}"
+            opciones = ["Todos"] + list(valores)
 
+            def actualizar_columnas():
+                st.session_state.columnas_visibles = st.session_state.columnas_selector
 
-        # Recuperar desde URL SOLO la primera vez
-        if key not in st.session_state:
+            # Callback para comportamiento "Todos"
+            def on_change_callback(col=col, valores=valores, key=key):
 
-            valor_url = obtener_parametro(col)
+                seleccion = st.session_state[key]
 
-            if valor_url:
-                if isinstance(valor_url, str):
-                    valor_url = valor_url.split(",")
+                if "Todos" in seleccion:
+                    # Reemplazar por todos los valores reales
+                    st.session_state[key] = list(valores)
 
-                st.session_state[key] = valor_url
 
+            # Recuperar desde URL SOLO la primera vez
+            if key not in st.session_state:
 
-        seleccion = st.sidebar.multiselect(
-            f"{col.replace('_', ' ').title()}",
-            options=opciones,
-            key=key,
-            disabled=modo_lectura,
-            on_change=on_change_callback
-        )
+                valor_url = obtener_parametro(col)
 
+                if valor_url:
+                    if isinstance(valor_url, str):
+                        valor_url = valor_url.split(",")
 
-        if not modo_lectura:
-            guardar_parametro(col, seleccion)
+                    st.session_state[key] = valor_url
 
-    
-        # Aplicar filtro
-        valores_seleccionados = st.session_state[key]
 
-        # Si selecciona "Todos" o no hay selección → no aplicar filtro
-        if valores_seleccionados and "Todos" not in valores_seleccionados:
+            seleccion = st.multiselect(
+                f"{col.replace('_', ' ').title()}",
+                options=opciones,
+                key=key,
+                disabled=modo_lectura,
+                on_change=on_change_callback
+            )
+
 
-            df_filtrado = df_filtrado[
-                df_filtrado[col].isin(valores_seleccionados)
-            ]
+            if not modo_lectura:
+                guardar_parametro(col, seleccion)
 
-    # --------------------------------------------------
-    # RANGO DE FECHAS (VERSIÓN SEGURA)
-    # --------------------------------------------------
 
-    if not df_para_fechas.empty:
+            # Aplicar filtro
+            valores_seleccionados = st.session_state[key]
 
-        fecha_min = df_para_fechas["fecha"].min()
-        fecha_max = df_para_fechas["fecha"].max()
+            # Si selecciona "Todos" o no hay selección → no aplicar filtro
+            if valores_seleccionados and "Todos" not in valores_seleccionados:
 
+                mascara &= indice.bitmap(col, valores_seleccionados)
+                filtros_activos[col] = valores_seleccionados
 
+        # --------------------------------------------------
+        # RANGO DE FECHAS (VERSIÓN SEGURA)
+        # --------------------------------------------------
+
+        # fecha_min / fecha_max: extremos del mes, tomados del índice
         if pd.notna(fecha_min) and pd.notna(fecha_max):
 
             fecha_inicio_url = obtener_parametro("fecha_inicio")
@@ -814,7 +759,7 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
             else:
                 fechas_default = (min_date, max_date)
 
-            fechas = st.sidebar.date_input(
+            fechas = st.date_input(
                 "Rango de fechas",
                 value=fechas_default,
                 min_value=min_date,
@@ -828,10 +773,24 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
                     guardar_parametro("fecha_inicio", str(fechas[0]))
                     guardar_parametro("fecha_fin", str(fechas[1]))
 
-                df_filtrado = df_filtrado[
-                    (df_filtrado["fecha"] >= pd.to_datetime(fechas[0])) &
-                    (df_filtrado["fecha"] <= pd.to_datetime(fechas[1]))
-                ]
+                # tramo [inicio, fin] ubicado con búsqueda binaria
+                mascara &= fechas_idx.mascara(fechas_idx.tramo(fechas[0], fechas[1]))
+                rango_fechas = fechas
+
+        return (
+            (columnas_filtro, mes_seleccionado, filtros_activos, rango_fechas),
+            (columnas_filtro, mes_seleccionado, filtros_activos, rango_fechas, mascara)
+        )
+
+    por_lote = filtros_por_lote(df, modo_lectura)
+    columnas_filtro, mes_seleccionado, filtros_activos, rango_fechas, mascara = panel_filtros(
+        dibujar_filtros, por_lote, df
+    )
+
+    # las filas se toman una vez, con los filtros aplicados (por lote, el
+    # borrador del panel no llega hasta aquí)
+    df_filtrado = indice_filtros(df).aplicar(df, mascara)
+
 
 
     if df_filtrado.empty:
@@ -880,15 +839,50 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
     if not columnas_grupo:
         columnas_grupo = ["fecha"]
 
+    # Agregados, tabla y gráficos se comparten entre sesiones, etapa por
+    # etapa (ver utils.pipeline): cada etapa se recalcula solo si cambian
+    # sus entradas o las de una etapa anterior
+    pipeline = Pipeline(df, "comparacion")
+    pipeline.paso("filtros", hash_vista(vista_filtros(
+        columnas_filtro, filtros_activos, mes_seleccionado, rango_fechas, modo
+    )))
+
+    # KPIs, tabla y gráficos se calculan sobre un cubo pre-agregado con
+    # los mismos filtros; si alguna columna no está en el cubo, sobre
+    # las filas de df_filtrado
+    mes_cubo = mes_seleccionado if mes_seleccionado != "Todos" else None
+
+    df_agregado = pipeline.etapa("datos", columnas_grupo)
+    if df_agregado is None:
+        df_agregado = datos_agregables(
+            df,
+            df_filtrado,
+            filtros_activos,
+            columnas_grupo + ["tipo_archivo", "ingresoegreso"],
+            mes=mes_cubo,
+            fechas=rango_fechas
+        )
+        # solo celdas del cubo: las filas crudas no se fijan en la cache
+        # compartida (las etapas siguientes guardan el agregado)
+        if df_agregado is not df_filtrado:
+            pipeline.guardar("datos", df_agregado)
+
+    # Una sola pasada agrupada: KPIs, ingresos/egresos y tabla
+    # comparativa salen de este resultado sumando hacia arriba
+    claves_agregado = columnas_grupo + ["tipo_archivo"]
+    if "ingresoegreso" in df_agregado.columns:
+        claves_agregado.append("ingresoegreso")
+
+    agregado = pipeline.etapa("agregado", claves_agregado)
+    if agregado is None:
+        agregado = agregar(df_agregado, claves_agregado)
+        pipeline.guardar("agregado", agregado)
+
     # --------------------------------------------------
     # KPI GENERALES
     # --------------------------------------------------
 
-    resumen = (
-        df_filtrado
-        .groupby("tipo_archivo", as_index=False)["total_general_s"]
-        .sum()
-    )
+    resumen = agregado.por(["tipo_archivo"])
 
     total_ej = resumen[resumen["tipo_archivo"]=="Ejecutado"]["total_general_s"].sum()
     total_pr = resumen[resumen["tipo_archivo"]=="Proyectado"]["total_general_s"].sum()
@@ -929,121 +923,120 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
     # INGRESOS VS EGRESOS (VERSIÓN EJECUTIVA)
     # --------------------------------------------------
 
-    if "ingresoegreso" in df_filtrado.columns:
-
-        ie = (
-            df_filtrado
-            .groupby(["tipo_archivo","ingresoegreso"], as_index=False)["total_general_s"]
-            .sum()
-        )
-
-        import plotly.graph_objects as go
-
-        fig_ie = go.Figure()
-
-        # ----------------------------------------
-        # Ejecutado
-        # ----------------------------------------
-
-        df_ej_ie = ie[ie["tipo_archivo"] == "Ejecutado"]
-
-        fig_ie.add_trace(go.Bar(
-            x=df_ej_ie["ingresoegreso"],
-            y=df_ej_ie["total_general_s"],
-            name="Ejecutado",
-            marker_color="#1F4E79",
-            text=[f"S/ {v:,.0f}" for v in df_ej_ie["total_general_s"]],
-            textposition="outside",
-            textfont=dict(
-                size=14,
-                family="Arial Black",
-                color="#1F4E79"
-            ),
-            width=0.25
-        ))
-
-        # ----------------------------------------
-        # Proyectado
-        # ----------------------------------------
-
-        df_pr_ie = ie[ie["tipo_archivo"] == "Proyectado"]
-
-        fig_ie.add_trace(go.Bar(
-            x=df_pr_ie["ingresoegreso"],
-            y=df_pr_ie["total_general_s"],
-            name="Proyectado",
-            marker_color="#ED7D31",
-            text=[f"S/ {v:,.0f}" for v in df_pr_ie["total_general_s"]],
-            textposition="outside",
-            textfont=dict(
-                size=14,
-                family="Arial Black",
-                color="#ED7D31"
-            ),
-            width=0.25
-        ))
-        # ----------------------------------------
-        # Deuda
-        # ----------------------------------------
-        df_de_ie = ie[ie["tipo_archivo"] == "Deuda"]
-
-        fig_ie.add_trace(go.Bar(
-            x=df_de_ie["ingresoegreso"],
-            y=df_de_ie["total_general_s"],
-            name="Deuda",
-            marker_color="#C00000",
-            text=[f"S/ {v:,.0f}" for v in df_de_ie["total_general_s"]],
-            textposition="outside",
-            textfont=dict(
-                size=14,
-                family="Arial Black",
-                color="#C00000"
-            ),
-            width=0.25
-        ))
-                # ----------------------------------------
-        # Layout ejecutivo
-        # ----------------------------------------
+    if "ingresoegreso" in df_agregado.columns:
+
+        fig_ie = pipeline.etapa("fig_ie")
+        if fig_ie is None:
+            ie = agregado.por(["tipo_archivo", "ingresoegreso"])
+
+            import plotly.graph_objects as go
+
+            fig_ie = go.Figure()
+
+            # ----------------------------------------
+            # Ejecutado
+            # ----------------------------------------
+
+            df_ej_ie = ie[ie["tipo_archivo"] == "Ejecutado"]
+
+            fig_ie.add_trace(go.Bar(
+                x=df_ej_ie["ingresoegreso"],
+                y=df_ej_ie["total_general_s"],
+                name="Ejecutado",
+                marker_color="#1F4E79",
+                text=[f"S/ {v:,.0f}" for v in df_ej_ie["total_general_s"]],
+                textposition="outside",
+                textfont=dict(
+                    size=14,
+                    family="Arial Black",
+                    color="#1F4E79"
+                ),
+                width=0.25
+            ))
+
+            # ----------------------------------------
+            # Proyectado
+            # ----------------------------------------
+
+            df_pr_ie = ie[ie["tipo_archivo"] == "Proyectado"]
+
+            fig_ie.add_trace(go.Bar(
+                x=df_pr_ie["ingresoegreso"],
+                y=df_pr_ie["total_general_s"],
+                name="Proyectado",
+                marker_color="#ED7D31",
+                text=[f"S/ {v:,.0f}" for v in df_pr_ie["total_general_s"]],
+                textposition="outside",
+                textfont=dict(
+                    size=14,
+                    family="Arial Black",
+                    color="#ED7D31"
+                ),
+                width=0.25
+            ))
+            # ----------------------------------------
+            # Deuda
+            # ----------------------------------------
+            df_de_ie = ie[ie["tipo_archivo"] == "Deuda"]
+
+            fig_ie.add_trace(go.Bar(
+                x=df_de_ie["ingresoegreso"],
+                y=df_de_ie["total_general_s"],
+                name="Deuda",
+                marker_color="#C00000",
+                text=[f"S/ {v:,.0f}" for v in df_de_ie["total_general_s"]],
+                textposition="outside",
+                textfont=dict(
+                    size=14,
+                    family="Arial Black",
+                    color="#C00000"
+                ),
+                width=0.25
+            ))
+                    # ----------------------------------------
+            # Layout ejecutivo
+            # ----------------------------------------
     
 
-        max_y = ie["total_general_s"].abs().max()
-
-        fig_ie.update_layout(
-
-            title=dict(
-                text="Ingresos vs Egresos – Comparativo",
-                x=0.5,
-                xanchor="center",
-                font=dict(size=20)
-            ),
-
-            barmode="group",
-
-            yaxis=dict(
-                title="Monto (S/)",
-                range=[0, max_y * 1.35],
-                tickprefix="S/ ",
-                showgrid=True,
-                gridcolor="rgba(0,0,0,0.05)",
-                zeroline=False
-            ),
-
-            xaxis=dict(
-                title="",
-                tickangle=0
-            ),
-
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="center",
-                x=0.5
-            ),
-
-            template="plotly_white",
-            height=500
-        )
+            max_y = ie["total_general_s"].abs().max()
+
+            fig_ie.update_layout(
+
+                title=dict(
+                    text="Ingresos vs Egresos – Comparativo",
+                    x=0.5,
+                    xanchor="center",
+                    font=dict(size=20)
+                ),
+
+                barmode="group",
+
+                yaxis=dict(
+                    title="Monto (S/)",
+                    range=[0, max_y * 1.35],
+                    tickprefix="S/ ",
+                    showgrid=True,
+                    gridcolor="rgba(0,0,0,0.05)",
+                    zeroline=False
+                ),
+
+                xaxis=dict(
+                    title="",
+                    tickangle=0
+                ),
+
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="center",
+                    x=0.5
+                ),
+
+                template="plotly_white",
+                height=500
+            )
+            pipeline.guardar("fig_ie", fig_ie)
 
         st.plotly_chart(fig_ie, use_container_width=True)
 
@@ -1051,66 +1044,53 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
     # TABLA COMPARATIVA
     # --------------------------------------------------
 
-    tabla = (
-        df_filtrado
-        .groupby(columnas_grupo + ["tipo_archivo"], as_index=False)["total_general_s"]
-        .sum()
-    )
+    tabla = pipeline.etapa("tabla")
+    if tabla is None:
+        tabla = agregado.por(columnas_grupo + ["tipo_archivo"])
 
-    tabla = tabla.pivot_table(
-        index=columnas_grupo,
-        columns="tipo_archivo",
-        values="total_general_s",
-        fill_value=0
-    ).reset_index()
+        tabla = tabla.pivot_table(
+            index=columnas_grupo,
+            columns="tipo_archivo",
+            values="total_general_s",
+            fill_value=0,
+            observed=True
+        ).reset_index()
 
-    # --------------------------------------------------
-    # ASEGURAR QUE SIEMPRE EXISTAN AMBAS COLUMNAS
-    # --------------------------------------------------
+        # --------------------------------------------------
+        # ASEGURAR QUE SIEMPRE EXISTAN AMBAS COLUMNAS
+        # --------------------------------------------------
 
-    if "Ejecutado" not in tabla.columns:
-        tabla["Ejecutado"] = 0
+        if "Ejecutado" not in tabla.columns:
+            tabla["Ejecutado"] = 0
 
-    if "Proyectado" not in tabla.columns:
-        tabla["Proyectado"] = 0
+        if "Proyectado" not in tabla.columns:
+            tabla["Proyectado"] = 0
 
-    if "Deuda" not in tabla.columns:
-        tabla["Deuda"] = 0
-    # --------------------------------------------------
-    # CÁLCULOS SEGUROS
-    # --------------------------------------------------
+        if "Deuda" not in tabla.columns:
+            tabla["Deuda"] = 0
+        # --------------------------------------------------
+        # CÁLCULOS SEGUROS
+        # --------------------------------------------------
 
-    #tabla["Diferencia"] = tabla["Ejecutado"] - tabla["Proyectado"]
+        #tabla["Diferencia"] = tabla["Ejecutado"] - tabla["Proyectado"]
 
-    #tabla["% Cumplimiento"] = tabla.apply(
-    #    lambda row: (row["Ejecutado"] / row["Proyectado"] * 100)
-    #    if row["Proyectado"] != 0 else 0,
-    #    axis=1
-    #)
-    # --------------------------------------------------
-    # AGREGAR MES SELECCIONADO EN RESULTADO
-    # --------------------------------------------------
+        #tabla["% Cumplimiento"] = tabla.apply(
+        #    lambda row: (row["Ejecutado"] / row["Proyectado"] * 100)
+        #    if row["Proyectado"] != 0 else 0,
+        #    axis=1
+        #)
+        # --------------------------------------------------
+        # AGREGAR MES SELECCIONADO EN RESULTADO
+        # --------------------------------------------------
 
-    if mes_seleccionado != "Todos":
-        tabla.insert(0, "Mes Seleccionado", mes_seleccionado)
+        if mes_seleccionado != "Todos":
+            tabla.insert(0, "Mes Seleccionado", mes_seleccionado)
+        pipeline.guardar("tabla", tabla)
 
     #st.subheader("📊 Resultado Comparativo")
     st.markdown("### 📊 Resultado Comparativo Financiero")
-    def color_diferencia(val):
-        if val < 0:
-            return "color: #BE2323"
-        elif val > 0:
-            return "color: green"
-        return ""
-
-    st.dataframe(
-        tabla.style
-        .format({
-            "Ejecutado": lambda x: f"S/. {x:,.2f}" if pd.notnull(x) else "",
-            "Proyectado": lambda x: f"S/. {x:,.2f}" if pd.notnull(x) else "",
-            "Deuda": lambda x: f"S/. {x:,.2f}" if pd.notnull(x) else ""
-        })
-    )
+    # montos numéricos, formateados en el navegador (ver utils.tablas)
+    mostrar_tabla(tabla, moneda=["Ejecutado", "Proyectado", "Deuda"])
     # ----------------------------------------
     # Selector dinámico de dimensión (CON URL)
     # ----------------------------------------
@@ -1135,258 +1115,255 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
     # --------------------------------------------------
         # DETALLE
         # --------------------------------------------------
-    with st.expander("🔍 Ver detalle completo"):
-            st.dataframe(df_filtrado, use_container_width=True)
-
-    st.subheader("📈 Visualización de Gráfico")
-
-    # Definir eje X
-    if "clasificacion_1" in tabla.columns:
-        eje_x = "clasificacion_1"
-    else:
-        eje_x = columnas_grupo[0]
-
-    columna_descripcion = st.selectbox(
-        "Agrupar gráfico por:",
-        columnas_posibles,
-        key=key_agrupar,
-        disabled=modo_lectura
-    )
-
-    # 🔹 Guardar en URL solo si NO está en modo lectura
-    if not modo_lectura:
-        guardar_parametro(key_agrupar, columna_descripcion)
-    
-    # --------------------------------------------------
-    # GRÁFICO EJECUTIVO PROFESIONAL
-    # --------------------------------------------------
+    # solo se envía al abrirlo, de a una página (ver utils.detalle)
+    detalle_paginado(df_filtrado, pipeline.clave("filtros"))
 
-    st.subheader("📊 FC Ejecutado vs FC Presupuesto")
+    # El gráfico, el link y las exportaciones forman un fragmento
+    # (st.fragment): cambiar la agrupación vuelve a ejecutar solo esta
+    # sección, no los filtros, KPIs ni la tabla. Las exportaciones son un
+    # fragmento dentro del gráfico: dependen de la figura y se vuelven a
+    # armar con ella, pero preparar una descarga solo ejecuta su panel.
 
-    # ----------------------------------------
-    # Definir columna descripción dinámica
-    # ----------------------------------------
+    if not modo_lectura:
+        st.sidebar.divider()
 
-    if columna_descripcion:
+    @st.fragment
+    def seccion_grafico():
+        st.subheader("📈 Visualización de Gráfico")
 
-        # ----------------------------------------
-        # Agrupar datos
-        # ----------------------------------------
+        # Definir eje X
+        if "clasificacion_1" in tabla.columns:
+            eje_x = "clasificacion_1"
+        else:
+            eje_x = columnas_grupo[0]
 
-        graf_base = (
-            df_filtrado
-            .groupby([columna_descripcion, "tipo_archivo"], as_index=False)["total_general_s"]
-            .sum()
+        columna_descripcion = st.selectbox(
+            "Agrupar gráfico por:",
+            columnas_posibles,
+            key=key_agrupar,
+            disabled=modo_lectura
         )
 
-        graf_pivot = graf_base.pivot_table(
-            index=columna_descripcion,
-            columns="tipo_archivo",
-            values="total_general_s",
-            fill_value=0
-        ).reset_index()
-
-        # Asegurar columnas
-        if "Ejecutado" not in graf_pivot.columns:
-            graf_pivot["Ejecutado"] = 0
-
-        if "Proyectado" not in graf_pivot.columns:
-            graf_pivot["Proyectado"] = 0
-        if "Deuda" not in graf_pivot.columns:
-            graf_pivot["Deuda"] = 0
-        # ----------------------------------------
-        # Métricas adicionales
-        # ----------------------------------------
-
-        
-        # ----------------------------------------
-        # Ordenar de mayor a menor impacto
-        # ----------------------------------------
+        # 🔹 Guardar en URL solo si NO está en modo lectura
+        if not modo_lectura:
+            guardar_parametro(key_agrupar, columna_descripcion)
+    
+        # --------------------------------------------------
+        # GRÁFICO EJECUTIVO PROFESIONAL
+        # --------------------------------------------------
 
-        graf_pivot = graf_pivot.sort_values(
-            by="Ejecutado",
-            ascending=False
-        )
+        st.subheader("📊 FC Ejecutado vs FC Presupuesto")
 
         # ----------------------------------------
-        # Crear gráfico
+        # Definir columna descripción dinámica
         # ----------------------------------------
 
-        import plotly.graph_objects as go
-
-        fig = go.Figure()
-
-        # ----------------------------------------
-        # BARRA REAL
-        # ----------------------------------------
+        if columna_descripcion:
+
+            # ----------------------------------------
+            # Agrupar datos
+            # ----------------------------------------
+
+            graf_pivot = pipeline.etapa("graf_pivot", columna_descripcion, desde="tabla")
+            if graf_pivot is None:
+                df_grafico = datos_agregables(
+                    df,
+                    df_filtrado,
+                    filtros_activos,
+                    [columna_descripcion, "tipo_archivo"],
+                    mes=mes_cubo,
+                    fechas=rango_fechas
+                )
 
-        fig.add_trace(go.Bar(
-            x=graf_pivot[columna_descripcion],
-            y=graf_pivot["Ejecutado"].apply(lambda x: abs(x) if x != 0 else 0.0001),
-            name="FC REAL",
-            marker_color="#1F4E79",
-            width=0.25,
-            offsetgroup="1",
-            text=[f"S/ {v:,.0f}" for v in graf_pivot["Ejecutado"]],
-            texttemplate="%{text}",
-            textposition="outside",
-            textangle=90,
-            constraintext="none",
-            textfont=dict(
-                size=16,
-                color="#1F4E79",
-                family="Arial Black"
-            ),
-            cliponaxis=False
-        ))
+                graf_base = (
+                    df_grafico
+                    .groupby([columna_descripcion, "tipo_archivo"], as_index=False, observed=True)["total_general_s"]
+                    .sum()
+                )
 
-        # ----------------------------------------
-        # BARRA PRESUPUESTO
-        # ----------------------------------------
+                graf_pivot = graf_base.pivot_table(
+                    index=columna_descripcion,
+                    columns="tipo_archivo",
+                    values="total_general_s",
+                    fill_value=0,
+                    observed=True
+                ).reset_index()
+
+                # Asegurar columnas
+                if "Ejecutado" not in graf_pivot.columns:
+                    graf_pivot["Ejecutado"] = 0
+
+                if "Proyectado" not in graf_pivot.columns:
+                    graf_pivot["Proyectado"] = 0
+                if "Deuda" not in graf_pivot.columns:
+                    graf_pivot["Deuda"] = 0
+                # ----------------------------------------
+                # Métricas adicionales
+                # ----------------------------------------
 
-        fig.add_trace(go.Bar(
-            x=graf_pivot[columna_descripcion],
-            y=graf_pivot["Proyectado"].apply(lambda x: abs(x) if x != 0 else 0.0001),
-            name="PRESUPUESTO",
-            marker_color="#ED7D31",
-            width=0.25,
-            offsetgroup="2",
-            text=[f"S/ {v:,.0f}" for v in graf_pivot["Proyectado"]],
-            texttemplate="%{text}",
-            textposition="outside",
-            textangle=90,
-            constraintext="none",
-            textfont=dict(
-                size=16,
-                color="#ED7D31",
-                family="Arial Black"
-            ),
-            cliponaxis=False
-        ))
         
-        fig.add_trace(go.Bar(
-            x=graf_pivot[columna_descripcion],
-            y=graf_pivot["Deuda"].apply(lambda x: abs(x) if x != 0 else 0.0001),
-            name="DEUDA",
-            marker_color="#C00000",
-            width=0.25,
-            offsetgroup="3",
-            text=[f"S/ {v:,.0f}" for v in graf_pivot["Deuda"]],
-            textposition="outside",
-            textangle=90,
-            constraintext="none",
-            textfont=dict(
-                size=16,
-                color="#C00000",
-                family="Arial Black"
-            ),
-            cliponaxis=False
-        ))
-
-
-        # --------------------------------------------------
-        # ORDENAR MESES CORRECTAMENTE
-        # --------------------------------------------------
-
-        orden_meses = [
-            "Enero","Febrero","Marzo","Abril","Mayo","Junio",
-            "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"
-        ]
+                # ----------------------------------------
+                # Ordenar de mayor a menor impacto
+                # ----------------------------------------
 
-        if columna_descripcion == "mes_nombre":
-            fig.update_xaxes(
-                categoryorder="array",
-                categoryarray=orden_meses
-            )
-        # ----------------------------------------
-        # Layout ejecutivo
-        # ----------------------------------------
+                graf_pivot = graf_pivot.sort_values(
+                    by="Ejecutado",
+                    ascending=False
+                )
+                pipeline.guardar("graf_pivot", graf_pivot)
 
-        fig.update_layout(
-            barmode="group",
-            title=dict(
-                text="FC Ejecutado vs FC Presupuesto",
-                x=0.5,
-                xanchor="center",
-                font=dict(size=20)
-            ),
-            xaxis_title="",
-            yaxis_title="Monto (S/)",
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.05,
-                xanchor="center",
-                x=0.5
-            ),
-            xaxis=dict(
-                tickangle=-25
-            ),
-            template="plotly_white",
-            height=650
-        )
+            # ----------------------------------------
+            # Crear gráfico
+            # ----------------------------------------
 
-        max_y = graf_pivot[["Ejecutado","Proyectado","Deuda"]].abs().max().max()
-
-        fig.update_layout(
-            yaxis=dict(
-                range=[0, max_y * 1.35],
-                showgrid=True,
-                showticklabels=True,
-                tickformat="~s",
-                tickprefix="S/ ",
-                zeroline=False,
-                gridcolor="rgba(0,0,0,0.05)"
-            )
-        )
+            fig = pipeline.etapa("fig")
+            if fig is None:
+                import plotly.graph_objects as go
 
-        st.plotly_chart(fig, use_container_width=True)
-       
-        # --------------------------------------------------
-        # GENERAR URL CORTA (IGUAL AL PROYECTO EJEMPLO)
-        # --------------------------------------------------
-        if not modo_lectura:
+                fig = go.Figure()
 
-            st.sidebar.divider()
-            filtros_compartir = dict(st.query_params)
+                # ----------------------------------------
+                # BARRA REAL
+                # ----------------------------------------
 
-            view_id = guardar_vista(filtros_compartir)
+                fig.add_trace(go.Bar(
+                    x=graf_pivot[columna_descripcion],
+                    y=comparacion.altura_barra(graf_pivot["Ejecutado"]),
+                    name="FC REAL",
+                    marker_color="#1F4E79",
+                    width=0.25,
+                    offsetgroup="1",
+                    text=[f"S/ {v:,.0f}" for v in graf_pivot["Ejecutado"]],
+                    texttemplate="%{text}",
+                    textposition="outside",
+                    textangle=90,
+                    constraintext="none",
+                    textfont=dict(
+                        size=16,
+                        color="#1F4E79",
+                        family="Arial Black"
+                    ),
+                    cliponaxis=False
+                ))
 
-            components.html(f"""
-            <div style="margin-top:10px">
+                # ----------------------------------------
+                # BARRA PRESUPUESTO
+                # ----------------------------------------
 
-            <button onclick="copyUrl()" style="
-            background:#2E8B57;
-            color:white;
-            border:none;
-            padding:10px 16px;
-            border-radius:8px;
-            cursor:pointer;
-            font-size:14px;
-            width:100%;
-            ">
-            🔗 Generar y copiar URL corta
-            </button>
+                fig.add_trace(go.Bar(
+                    x=graf_pivot[columna_descripcion],
+                    y=comparacion.altura_barra(graf_pivot["Proyectado"]),
+                    name="PRESUPUESTO",
+                    marker_color="#ED7D31",
+                    width=0.25,
+                    offsetgroup="2",
+                    text=[f"S/ {v:,.0f}" for v in graf_pivot["Proyectado"]],
+                    texttemplate="%{text}",
+                    textposition="outside",
+                    textangle=90,
+                    constraintext="none",
+                    textfont=dict(
+                        size=16,
+                        color="#ED7D31",
+                        family="Arial Black"
+                    ),
+                    cliponaxis=False
+                ))
+        
+                fig.add_trace(go.Bar(
+                    x=graf_pivot[columna_descripcion],
+                    y=comparacion.altura_barra(graf_pivot["Deuda"]),
+                    name="DEUDA",
+                    marker_color="#C00000",
+                    width=0.25,
+                    offsetgroup="3",
+                    text=[f"S/ {v:,.0f}" for v in graf_pivot["Deuda"]],
+                    textposition="outside",
+                    textangle=90,
+                    constraintext="none",
+                    textfont=dict(
+                        size=16,
+                        color="#C00000",
+                        family="Arial Black"
+                    ),
+                    cliponaxis=False
+                ))
+
+
+                # --------------------------------------------------
+                # ORDENAR MESES CORRECTAMENTE
+                # --------------------------------------------------
+
+                orden_meses = [
+                    "Enero","Febrero","Marzo","Abril","Mayo","Junio",
+                    "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"
+                ]
 
-            </div>
+                if columna_descripcion == "mes_nombre":
+                    fig.update_xaxes(
+                        categoryorder="array",
+                        categoryarray=orden_meses
+                    )
+                # ----------------------------------------
+                # Layout ejecutivo
+                # ----------------------------------------
 
-            <script>
+                fig.update_layout(
+                    barmode="group",
+                    title=dict(
+                        text="FC Ejecutado vs FC Presupuesto",
+                        x=0.5,
+                        xanchor="center",
+                        font=dict(size=20)
+                    ),
+                    xaxis_title="",
+                    yaxis_title="Monto (S/)",
+                    legend=dict(
+                        orientation="h",
+                        yanchor="bottom",
+                        y=1.05,
+                        xanchor="center",
+                        x=0.5
+                    ),
+                    xaxis=dict(
+                        tickangle=-25
+                    ),
+                    template="plotly_white",
+                    height=650
+                )
 
-            function copyUrl() {{
+                max_y = graf_pivot[["Ejecutado","Proyectado","Deuda"]].abs().max().max()
+
+                fig.update_layout(
+                    yaxis=dict(
+                        range=[0, max_y * 1.35],
+                        showgrid=True,
+                        showticklabels=True,
+                        tickformat="~s",
+                        tickprefix="S/ ",
+                        zeroline=False,
+                        gridcolor="rgba(0,0,0,0.05)"
+                    )
+                )
+                pipeline.guardar("fig", fig)
 
-            const base = window.parent.location.origin + window.parent.location.pathname;
-            const url = base + "?v={view_id}";
+            st.plotly_chart(fig, use_container_width=True)
+       
+            # --------------------------------------------------
+            # GENERAR URL CORTA (IGUAL AL PROYECTO EJEMPLO)
+            # --------------------------------------------------
+            if not modo_lectura:
 
-            navigator.clipboard.writeText(url).then(function() {{
-                alert("✅ URL copiada:\\n" + url);
-            }});
+                filtros_compartir = dict(st.query_params)
 
-            }}
+                # el id se genera (y la vista se guarda) solo al pedir la URL
+                boton_url_corta(filtros_compartir)
 
-            </script>
-            """, height=80)
+            seccion_exportaciones(fig, graf_pivot)
 
-         # --------------------------------------------------
+    @st.fragment
+    def seccion_exportaciones(fig, graf_pivot):
+        # --------------------------------------------------
         # EXPORTACIONES (EXCEL + GRÁFICO)
         # --------------------------------------------------
 
@@ -1401,26 +1378,32 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
 
         with col_exp1:
 
-            buffer_excel = BytesIO()
-
-            with pd.ExcelWriter(buffer_excel, engine="openpyxl") as writer:
-
-                # Hoja tabla comparativa
-                tabla.to_excel(writer, sheet_name="Comparativo", index=False)
-
-                # Hoja datos del gráfico
-                graf_pivot.to_excel(writer, sheet_name="Datos Grafico", index=False)
-
-                # Hoja detalle filtrado
-                df_filtrado.to_excel(writer, sheet_name="Detalle", index=False)
+            # El Excel (con todo el detalle filtrado) se arma en un proceso
+            # de exportación; la clave de la última etapa ya cubre versión
+            # del dataset, filtros, tabla y gráfico
+            clave_excel = clave_vista(
+                "excel", pipeline.identidad(tabla, graf_pivot, df.attrs.get("version"), mascara)
+            )
 
-            buffer_excel.seek(0)
+            # un detalle muy grande sale aparte (CSV/Parquet) en un ZIP
+            # junto al Excel con los resúmenes
+            detalle_aparte = formato_detalle(len(df_filtrado))
 
-            st.download_button(
-                label="📊 Descargar Excel completo",
-                data=buffer_excel,
-                file_name="control_caja_comparativo_EPD.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            if detalle_aparte is None:
+                archivo_excel, mime_excel = "control_caja_comparativo_EPD.xlsx", MIME_XLSX
+            else:
+                archivo_excel, mime_excel = "control_caja_comparativo_EPD.zip", "application/zip"
+
+            boton_exportacion(
+                "📊 Descargar Excel completo",
+                archivo_excel,
+                mime_excel,
+                clave_excel,
+                exportar_excel_comparativo,
+                tabla=tabla,
+                graf_pivot=graf_pivot,
+                detalle=df_filtrado,
+                formato_detalle=detalle_aparte
             )
 
 
@@ -1432,22 +1415,19 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
 
             try:
 
-                buffer_img = BytesIO()
-
-                fig.write_image(
-                    buffer_img,
-                    format="png",
-                    width=1400,
-                    height=800
-                )
+                if not kaleido_disponible():
+                    raise ImportError("kaleido")
 
-                buffer_img.seek(0)
+                imagen_png = parametros_imagen(formato="png", width=1400, height=800)
 
-                st.download_button(
-                    label="🖼 Descargar gráfico PNG",
-                    data=buffer_img,
-                    file_name="grafico_fc_comparativo_EPD.png",
-                    mime="image/png"
+                boton_exportacion(
+                    "🖼 Descargar gráfico PNG",
+                    "grafico_fc_comparativo_EPD.png",
+                    "image/png",
+                    clave_vista("png", pipeline.identidad(fig), imagen_png),
+                    exportar_png,
+                    fig=fig,
+                    imagen=imagen_png
                 )
 
             except Exception as e:
@@ -1456,5 +1436,11 @@ if os.path.exists(ruta_ej) and os.path.exists(ruta_pr) and os.path.exists(ruta_d
                     "Para exportar gráficos instala Kaleido:\n\n"
                     "`pip install -U kaleido`"
                 )
+
+        # workers de exportación y renderizador (kaleido) del servidor
+        st.caption(resumen_exportaciones(estadisticas_exportaciones()))
+
+    seccion_grafico()
+
 else:
     st.info("👆 Carga ambos archivos para comenzar el análisis comparativo")
@@ -0,0 +1,62 @@
+from utils.data_loader import rellenar_vacios
+
+# --------------------------------------------------
+# AGREGACIÓN FUSIONADA
+# --------------------------------------------------
+# Una sola pasada agrupada sobre la unión de todas las claves que piden
+# KPIs, tabla y gráfico (dropna=False: no se pierde ninguna fila). Cada
+# resultado sale después de esa base, que tiene pocas filas, sumando
+# hacia arriba (rollup) sin volver a recorrer ni copiar df_filtrado.
+# Solo se guarda la base: el agregado vive en la cache de resultados
+# compartida y no debe retener las filas filtradas.
+
+
+class AgregadoFusionado:
+
+    def __init__(self, df, claves, valor="total_general_s"):
+        self.claves = list(dict.fromkeys(claves))
+        self.valor = valor
+
+        self.base = (
+            df
+            .groupby(self.claves, observed=True, dropna=False, sort=False)[valor]
+            .sum()
+            .reset_index()
+        )
+
+    def por(self, columnas, rellenar=None):
+        columnas = list(columnas)
+
+        # las páginas agrupan solo por columnas de la tabla (claves)
+        fuera = [c for c in columnas if c not in self.claves]
+        if fuera:
+            raise ValueError(f"Columnas fuera del agregado: {fuera}")
+
+        datos = self.base
+
+        if rellenar is not None:
+            datos = datos.assign(**{
+                col: rellenar_vacios(datos[col], rellenar) for col in columnas
+            })
+
+        # mismo criterio que groupby por defecto: claves vacías fuera
+        return (
+            datos
+            .groupby(columnas, as_index=False, observed=True)[self.valor]
+            .sum()
+        )
+
+    @property
+    def nbytes(self):
+        return int(self.base.memory_usage(deep=True).sum())
+
+    def totales(self, columna):
+        if columna not in self.claves:
+            raise ValueError(f"Columna fuera del agregado: {columna}")
+
+        sumas = self.base.groupby(columna, observed=True)[self.valor].sum()
+        return sumas.to_dict()
+
+
+def agregar(df, claves, valor="total_general_s"):
+    return AgregadoFusionado(df, claves, valor)
@@ -0,0 +1,98 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# --------------------------------------------------
+# CACHE LRU CON PRESUPUESTO DE MEMORIA
+# --------------------------------------------------
+# Compartida por todas las sesiones del proceso de Streamlit.
+# Cada entrada se mide en bytes con `medir`; al superar `max_bytes`
+# se expulsan primero las entradas usadas hace más tiempo.
+
+
+def medir_objeto(valor):
+    memory_usage = getattr(valor, "memory_usage", None)
+    if memory_usage is not None:
+        try:
+            return int(memory_usage(deep=True).sum())
+        except TypeError:
+            pass
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+
+    def __init__(self, max_bytes, medir=medir_objeto):
+        self.max_bytes = max_bytes
+        self.medir = medir
+        self._datos = OrderedDict()
+        self._tamanos = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave, default=None):
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+            return default
+
+    def put(self, clave, valor):
+        tamano = self.medir(valor)
+
+        with self._lock:
+            self._quitar(clave)
+
+            # Un objeto más grande que todo el presupuesto no se guarda
+            if tamano > self.max_bytes:
+                return valor
+
+            self._datos[clave] = valor
+            self._tamanos[clave] = tamano
+            self._bytes += tamano
+
+            while self._bytes > self.max_bytes and self._datos:
+                antigua = next(iter(self._datos))
+                self._quitar(antigua)
+
+        return valor
+
+    def invalidar(self, predicado):
+        with self._lock:
+            for clave in [c for c in self._datos if predicado(c)]:
+                self._quitar(clave)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._tamanos.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+    def __contains__(self, clave):
+        with self._lock:
+            return clave in self._datos
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
+
+    def _quitar(self, clave):
+        if clave in self._datos:
+            del self._datos[clave]
+            self._bytes -= self._tamanos.pop(clave)
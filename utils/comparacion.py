@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------
+# MÉTRICAS DE COMPARACIÓN (EJECUTADO VS PROYECTADO)
+# --------------------------------------------------
+# Operaciones por columna con NumPy: sirven igual para un KPI (escalar)
+# que para una tabla dinámica con miles de categorías. Donde el
+# denominador es 0 el resultado es 0, como en el cálculo fila a fila
+# que se usaba antes.
+
+# Plotly no dibuja barras de alto 0: se reemplaza por este mínimo
+ALTURA_MINIMA = 0.0001
+
+
+def _como_entrada(resultado, referencia):
+    if isinstance(referencia, pd.Series):
+        return pd.Series(resultado, index=referencia.index)
+    if np.ndim(resultado) == 0:
+        return float(resultado)
+    return resultado
+
+
+def _cociente(numerador, denominador):
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+
+    resultado = np.zeros(np.broadcast(numerador, denominador).shape)
+    np.divide(numerador, denominador, out=resultado, where=denominador != 0)
+    return resultado
+
+
+def diferencia(real, plan):
+    resultado = np.asarray(real, dtype=float) - np.asarray(plan, dtype=float)
+    return _como_entrada(resultado, real)
+
+
+def cumplimiento(real, plan):
+    # % del proyectado que se ejecutó
+    return _como_entrada(_cociente(real, plan) * 100, real)
+
+
+def variacion(real, plan):
+    # % de desvío respecto del proyectado
+    resultado = _cociente(
+        np.asarray(real, dtype=float) - np.asarray(plan, dtype=float), plan
+    )
+    return _como_entrada(resultado * 100, real)
+
+
+def altura_barra(valores, absoluto=True):
+    valores = np.asarray(valores, dtype=float)
+    alturas = np.abs(valores) if absoluto else valores
+    return np.where(valores != 0, alturas, ALTURA_MINIMA)
+
+
+def agregar_metricas(tabla, real="Ejecutado", plan="Proyectado"):
+    tabla["Diferencia"] = diferencia(tabla[real], tabla[plan])
+    tabla["% Cumplimiento"] = cumplimiento(tabla[real], tabla[plan])
+    return tabla
@@ -0,0 +1,150 @@
+import pandas as pd
+
+from utils.cache import CacheLRU
+from utils.indice import indice_fechas, indice_filtros
+
+# --------------------------------------------------
+# CUBOS PRE-AGREGADOS
+# --------------------------------------------------
+# Se arman una vez por dataset cargado: suma y cantidad de filas de
+# total_general_s por fecha (día o mes) × ingresoegreso × cada dimensión
+# configurada. Tienen las mismas columnas que el libro (total_general_s
+# pasa a ser la suma de la celda), así KPIs, tabla y gráficos se
+# calculan igual sobre miles de celdas en lugar de cientos de miles de
+# filas. Si se filtra o agrupa por otra columna, o el rango de fechas
+# corta un mes y no hay cubo diario, se usan las filas crudas.
+
+DIMENSIONES_CUBO = [
+    "tipo_archivo",
+    "ingresoegreso",
+    "costo__gasto",
+    "clasificacion_1",
+    "clasificacion_flujo2",
+]
+
+# derivadas de la fecha: no agregan celdas
+COLUMNAS_MES = ["anio_mes", "mes_num", "mes_nombre"]
+
+# Por encima de esta proporción de celdas/filas el cubo no ahorra nada
+MAX_RATIO_CUBO = 0.5
+
+CACHE_CUBOS_MAX_BYTES = 256 * 1024 * 1024
+
+
+class Cubo:
+
+    # nivel "dia": una celda por fecha; nivel "mes": la columna fecha
+    # guarda el primer día del mes y no se puede agrupar por ella
+    def __init__(self, df, nivel):
+        self.nivel = nivel
+        self.df = None
+
+        if "fecha" not in df.columns or "total_general_s" not in df.columns:
+            self.dimensiones = set()
+            return
+
+        dimensiones = [c for c in COLUMNAS_MES if c in df.columns] + [
+            c for c in DIMENSIONES_CUBO
+            if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)
+        ]
+
+        fecha = df["fecha"]
+        if nivel == "mes":
+            fecha = pd.Series(
+                fecha.to_numpy(dtype="datetime64[ns]")
+                .astype("datetime64[M]")
+                .astype("datetime64[ns]"),
+                index=df.index,
+                name="fecha"
+            )
+            self.dimensiones = set(dimensiones)
+        else:
+            self.dimensiones = set(["fecha"] + dimensiones)
+
+        cubo = (
+            df["total_general_s"]
+            .groupby(
+                [fecha] + [df[c] for c in dimensiones],
+                observed=True,
+                dropna=False,
+                sort=True
+            )
+            .agg(["sum", "size"])
+            .rename(columns={"sum": "total_general_s", "size": "filas"})
+            .reset_index()
+        )
+
+        if len(cubo) > MAX_RATIO_CUBO * len(df):
+            return
+
+        # identifica el cubo para los índices de filtros y fechas
+        cubo.attrs["version"] = ("cubo", nivel, df.attrs.get("version"))
+        self.df = cubo
+
+    @property
+    def nbytes(self):
+        if self.df is None:
+            return 0
+        return int(self.df.memory_usage(deep=True).sum())
+
+    def cubre(self, columnas):
+        return self.df is not None and set(columnas) <= self.dimensiones
+
+    def filtrar(self, filtros, mes=None, fechas=None):
+        indice = indice_filtros(self.df)
+        fechas_idx = indice_fechas(self.df)
+
+        mascara = indice.todos()
+
+        if mes is not None:
+            mascara = fechas_idx.mascara(fechas_idx.tramos_mes(mes))
+
+        for col, valores in filtros.items():
+            mascara &= indice.bitmap(col, valores)
+
+        if fechas is not None:
+            mascara &= fechas_idx.mascara(fechas_idx.tramo(fechas[0], fechas[1]))
+
+        return indice.aplicar(self.df, mascara)
+
+
+_cache_cubos = CacheLRU(CACHE_CUBOS_MAX_BYTES, medir=lambda c: c.nbytes)
+
+
+def cubo_datos(df, nivel):
+    version = df.attrs.get("version")
+
+    # sin versión (archivo en memoria) no se arma: solo se usaría una vez
+    if version is None:
+        return None
+
+    clave = (version, len(df), nivel)
+    cubo = _cache_cubos.get(clave)
+
+    if cubo is None:
+        cubo = _cache_cubos.put(clave, Cubo(df, nivel))
+
+    return cubo
+
+
+def datos_agregables(df, df_filtrado, filtros, columnas, mes=None, fechas=None):
+    # Celdas del cubo más chico que resuelva los mismos filtros que
+    # df_filtrado y las columnas a agrupar; si ninguno, las filas crudas
+    columnas = set(filtros) | set(columnas)
+
+    # el cubo mensual sirve si el rango de fechas toma meses enteros
+    if fechas is None:
+        meses = None
+    else:
+        meses = indice_fechas(df).meses_completos(fechas[0], fechas[1])
+
+    if fechas is None or meses is not None:
+        cubo = cubo_datos(df, "mes")
+        if cubo is not None and cubo.cubre(columnas):
+            return cubo.filtrar(filtros, mes=mes, fechas=meses)
+
+    cubo = cubo_datos(df, "dia")
+    if cubo is not None and cubo.cubre(columnas):
+        return cubo.filtrar(filtros, mes=mes, fechas=fechas)
+
+    return df_filtrado
@@ -1,6 +1,38 @@
+import hashlib
+import os
+import shutil
+import threading
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from utils.cache import CacheLRU
+from utils.ingesta import leer_xlsx
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# --------------------------------------------------
+# CACHE DE LIBROS PARSEADOS (COMPARTIDA POR TODAS LAS PÁGINAS)
+# --------------------------------------------------
+# Clave: (ruta absoluta, versión del dataset, tipo).
+# Así cada rerun de Streamlit reutiliza el DataFrame ya normalizado
+# en lugar de volver a parsear el xlsx con openpyxl.
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_cache_df = CacheLRU(CACHE_MAX_BYTES)
+
+# (ruta, mtime_ns, tamaño) -> sha256, para no releer el archivo en cada rerun
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
 def normalizar(col):
     return (
         col.lower()
@@ -9,9 +41,437 @@ def normalizar(col):
         .replace("°", "")
     )
 
-def cargar_excel(archivo):
-    df = pd.read_excel(archivo)
-    df.columns = [normalizar(c) for c in df.columns]
+
+def hash_bytes(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def hash_archivo(ruta):
+    info = os.stat(ruta)
+    firma = (os.path.abspath(ruta), info.st_mtime_ns, info.st_size)
+
+    with _hashes_lock:
+        if firma in _hashes:
+            return _hashes[firma]
+
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    digest = sha.hexdigest()
+
+    with _hashes_lock:
+        # descartar firmas viejas de la misma ruta
+        for otra in [k for k in _hashes if k[0] == firma[0]]:
+            del _hashes[otra]
+        _hashes[firma] = digest
+
+    return digest
+
+
+def invalidar_cache(ruta=None):
+    if ruta is None:
+        _cache_df.limpiar()
+        return
+
+    ruta_abs = os.path.abspath(ruta)
+    _cache_df.invalidar(lambda clave: clave[0] == ruta_abs or _incluye(clave, ruta_abs))
+
+
+def _incluye(clave, ruta_abs):
+    # clave de una concatenación que usa alguna versión de la ruta
+    return clave[0] == "concatenar" and any(v[0] == ruta_abs for v in clave[1])
+
+
+def estadisticas_cache():
+    return _cache_df.estadisticas()
+
+
+# --------------------------------------------------
+# SIDECAR COLUMNAR (PARQUET)
+# --------------------------------------------------
+# Al subir un xlsx se parsea una sola vez y se guarda junto a él un
+# Parquet ya tipado; el xlsx queda solo como original de auditoría.
+# El sidecar guarda el hash del xlsx del que salió para detectar si
+# quedó desactualizado.
+
+META_HASH_ORIGEN = b"flujocaja_hash_origen"
+META_VERSION = b"flujocaja_version"
+
+# Subir este número cuando cambie el formato del sidecar para que los
+# Parquet viejos se regeneren automáticamente
+VERSION_SIDECAR = b"3"
+
+MESES_ES = {
+    1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+    5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+    9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+}
+
+
+def ruta_sidecar(ruta):
+    return os.path.splitext(ruta)[0] + ".parquet"
+
+
+def _sidecar_vigente(ruta):
+    sidecar = ruta_sidecar(ruta)
+
+    if pq is None or not os.path.exists(sidecar):
+        return False
+
+    try:
+        metadata = pq.read_schema(sidecar).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+
+    if metadata.get(META_VERSION) != VERSION_SIDECAR:
+        return False
+
+    origen = metadata.get(META_HASH_ORIGEN, b"").decode()
+    return origen == hash_archivo(ruta)
+
+
+def _escribir_sidecar(df, ruta):
+    if pq is None:
+        return
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(tabla.schema.metadata or {})
+    metadata[META_HASH_ORIGEN] = hash_archivo(ruta).encode()
+    metadata[META_VERSION] = VERSION_SIDECAR
+    tabla = tabla.replace_schema_metadata(metadata)
+
+    # escribir en temporal y renombrar: nunca dejar un Parquet a medias
+    temporal = ruta_sidecar(ruta) + ".tmp"
+    pq.write_table(tabla, temporal)
+    os.replace(temporal, ruta_sidecar(ruta))
+
+
+def _leer_sidecar(ruta):
+    return pd.read_parquet(ruta_sidecar(ruta), engine="pyarrow", memory_map=True)
+
+
+# --------------------------------------------------
+# DATASETS VERSIONADOS
+# --------------------------------------------------
+# Cada archivo subido es una versión inmutable en
+# data/versiones/<dataset>/<id>.xlsx (id = hash del contenido) con su
+# sidecar Parquet al lado. Se escribe, se valida y se convierte aparte;
+# recién entonces se promueve reemplazando el puntero ACTUAL con
+# os.replace (atómico). Un lector nunca ve un libro a medio escribir:
+# lee el puntero una vez y desde ahí trabaja sobre archivos que no
+# cambian, y todo lo derivado en el rerun sale de ese DataFrame (cuya
+# versión va en attrs["version"] y es la clave de todas las caches).
+# La ruta original (data/<archivo>.xlsx) queda como copia publicada de
+# la versión actual, también reemplazada de forma atómica.
+
+CARPETA_VERSIONES = os.path.join("data", "versiones")
+
+# versiones anteriores que se conservan (lectores que aún las usan)
+MAX_VERSIONES = 3
+
+_versiones_lock = threading.Lock()
+
+
+def _carpeta_dataset(ruta):
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(CARPETA_VERSIONES, nombre)
+
+
+def ruta_version(ruta, version):
+    extension = os.path.splitext(ruta)[1]
+    return os.path.join(_carpeta_dataset(ruta), version + extension)
+
+
+def _puntero(ruta):
+    return os.path.join(_carpeta_dataset(ruta), "ACTUAL")
+
+
+def _escribir_atomico(destino, contenido):
+    temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, destino)
+
+
+def _crear_version(ruta, contenido):
+    version = hash_bytes(contenido)[:16]
+    os.makedirs(_carpeta_dataset(ruta), exist_ok=True)
+
+    destino = ruta_version(ruta, version)
+    if not os.path.exists(destino):
+        _escribir_atomico(destino, contenido)
+
+    return version
+
+
+def _promover(ruta, version):
+    # la poda ordena por mtime: una versión vieja que se vuelve a subir
+    # pasa a ser la más reciente
+    os.utime(ruta_version(ruta, version))
+
+    _escribir_atomico(_puntero(ruta), version.encode())
+
+    # copia publicada en la ruta de siempre (su sidecar ya no se usa)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(ruta_version(ruta, version), temporal)
+    os.replace(temporal, ruta)
+
+    if os.path.exists(ruta_sidecar(ruta)):
+        os.remove(ruta_sidecar(ruta))
+
+    _podar_versiones(ruta, version)
+
+
+def _podar_versiones(ruta, actual):
+    # se conservan la actual y las MAX_VERSIONES promovidas más recientes
+    carpeta = _carpeta_dataset(ruta)
+    extension = os.path.splitext(ruta)[1]
+
+    versiones = [
+        e for e in os.scandir(carpeta)
+        if e.name.endswith(extension) and e.name != actual + extension
+    ]
+    versiones.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+
+    for entrada in versiones[MAX_VERSIONES:]:
+        for archivo in [entrada.path, ruta_sidecar(entrada.path)]:
+            try:
+                os.remove(archivo)
+            except OSError:
+                pass
+
+
+def version_actual(ruta):
+    # id de la versión promovida, o None si el dataset no existe
+    try:
+        with open(_puntero(ruta)) as f:
+            return f.read().strip() or None
+    except OSError:
+        pass
+
+    if not os.path.exists(ruta):
+        return None
+
+    # archivo subido antes del registro: se registra tal cual
+    with _versiones_lock:
+        with open(ruta, "rb") as f:
+            version = _crear_version(ruta, f.read())
+
+        # el sidecar vigente sirve igual (mismo contenido)
+        sidecar = ruta_sidecar(ruta_version(ruta, version))
+        if _sidecar_vigente(ruta) and not os.path.exists(sidecar):
+            shutil.copyfile(ruta_sidecar(ruta), sidecar)
+
+        _escribir_atomico(_puntero(ruta), version.encode())
+
+    return version
+
+
+# --------------------------------------------------
+# GUARDAR ARCHIVO SUBIDO
+# --------------------------------------------------
+# El file_uploader conserva el archivo entre reruns; solo se crea una
+# versión (y se promueve) si el contenido realmente cambió. Devuelve las
+# estadísticas de la ingesta, o None si no hubo que procesar nada.
+
+def guardar_archivo(archivo, ruta):
+    contenido = bytes(archivo.getbuffer())
+    version = hash_bytes(contenido)[:16]
+
+    if version == version_actual(ruta) and (
+        pq is None or _sidecar_vigente(ruta_version(ruta, version))
+    ):
+        return None
+
+    with _versiones_lock:
+        _crear_version(ruta, contenido)
+        nueva = ruta_version(ruta, version)
+
+        # validar y convertir antes de promover: si el libro no sirve,
+        # los lectores siguen con la versión anterior
+        try:
+            df, estadisticas = _parsear_excel(nueva)
+        except BaseException:
+            if version != version_actual(ruta):
+                os.remove(nueva)
+            raise
+
+        _escribir_sidecar(df, nueva)
+        _promover(ruta, version)
+
+    # las versiones anteriores ya no las pide nadie nuevo
+    invalidar_cache(ruta)
+    return estadisticas
+
+
+def resumen_ingesta(estadisticas):
+    return (
+        f"Ingesta ({estadisticas['motor']}): {estadisticas['filas']:,} filas "
+        f"en {estadisticas['segundos']:.2f} s "
+        f"({estadisticas['filas_por_segundo']:,.0f} filas/s)"
+    )
+
+
+def eliminar_archivo(ruta):
+    # primero el puntero: los lectores dejan de ver el dataset de una vez
+    with _versiones_lock:
+        for archivo in [_puntero(ruta), ruta, ruta_sidecar(ruta)]:
+            if os.path.exists(archivo):
+                os.remove(archivo)
+
+        shutil.rmtree(_carpeta_dataset(ruta), ignore_errors=True)
+
+    invalidar_cache(ruta)
+
+
+# --------------------------------------------------
+# CARGAR EXCEL
+# --------------------------------------------------
+
+def _limpiar_columnas_mixtas(df):
+    # Columnas con números y textos mezclados no se pueden tipar en
+    # Parquet: se dejan como texto (conservando los vacíos)
+    for col in df.columns:
+        if df[col].dtype == object:
+            tipo = pd.api.types.infer_dtype(df[col], skipna=True)
+            if tipo.startswith("mixed"):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+# --------------------------------------------------
+# CODIFICACIÓN CATEGÓRICA
+# --------------------------------------------------
+# Las columnas de texto con pocos valores distintos (ingresoegreso,
+# costo__gasto, clasificaciones, mes_nombre, tipo_archivo...) se guardan
+# como Categorical: filtros, groupby y máscaras trabajan sobre códigos
+# enteros y el DataFrame ocupa varias veces menos memoria.
+
+MAX_RATIO_CATEGORIAS = 0.5
+
+
+def codificar_categorias(df, max_ratio=MAX_RATIO_CATEGORIAS):
+    if "ingresoegreso" in df.columns:
+        ie = df["ingresoegreso"]
+        if isinstance(ie.dtype, pd.CategoricalDtype):
+            ie = ie.astype(object)
+        df["ingresoegreso"] = ie.where(ie.isna(), ie.astype(str).str.strip().str.upper())
+
+    if "mes_nombre" in df.columns:
+        df["mes_nombre"] = pd.Categorical(
+            df["mes_nombre"], categories=list(MESES_ES.values())
+        )
+
+    for col in df.columns:
+        if df[col].dtype != object or len(df) == 0:
+            continue
+
+        distintos = df[col].nunique(dropna=True)
+        if distintos / len(df) <= max_ratio:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def normalizar_parametros(parametros):
+    # URLs y vistas guardadas cuando ingresoegreso venía como en el Excel
+    # ("Ingreso"): se pasan a mayúsculas igual que en codificar_categorias,
+    # si no quedarían fuera de las opciones del filtro
+    valor = parametros.get("ingresoegreso")
+    if not valor:
+        return parametros
+
+    if isinstance(valor, str):
+        nuevo = ",".join(v.strip().upper() for v in valor.split(","))
+    else:
+        nuevo = [str(v).strip().upper() for v in valor]
+
+    if nuevo != valor:
+        parametros["ingresoegreso"] = nuevo
+    return parametros
+
+
+def concatenar(frames):
+    # Las páginas de comparación concatenan en cada rerun los mismos
+    # libros: el resultado se guarda en la cache con las versiones de
+    # los libros y se entrega sin copiar (no se modifica)
+    versiones = tuple(f.attrs.get("version") for f in frames)
+    if None in versiones:
+        return _concatenar(frames)
+
+    clave = ("concatenar", versiones)
+
+    df = _cache_df.get(clave)
+    if df is None:
+        # descartar concatenaciones con versiones anteriores de los libros
+        rutas = {v[0] for v in versiones}
+        _cache_df.invalidar(
+            lambda c: c[0] == "concatenar" and c != clave
+            and any(v[0] in rutas for v in c[1])
+        )
+        df = _concatenar(frames)
+        df.attrs["version"] = versiones
+        df = _cache_df.put(clave, df)
+
+    return df
+
+
+def _concatenar(frames):
+    # pd.concat pierde el tipo category si las categorías no coinciden:
+    # se unifican antes de concatenar
+    columnas = set().union(*[f.columns for f in frames])
+    frames = [f.copy() for f in frames]
+
+    for col in columnas:
+        tipos = [f[col].dtype for f in frames if col in f.columns]
+        if not all(isinstance(t, pd.CategoricalDtype) for t in tipos):
+            continue
+
+        categorias = pd.Index([])
+        for t in tipos:
+            categorias = categorias.append(t.categories.difference(categorias, sort=False))
+        if col != "mes_nombre":
+            categorias = categorias.sort_values()
+
+        for f in frames:
+            if col in f.columns:
+                f[col] = f[col].cat.set_categories(categorias)
+
+    return ordenar_por_fecha(pd.concat(frames, ignore_index=True))
+
+
+def opciones_columna(serie):
+    # Valores presentes (como texto, ordenados) para los multiselect
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = np.unique(serie.cat.codes.to_numpy())
+        valores = serie.cat.categories.take(codigos[codigos >= 0])
+        return sorted(valores.astype(str))
+
+    return sorted(serie.dropna().astype(str).unique())
+
+
+def ordenar_por_fecha(df):
+    return df.sort_values(
+        "fecha", kind="stable", na_position="last", ignore_index=True
+    )
+
+
+def rellenar_vacios(serie, valor):
+    if not serie.isna().any():
+        return serie
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        if valor not in serie.cat.categories:
+            serie = serie.cat.add_categories([valor])
+        return serie.fillna(valor)
+
+    return serie.astype(object).fillna(valor)
+
+
+def _parsear_excel(archivo):
+    # fecha y total_general_s se convierten por bloques durante la lectura
+    df, estadisticas = leer_xlsx(archivo, normalizar=normalizar)
 
     obligatorias = ["fecha", "total_general_s"]
     for c in obligatorias:
@@ -19,14 +479,66 @@ def cargar_excel(archivo):
             st.error(f"❌ Falta la columna obligatoria: {c}")
             st.stop()
 
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-    df["total_general_s"] = (
-        df["total_general_s"]
-        .astype(str)
-        .str.replace(",", "", regex=False)
-        .astype(float)
+    df["anio_mes"] = df["fecha"].dt.to_period("M").astype(str)
+    df["mes_num"] = df["fecha"].dt.month
+    df["mes_nombre"] = df["mes_num"].map(MESES_ES)
+
+    df = codificar_categorias(_limpiar_columnas_mixtas(df))
+
+    # Ordenado por fecha: los rangos de fechas y de mes se resuelven con
+    # búsqueda binaria (ver utils/indice.IndiceFechas)
+    df = ordenar_por_fecha(df)
+
+    return df, estadisticas
+
+
+def _aplicar_tipo(df, tipo):
+    if tipo is None:
+        return df
+
+    df = df.dropna(subset=["fecha"])
+    df["tipo_archivo"] = pd.Categorical.from_codes(
+        np.zeros(len(df), dtype="int8"), categories=[tipo]
     )
+    return df
 
-    df["anio_mes"] = df["fecha"].dt.to_period("M").astype(str)
 
+def _cargar_normalizado(ruta):
+    if _sidecar_vigente(ruta):
+        return _leer_sidecar(ruta)
+
+    # xlsx subido antes de existir el sidecar: convertirlo ahora
+    df, _ = _parsear_excel(ruta)
+    _escribir_sidecar(df, ruta)
+    return df
+
+
+def cargar_excel(archivo, tipo=None):
+
+    # Archivos en memoria (UploadedFile) no se cachean
+    if not isinstance(archivo, (str, os.PathLike)):
+        return _aplicar_tipo(_parsear_excel(archivo)[0], tipo)
+
+    # el puntero se lee una sola vez: todo el rerun queda fijado a esta
+    # versión aunque en el medio se suba otra
+    version = version_actual(archivo)
+    if version is None:
+        raise FileNotFoundError(archivo)
+
+    clave = (os.path.abspath(archivo), version, tipo)
+
+    df = _cache_df.get(clave)
+    if df is None:
+        # descartar versiones anteriores del mismo archivo
+        _cache_df.invalidar(
+            lambda c: c[0] == clave[0] and c[1] != clave[1]
+        )
+        df = _aplicar_tipo(_cargar_normalizado(ruta_version(archivo, version)), tipo)
+
+        # identifica el contenido cargado para los índices y caches derivados
+        df.attrs["version"] = clave
+        df = _cache_df.put(clave, df)
+
+    # El DataFrame cacheado se entrega tal cual: las páginas no lo
+    # modifican (filtran con iloc y agregan sobre copias)
     return df
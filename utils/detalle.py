@@ -0,0 +1,121 @@
+import math
+
+import numpy as np
+import streamlit as st
+
+from utils.resultados import obtener_resultado, guardar_resultado
+
+# --------------------------------------------------
+# DETALLE PAGINADO
+# --------------------------------------------------
+# "Ver detalle completo" mandaba todo df_filtrado al navegador (Arrow)
+# en cada rerun, aunque el expander estuviera cerrado: con un libro de
+# 200k filas el websocket quedaba ocupado para todos. Ahora el detalle
+# se arma solo cuando el usuario lo abre y se envía de a una página:
+# el orden y las columnas se resuelven aquí, sobre las filas ya
+# filtradas, y ninguna página pasa de MAX_BYTES_PAGINA.
+
+FILAS_POR_PAGINA = [100, 500, 1000, 5000]
+
+# tope de lo que se envía por rerun (memoria de pandas como referencia)
+MAX_BYTES_PAGINA = 4 * 1024 * 1024
+
+# filas que se miden para estimar el peso de una fila
+MUESTRA_BYTES = 200
+
+
+def _orden(df, columna, ascendente, clave):
+    # posiciones de df ordenadas por la columna (vacíos al final); se
+    # guardan con los resultados de la vista para no reordenar al
+    # cambiar de página
+    etapa = ("detalle_orden", columna, ascendente)
+
+    posiciones = obtener_resultado(clave, etapa)
+    if posiciones is None:
+        serie = df[columna].reset_index(drop=True)
+        posiciones = serie.sort_values(
+            ascending=ascendente, kind="stable", na_position="last"
+        ).index.to_numpy()
+        guardar_resultado(clave, etapa, posiciones)
+
+    return posiciones
+
+
+def _filas_por_pagina(df, columnas, pedidas):
+    # baja las filas pedidas si la página pasaría de MAX_BYTES_PAGINA
+    muestra = df.iloc[:MUESTRA_BYTES][columnas]
+    if muestra.empty:
+        return pedidas
+
+    por_fila = muestra.memory_usage(deep=True, index=True).sum() / len(muestra)
+    return max(1, min(pedidas, int(MAX_BYTES_PAGINA // max(por_fila, 1))))
+
+
+def _primera_pagina(key):
+    st.session_state[f"{key}_pagina"] = 1
+
+
+@st.fragment
+def detalle_paginado(df, clave=None, etiqueta="🔍 Ver detalle completo", key="detalle"):
+    # Fragmento: abrir, ordenar o cambiar de página vuelve a ejecutar solo
+    # el detalle. `clave`: clave de la etapa de filtros (None: el orden no
+    # se cachea)
+    if not st.toggle(etiqueta, key=f"{key}_abierto"):
+        return
+
+    with st.container(border=True):
+
+        if df.empty:
+            st.info("No hay filas para los filtros seleccionados.")
+            return
+
+        todas = list(df.columns)
+
+        c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+
+        columnas = c1.multiselect(
+            "Columnas", todas, default=todas, key=f"{key}_columnas"
+        ) or todas
+
+        orden = c2.selectbox(
+            "Ordenar por", ["(sin orden)"] + todas, key=f"{key}_orden",
+            on_change=_primera_pagina, args=(key,)
+        )
+
+        ascendente = c3.selectbox(
+            "Sentido", ["Asc", "Desc"], key=f"{key}_sentido",
+            on_change=_primera_pagina, args=(key,)
+        ) == "Asc"
+
+        pedidas = c4.selectbox(
+            "Filas", FILAS_POR_PAGINA, key=f"{key}_filas",
+            on_change=_primera_pagina, args=(key,)
+        )
+
+        filas = _filas_por_pagina(df, columnas, pedidas)
+        paginas = max(1, math.ceil(len(df) / filas))
+
+        # con otros filtros puede haber menos páginas que antes
+        clave_pagina = f"{key}_pagina"
+        if st.session_state.get(clave_pagina, 1) > paginas:
+            st.session_state[clave_pagina] = paginas
+
+        pagina = st.number_input(
+            f"Página (de {paginas:,})", min_value=1, max_value=paginas,
+            step=1, key=clave_pagina
+        )
+
+        inicio = (pagina - 1) * filas
+        fin = min(inicio + filas, len(df))
+
+        if orden == "(sin orden)":
+            posiciones = np.arange(inicio, fin)
+        else:
+            posiciones = _orden(df, orden, ascendente, clave)[inicio:fin]
+
+        st.dataframe(df.iloc[posiciones][columnas], use_container_width=True)
+
+        nota = f"Filas {inicio + 1:,}–{fin:,} de {len(df):,}"
+        if filas < pedidas:
+            nota += f" · páginas de {filas:,} filas para no superar el límite de envío"
+        st.caption(nota)
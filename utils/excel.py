@@ -0,0 +1,162 @@
+import io
+
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# --------------------------------------------------
+# EXCEL EN STREAMING
+# --------------------------------------------------
+# Con xlsxwriter en modo constant_memory cada fila se vuelca al archivo
+# apenas se escribe: el libro no se arma entero en memoria y las hojas
+# grandes se recorren en bloques de FILAS_BLOQUE. Los montos se guardan
+# como números con formato de celda ("S/ 1,234.00" en pantalla, pero
+# sumables en Excel) en lugar de textos armados en Python.
+# Sin xlsxwriter se usa openpyxl (más lento, mismo resultado).
+
+FORMATO_MONEDA = '"S/ "#,##0.00'
+FORMATO_PORCENTAJE = '#,##0.00" %"'  # los % ya vienen multiplicados por 100
+FORMATO_FECHA = "dd/mm/yyyy"
+
+FILAS_BLOQUE = 20000
+
+# Un detalle con más filas no va como hoja: se exporta aparte en
+# FORMATO_DETALLE_GRANDE ("csv" o "parquet") junto al Excel
+MAX_FILAS_DETALLE_EXCEL = 200000
+FORMATO_DETALLE_GRANDE = "csv"
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _avanzar(avance, fraccion, texto):
+    if avance is not None:
+        avance(fraccion, texto)
+
+
+def _valores_celda(serie):
+    # objetos de Python para write_row; los vacíos quedan como celda vacía
+    valores = serie.astype(object).to_numpy()
+    valores[serie.isna().to_numpy()] = None
+    return valores
+
+
+class LibroExcel:
+
+    def __init__(self, destino):
+        self._xlsxwriter = xlsxwriter is not None
+
+        if self._xlsxwriter:
+            self._libro = xlsxwriter.Workbook(destino, {
+                "constant_memory": True,
+                # textos tal cual: nada de fórmulas ni links por accidente
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+            })
+            self._formatos = {
+                "moneda": self._libro.add_format({"num_format": FORMATO_MONEDA}),
+                "porcentaje": self._libro.add_format({"num_format": FORMATO_PORCENTAJE}),
+                "fecha": self._libro.add_format({"num_format": FORMATO_FECHA}),
+            }
+            # mismo encabezado que pandas.to_excel
+            self._encabezado = self._libro.add_format({
+                "bold": True, "border": 1, "align": "center", "valign": "top"
+            })
+        else:
+            self._libro = pd.ExcelWriter(destino, engine="openpyxl")
+            self._formatos = {
+                "moneda": FORMATO_MONEDA,
+                "porcentaje": FORMATO_PORCENTAJE,
+                "fecha": FORMATO_FECHA,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def _formato(self, serie, columna, moneda, porcentaje):
+        if columna in moneda:
+            return "moneda"
+        if columna in porcentaje:
+            return "porcentaje"
+        if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+            return "fecha"
+        return None
+
+    def hoja(self, nombre, df, moneda=(), porcentaje=(), avance=None):
+        formatos = [
+            self._formato(df.iloc[:, i], col, moneda, porcentaje)
+            for i, col in enumerate(df.columns)
+        ]
+
+        if not self._xlsxwriter:
+            df.to_excel(self._libro, sheet_name=nombre, index=False)
+            hoja = self._libro.sheets[nombre]
+            for i, formato in enumerate(formatos):
+                if formato is None:
+                    continue
+                for (celda,) in hoja.iter_rows(min_row=2, min_col=i + 1, max_col=i + 1):
+                    celda.number_format = self._formatos[formato]
+            return
+
+        hoja = self._libro.add_worksheet(nombre)
+
+        # el formato de columna se aplica a las celdas escritas sin formato
+        for i, formato in enumerate(formatos):
+            if formato is not None:
+                hoja.set_column(i, i, None, self._formatos[formato])
+
+        hoja.write_row(0, 0, [str(c) for c in df.columns], self._encabezado)
+
+        total = len(df)
+        for inicio in range(0, total, FILAS_BLOQUE):
+            bloque = df.iloc[inicio:inicio + FILAS_BLOQUE]
+            columnas = [_valores_celda(bloque.iloc[:, i]) for i in range(bloque.shape[1])]
+
+            for fila, valores in enumerate(zip(*columnas), start=inicio + 1):
+                hoja.write_row(fila, 0, valores)
+
+            _avanzar(avance, min(inicio + FILAS_BLOQUE, total) / total, f"Hoja {nombre}")
+
+    def cerrar(self):
+        self._libro.close()
+
+
+# --------------------------------------------------
+# DETALLE GRANDE: CSV / PARQUET
+# --------------------------------------------------
+
+def formato_detalle(filas):
+    # None: el detalle entra como hoja del Excel
+    if filas <= MAX_FILAS_DETALLE_EXCEL:
+        return None
+    if FORMATO_DETALLE_GRANDE == "parquet" and pyarrow is not None:
+        return "parquet"
+    return "csv"
+
+
+def escribir_detalle(zipf, nombre, df, formato, avance=None):
+    # Se escribe directo dentro del ZIP, por bloques
+    if formato == "parquet":
+        with zipf.open(f"{nombre}.parquet", "w", force_zip64=True) as archivo:
+            df.to_parquet(archivo, index=False, row_group_size=FILAS_BLOQUE)
+        return
+
+    total = len(df)
+    with zipf.open(f"{nombre}.csv", "w", force_zip64=True) as archivo:
+        # utf-8-sig: Excel abre los acentos bien
+        with io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="") as texto:
+            for inicio in range(0, max(total, 1), FILAS_BLOQUE):
+                df.iloc[inicio:inicio + FILAS_BLOQUE].to_csv(
+                    texto, header=inicio == 0, index=False
+                )
+                _avanzar(avance, min(inicio + FILAS_BLOQUE, total) / max(total, 1), f"{nombre}.csv")
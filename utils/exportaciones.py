@@ -0,0 +1,450 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+from utils.imagenes import hash_figura, metricas_renderizador
+from utils.proceso_exportacion import ContextoExportacion, calentar, iniciar_proceso
+
+# --------------------------------------------------
+# EXPORTACIONES EN SEGUNDO PLANO
+# --------------------------------------------------
+# openpyxl, ReportLab y kaleido son CPU puro: un Excel con todo el
+# detalle bloqueaba el hilo del script varios segundos y frenaba las
+# sesiones de los demás usuarios. Las exportaciones se encolan en un
+# pool de procesos con pocos workers (MAX_PROCESOS) y prioridad baja,
+# así una ráfaga de descargas no le quita CPU a los reruns. El archivo
+# queda en data/exports con nombre = clave de la vista y sirve a
+# cualquier sesión hasta que vence (TTL_EXPORTACIONES).
+
+CARPETA_EXPORTACIONES = os.path.join("data", "exports")
+
+TTL_EXPORTACIONES = 60 * 60  # segundos
+
+# dejar al menos un núcleo libre para Streamlit
+MAX_PROCESOS = max(1, min(2, (os.cpu_count() or 1) - 1))
+
+# trabajos pendientes (en cola + generando) en todo el servidor
+MAX_PENDIENTES = 8
+
+# cada cuánto se refresca la barra de progreso
+INTERVALO_PROGRESO = 1  # segundos
+
+_pool = None
+_calentado = False
+_trabajos = {}
+_lock = threading.Lock()
+
+# trabajos que fallaron (ruta -> mensaje), hasta que alguien los ve
+_errores = {}
+
+# métricas de kaleido de cada worker (pid -> metricas_renderizador)
+_renderizadores = {}
+
+
+# --------------------------------------------------
+# CLAVE DE LA VISTA
+# --------------------------------------------------
+
+def _actualizar(sha, parte):
+    if isinstance(parte, pd.DataFrame):
+        sha.update(repr(list(parte.columns)).encode())
+        sha.update(pd.util.hash_pandas_object(parte, index=True).to_numpy().tobytes())
+    elif isinstance(parte, np.ndarray):
+        sha.update(parte.tobytes())
+    elif hasattr(parte, "to_plotly_json"):
+        sha.update(hash_figura(parte).encode())
+    else:
+        sha.update(repr(parte).encode())
+
+    # separador: ("ab", "c") y ("a", "bc") no deben coincidir
+    sha.update(b"\x00")
+
+
+def clave_vista(*partes):
+    # Identifica una exportación por todo lo que la define: tablas,
+    # figuras, KPIs, versión del dataset, máscara de filtros...
+    sha = hashlib.sha256()
+    for parte in partes:
+        _actualizar(sha, parte)
+    return sha.hexdigest()
+
+
+# --------------------------------------------------
+# PROCESOS DE EXPORTACIÓN
+# --------------------------------------------------
+
+class _Figura:
+
+    # las figuras de Plotly viajan como JSON: pickle no las reconstruye
+    # igual y cambiaría el render
+    def __init__(self, fig):
+        self.json = fig.to_json()
+
+
+def _empacar(valor):
+    if hasattr(valor, "to_plotly_json"):
+        return _Figura(valor)
+    return valor
+
+
+def _desempacar(valor):
+    if isinstance(valor, _Figura):
+        return pio.from_json(valor.json)
+    return valor
+
+
+def _escribir(ruta, contenido):
+    # escritura atómica: nadie lee un archivo a medio escribir
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _ejecutar(funcion, args, kwargs, ruta):
+    # corre dentro del worker
+    progreso = ruta + ".progreso"
+
+    def avance(fraccion, texto):
+        _escribir(progreso, f"{fraccion}|{texto}".encode())
+
+    args = [_desempacar(a) for a in args]
+    kwargs = {k: _desempacar(v) for k, v in kwargs.items()}
+
+    resultado = funcion(*args, avance=avance, **kwargs)
+
+    if isinstance(resultado, str):
+        # el generador escribió un temporal (reporte grande): se mueve
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        shutil.move(resultado, temporal)
+        os.replace(temporal, ruta)
+    else:
+        _escribir(ruta, resultado)
+
+    if os.path.exists(progreso):
+        os.remove(progreso)
+
+    return os.getpid(), metricas_renderizador()
+
+
+def _mensaje_error(futuro):
+    # None si el trabajo terminó bien
+    if futuro.cancelled():
+        return "Cancelada"
+    error = futuro.exception()
+    if error is None:
+        return None
+    return str(error) or type(error).__name__
+
+
+def _terminar(ruta, futuro):
+    # un trabajo con error sale de la cola (no cuenta como pendiente);
+    # el mensaje queda para la sesión que lo esté siguiendo
+    mensaje = _mensaje_error(futuro)
+    if mensaje is not None:
+        with _lock:
+            if _trabajos.get(ruta) is futuro:
+                del _trabajos[ruta]
+                _errores[ruta] = mensaje
+        return
+
+    _registrar(futuro)
+
+
+def _registrar(futuro):
+    if futuro.cancelled() or futuro.exception() is not None:
+        return
+    pid, metricas = futuro.result()
+    with _lock:
+        _renderizadores[pid] = metricas
+
+
+def _como_bytes(resultado):
+    if not isinstance(resultado, str):
+        return resultado
+
+    with open(resultado, "rb") as f:
+        contenido = f.read()
+    os.remove(resultado)
+    return contenido
+
+
+def _pool_exportaciones(reiniciar=False):
+    # Lo crea el calentamiento (o la primera exportación, si el pool se
+    # rompió); se llama con _lock tomado
+    global _pool
+
+    if reiniciar and _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _renderizadores.clear()
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=MAX_PROCESOS,
+            # arrancan con utils.proceso_exportacion como __main__, no
+            # con la página
+            mp_context=ContextoExportacion(),
+            initializer=iniciar_proceso
+        )
+
+    return _pool
+
+
+def _calentar():
+    with _lock:
+        pool = _pool_exportaciones()
+
+    # un trabajo vacío por worker: cada uno arranca y calienta su Chromium
+    try:
+        futuros = [pool.submit(calentar) for _ in range(MAX_PROCESOS)]
+    except (BrokenProcessPool, RuntimeError):
+        return
+
+    for futuro in futuros:
+        futuro.add_done_callback(_registrar)
+
+
+def calentar_exportaciones():
+    # La primera página con exportaciones arranca los workers en segundo
+    # plano: así la primera descarga del servidor no espera el arranque
+    # de Chromium (~1.5 s por worker). Se paga con MAX_PROCESOS procesos
+    # y sus Chromium vivos aunque nadie llegue a exportar
+    global _calentado
+
+    with _lock:
+        if _calentado:
+            return
+        _calentado = True
+
+    threading.Thread(target=_calentar, name="calentar-exportaciones", daemon=True).start()
+
+
+# --------------------------------------------------
+# CACHE EN DISCO
+# --------------------------------------------------
+
+def _ruta(clave, extension):
+    return os.path.join(CARPETA_EXPORTACIONES, clave + extension)
+
+
+def _vigente(ruta):
+    try:
+        return time.time() - os.path.getmtime(ruta) < TTL_EXPORTACIONES
+    except OSError:
+        return False
+
+
+def limpiar_exportaciones():
+    # borra los archivos vencidos (y restos de trabajos interrumpidos)
+    if not os.path.isdir(CARPETA_EXPORTACIONES):
+        return
+
+    with _lock:
+        en_curso = [r for r, f in _trabajos.items() if not f.done()]
+
+    for nombre in os.listdir(CARPETA_EXPORTACIONES):
+        ruta = os.path.join(CARPETA_EXPORTACIONES, nombre)
+
+        if any(ruta.startswith(r) for r in en_curso):
+            continue
+
+        if not _vigente(ruta):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+# --------------------------------------------------
+# COLA DE TRABAJOS
+# --------------------------------------------------
+
+def encolar_exportacion(clave, extension, funcion, *args, **kwargs):
+    # Devuelve False si la cola está llena
+    ruta = _ruta(clave, extension)
+
+    with _lock:
+        futuro = _trabajos.get(ruta)
+        if futuro is not None and not futuro.done():
+            return True
+
+        if _vigente(ruta):
+            return True
+
+        pendientes = sum(not f.done() for f in _trabajos.values())
+        if pendientes >= MAX_PENDIENTES:
+            return False
+
+        os.makedirs(CARPETA_EXPORTACIONES, exist_ok=True)
+
+        args = [_empacar(a) for a in args]
+        kwargs = {k: _empacar(v) for k, v in kwargs.items()}
+
+        try:
+            futuro = _pool_exportaciones().submit(_ejecutar, funcion, args, kwargs, ruta)
+        except BrokenProcessPool:
+            # un worker murió (p. ej. sin memoria): se arma un pool nuevo
+            futuro = _pool_exportaciones(reiniciar=True).submit(
+                _ejecutar, funcion, args, kwargs, ruta
+            )
+
+        _trabajos[ruta] = futuro
+        _errores.pop(ruta, None)
+
+    # fuera del lock: si ya terminó, el callback corre en este hilo
+    futuro.add_done_callback(lambda f: _terminar(ruta, f))
+    limpiar_exportaciones()
+    return True
+
+
+def estado_exportacion(clave, extension):
+    ruta = _ruta(clave, extension)
+
+    with _lock:
+        if ruta in _errores:
+            return {"estado": "error", "mensaje": _errores.pop(ruta)}
+
+        futuro = _trabajos.get(ruta)
+
+        if futuro is not None and futuro.done():
+            # terminó y el callback todavía no corrió
+            del _trabajos[ruta]
+            mensaje = _mensaje_error(futuro)
+            if mensaje is not None:
+                return {"estado": "error", "mensaje": mensaje}
+            futuro = None
+
+    if futuro is None:
+        if _vigente(ruta):
+            return {"estado": "listo", "ruta": ruta}
+        return {"estado": None}
+
+    if not futuro.running():
+        return {"estado": "en_cola", "progreso": 0.0, "texto": "En cola"}
+
+    fraccion, texto = 0.0, "Generando"
+    try:
+        with open(ruta + ".progreso", encoding="utf-8") as f:
+            leido, texto_leido = f.read().split("|", 1)
+        fraccion, texto = float(leido), texto_leido
+    except (OSError, ValueError):
+        pass
+
+    return {"estado": "generando", "progreso": fraccion, "texto": texto}
+
+
+def estadisticas_exportaciones():
+    with _lock:
+        pendientes = sum(not f.done() for f in _trabajos.values())
+        renderizadores = dict(_renderizadores)
+
+    archivos = []
+    if os.path.isdir(CARPETA_EXPORTACIONES):
+        archivos = [
+            os.path.join(CARPETA_EXPORTACIONES, n)
+            for n in os.listdir(CARPETA_EXPORTACIONES)
+        ]
+
+    return {
+        "procesos": MAX_PROCESOS,
+        "pendientes": pendientes,
+        "archivos": len(archivos),
+        "bytes": sum(os.path.getsize(r) for r in archivos if os.path.isfile(r)),
+        "renderizadores": renderizadores,
+    }
+
+
+def resumen_exportaciones(estadisticas):
+    metricas = estadisticas["renderizadores"].values()
+    renders = sum(m["renders"] for m in metricas)
+    arranques = [m["ms_arranque"] for m in metricas if m["ms_arranque"] is not None]
+
+    texto = (
+        f"Exportaciones: {len(arranques)}/{estadisticas['procesos']} "
+        f"workers con kaleido caliente, {estadisticas['pendientes']} pendientes, "
+        f"{estadisticas['archivos']} archivos en disco"
+    )
+    if arranques:
+        texto += f" · arranque de Chromium {max(arranques):,.0f} ms"
+    if renders:
+        ms_total = sum(m["ms_total"] for m in metricas)
+        ms_max = max(m["ms_max"] for m in metricas)
+        texto += f" · {renders} renders, {ms_total / renders:,.0f} ms promedio, {ms_max:,.0f} ms máximo"
+    return texto
+
+
+# --------------------------------------------------
+# BOTÓN DE EXPORTACIÓN
+# --------------------------------------------------
+
+def _seguimiento(clave, extension, etiqueta):
+    actual = estado_exportacion(clave, extension)
+
+    # terminó (o falló): el rerun completo muestra el botón que corresponde
+    if actual["estado"] not in ("en_cola", "generando"):
+        st.rerun()
+
+    st.progress(
+        min(max(actual["progreso"], 0.0), 1.0),
+        text=f"{etiqueta}: {actual['texto']}"
+    )
+
+
+def boton_exportacion(etiqueta, nombre_archivo, mime, clave, funcion, *args, **kwargs):
+    # "Preparar" encola el trabajo, una barra muestra el avance y al
+    # terminar aparece el download_button con el archivo del disco
+    extension = os.path.splitext(nombre_archivo)[1]
+
+    calentar_exportaciones()
+
+    # dos páginas con la misma vista no comparten archivo
+    clave = clave_vista(clave, nombre_archivo)
+    actual = estado_exportacion(clave, extension)
+
+    if actual["estado"] == "listo":
+
+        ruta = actual["ruta"]
+
+        def leer():
+            # si venció entre el render y el click se arma aquí mismo
+            try:
+                with open(ruta, "rb") as f:
+                    return f.read()
+            except OSError:
+                return _como_bytes(funcion(*args, **kwargs))
+
+        st.download_button(
+            label=etiqueta,
+            data=leer,
+            file_name=nombre_archivo,
+            mime=mime
+        )
+        return
+
+    if actual["estado"] is None or actual["estado"] == "error":
+
+        if actual["estado"] == "error":
+            st.error(f"No se pudo generar {nombre_archivo}: {actual['mensaje']}")
+
+        # el botón se quita al hacer click: mientras corre el trabajo solo
+        # se refresca el fragmento, no la página
+        hueco = st.empty()
+        if not hueco.button(f"⚙️ Preparar: {etiqueta}", key=f"preparar_{nombre_archivo}"):
+            return
+        hueco.empty()
+
+        if not encolar_exportacion(clave, extension, funcion, *args, **kwargs):
+            st.warning("Hay muchas exportaciones en curso. Intenta de nuevo en unos segundos.")
+            return
+
+    st.fragment(run_every=INTERVALO_PROGRESO)(_seguimiento)(clave, extension, etiqueta)
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 
+from utils.indice import indice_fechas, indice_filtros
+
 def aplicar_filtros(df):
 
     st.sidebar.header("🎛️ Configuración de filtros")
@@ -18,11 +20,12 @@ def aplicar_filtros(df):
     st.sidebar.divider()
     st.sidebar.subheader("🔍 Filtros")
 
-    df_filtrado = df.copy()
+    indice = indice_filtros(df)
+    mascara = indice.todos()
 
     for col in columnas_filtro:
 
-        valores = sorted(df_filtrado[col].dropna().unique())
+        valores = indice.opciones(col, mascara)
         key = f"filtro_{col}"
 
         opciones = ["Todos"] + valores
@@ -43,13 +46,11 @@ def aplicar_filtros(df):
         )
 
         if st.session_state[key]:
-            df_filtrado = df_filtrado[
-                df_filtrado[col].isin(st.session_state[key])
-            ]
+            mascara &= indice.bitmap(col, st.session_state[key])
 
-    # Filtro fecha
-    fecha_min = df_filtrado["fecha"].min()
-    fecha_max = df_filtrado["fecha"].max()
+    # Filtro fecha: extremos y rango salen del índice ordenado de fechas
+    fechas_idx = indice_fechas(df)
+    fecha_min, fecha_max = fechas_idx.extremos(mascara)
 
     fechas = st.sidebar.date_input(
         "Rango de fechas",
@@ -59,9 +60,8 @@ def aplicar_filtros(df):
     )
 
     if len(fechas) == 2:
-        df_filtrado = df_filtrado[
-            (df_filtrado["fecha"] >= pd.to_datetime(fechas[0])) &
-            (df_filtrado["fecha"] <= pd.to_datetime(fechas[1]))
-        ]
+        mascara &= fechas_idx.mascara(fechas_idx.tramo(fechas[0], fechas[1]))
+
+    df_filtrado = indice.aplicar(df, mascara)
 
     return df_filtrado, columnas_filtro
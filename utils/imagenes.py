@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+try:
+    import kaleido
+except ImportError:
+    kaleido = None
+
+from utils.cache import CacheLRU
+
+# --------------------------------------------------
+# CACHE DE IMÁGENES DE GRÁFICOS (KALEIDO)
+# --------------------------------------------------
+# Renderizar con kaleido es lo más caro de cada rerun. La imagen se
+# guarda con clave = hash del JSON de la figura + formato y tamaño, así
+# el ZIP, el PDF y el PNG suelto reutilizan el mismo render mientras la
+# vista no cambie. Compartida por todas las sesiones, LRU por bytes.
+
+CACHE_IMAGENES_MAX_BYTES = 64 * 1024 * 1024
+
+_cache_imagenes = CacheLRU(CACHE_IMAGENES_MAX_BYTES, medir=len)
+
+# --------------------------------------------------
+# RENDERIZADOR PERSISTENTE
+# --------------------------------------------------
+# El scope de kaleido mantiene un Chromium vivo por proceso, pero lo
+# arranca en el primer render (~1.5 s contra ~0.1 s de un render en
+# caliente). `calentar_renderizador` lo arranca de antemano con una
+# figura mínima: los procesos de exportación lo llaman al iniciar, así
+# cada worker del pool es un renderizador caliente que se reutiliza en
+# todas las descargas. kaleido atiende un pedido a la vez por proceso;
+# la concurrencia la dan los workers (un Chromium cada uno).
+
+_metricas = {
+    "renders": 0,
+    "ms_total": 0.0,
+    "ms_max": 0.0,
+    "ms_ultimo": 0.0,
+    "ms_arranque": None,
+}
+_lock_metricas = threading.Lock()
+
+
+def hash_figura(fig):
+    return hashlib.sha256(fig.to_json().encode()).hexdigest()
+
+
+def _parametros(formato, width, height, scale):
+    # sin valor explícito kaleido usa los defaults del scope: entran en
+    # la clave porque las páginas los configuran distinto
+    scope = pio.kaleido.scope
+    return (
+        formato or scope.default_format,
+        width or scope.default_width,
+        height or scope.default_height,
+        scale or scope.default_scale,
+    )
+
+
+def parametros_imagen(formato="png", width=None, height=None, scale=None):
+    # Resuelve los parámetros con el scope de este proceso, para que un
+    # proceso de exportación (con su propio scope) renderice igual
+    formato, width, height, scale = _parametros(formato, width, height, scale)
+    return {"formato": formato, "width": width, "height": height, "scale": scale}
+
+
+def _renderizar(fig, parametros):
+    formato, width, height, scale = parametros
+
+    inicio = time.perf_counter()
+    imagen = fig.to_image(
+        format=formato,
+        width=width,
+        height=height,
+        scale=scale,
+        engine="kaleido"
+    )
+    ms = (time.perf_counter() - inicio) * 1000
+
+    with _lock_metricas:
+        # el primer render del proceso incluye el arranque de Chromium
+        if _metricas["ms_arranque"] is None:
+            _metricas["ms_arranque"] = ms
+        else:
+            _metricas["renders"] += 1
+            _metricas["ms_total"] += ms
+            _metricas["ms_max"] = max(_metricas["ms_max"], ms)
+        _metricas["ms_ultimo"] = ms
+
+    return imagen
+
+
+def calentar_renderizador():
+    if kaleido is None or _metricas["ms_arranque"] is not None:
+        return
+    try:
+        _renderizar(go.Figure(), ("png", 10, 10, 1))
+    except Exception:
+        # sin Chromium utilizable: el error sale en la exportación
+        pass
+
+
+def imagenes_figuras(figs, formato="png", width=None, height=None, scale=None):
+    # Lote: las figuras repetidas o ya en cache no se renderizan; las
+    # que faltan pasan seguidas por el mismo Chromium caliente
+    parametros = _parametros(formato, width, height, scale)
+    claves = [(hash_figura(fig),) + parametros for fig in figs]
+
+    imagenes = {}
+    for fig, clave in zip(figs, claves):
+        if clave in imagenes:
+            continue
+
+        imagen = _cache_imagenes.get(clave)
+        if imagen is None:
+            imagen = _renderizar(fig, parametros)
+            _cache_imagenes.put(clave, imagen)
+        imagenes[clave] = imagen
+
+    return [imagenes[clave] for clave in claves]
+
+
+def imagen_figura(fig, formato="png", width=None, height=None, scale=None):
+    return imagenes_figuras([fig], formato, width, height, scale)[0]
+
+
+def kaleido_disponible():
+    return kaleido is not None
+
+
+def metricas_renderizador():
+    with _lock_metricas:
+        metricas = dict(_metricas)
+
+    renders = metricas["renders"]
+    metricas["ms_promedio"] = metricas["ms_total"] / renders if renders else 0.0
+    return metricas
+
+
+def estadisticas_imagenes():
+    return {**_cache_imagenes.estadisticas(), "renderizador": metricas_renderizador()}
@@ -0,0 +1,325 @@
+import sys
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import CacheLRU
+from utils.data_loader import MESES_ES
+
+# --------------------------------------------------
+# ÍNDICE DE BITMAPS PARA LOS FILTROS EN CASCADA
+# --------------------------------------------------
+# Se construye una vez por dataset cargado: para cada (columna, valor)
+# guarda un bitmap empaquetado (1 bit por fila). Los filtros en cascada
+# pasan a ser ANDs de bitmaps y las opciones de cada multiselect se
+# obtienen del bitmap ya intersectado, sin copiar el DataFrame en cada
+# paso. Solo al final se materializan las filas que quedaron.
+
+# Por encima de esta cantidad de valores distintos no se guardan
+# bitmaps por valor: se usan los códigos directamente
+MAX_BITMAPS_COLUMNA = 512
+
+CACHE_INDICES_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _Columna:
+
+    def __init__(self, serie):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            etiquetas = serie.cat.categories.astype(str)
+        else:
+            codigos, valores = pd.factorize(serie)
+            etiquetas = pd.Index(valores).astype(str)
+            codigos = codigos.astype(np.min_scalar_type(-len(valores) - 1))
+
+        self.codigos = codigos
+        self.etiquetas = np.asarray(etiquetas, dtype=object)
+
+        # el mismo texto puede venir de valores distintos (1 y "1")
+        self.codigos_por_etiqueta = {}
+        for codigo, etiqueta in enumerate(self.etiquetas):
+            self.codigos_por_etiqueta.setdefault(etiqueta, []).append(codigo)
+
+        # las etiquetas son objetos de Python: el arreglo, los textos y
+        # el diccionario (las claves son los mismos textos) se miden aparte
+        self._bytes_etiquetas = (
+            self.etiquetas.nbytes
+            + sum(sys.getsizeof(e) for e in self.etiquetas)
+            + sys.getsizeof(self.codigos_por_etiqueta)
+            + sum(sys.getsizeof(c) for c in self.codigos_por_etiqueta.values())
+        )
+
+        self._matriz = None
+        self._lock = threading.Lock()
+
+    # Bitmaps por valor (k x n/8 bytes), solo la primera vez que se
+    # filtra por la columna
+    @property
+    def matriz(self):
+        if self._matriz is None and len(self.etiquetas) <= MAX_BITMAPS_COLUMNA:
+            with self._lock:
+                if self._matriz is None:
+                    matriz = np.empty(
+                        (len(self.etiquetas), (len(self.codigos) + 7) // 8),
+                        dtype=np.uint8
+                    )
+                    for codigo in range(len(self.etiquetas)):
+                        matriz[codigo] = np.packbits(self.codigos == codigo)
+                    self._matriz = matriz
+        return self._matriz
+
+    @property
+    def nbytes(self):
+        total = self.codigos.nbytes + self._bytes_etiquetas
+        if self._matriz is not None:
+            total += self._matriz.nbytes
+        return total
+
+
+class IndiceFiltros:
+
+    # Los códigos de una columna se calculan la primera vez que se filtra
+    # por ella o se piden sus opciones (fecha, importes y textos libres
+    # no se indexan nunca); los bitmaps por valor, recién al filtrar.
+    # El índice no retiene el DataFrame: guarda una referencia débil que
+    # indice_filtros() vuelve a apuntar en cada uso
+    def __init__(self, df, excluir=("total_general_s", "filas")):
+        self.n = len(df)
+        self._excluir = set(excluir)
+        self._columnas = {}
+        self._lock = threading.Lock()
+        self._todos = np.packbits(np.ones(self.n, dtype=bool))
+        self.fuente(df)
+
+    def fuente(self, df):
+        if len(df) != self.n:
+            raise ValueError("El índice no corresponde al DataFrame")
+        self._df = weakref.ref(df)
+
+    def _columna(self, col):
+        columna = self._columnas.get(col)
+        if columna is not None:
+            return columna
+
+        if col in self._excluir:
+            raise KeyError(col)
+
+        with self._lock:
+            columna = self._columnas.get(col)
+            if columna is None:
+                df = self._df()
+                if df is None:
+                    raise RuntimeError("El DataFrame del índice ya no existe")
+                columna = self._columnas[col] = _Columna(df[col])
+        return columna
+
+    @property
+    def nbytes(self):
+        return self._todos.nbytes + sum(c.nbytes for c in list(self._columnas.values()))
+
+    def todos(self):
+        return self._todos.copy()
+
+    def vacio(self):
+        return np.zeros_like(self._todos)
+
+    def bitmap(self, col, valores):
+        columna = self._columna(col)
+
+        codigos = [
+            codigo
+            for valor in valores
+            for codigo in columna.codigos_por_etiqueta.get(str(valor), [])
+        ]
+
+        if not codigos:
+            return self.vacio()
+
+        if columna.matriz is not None:
+            return np.bitwise_or.reduce(columna.matriz[codigos], axis=0)
+
+        return np.packbits(np.isin(columna.codigos, codigos))
+
+    def opciones(self, col, mascara):
+        columna = self._columna(col)
+
+        if columna.matriz is not None:
+            presentes = np.bitwise_and(columna.matriz, mascara).any(axis=1)
+        else:
+            codigos = columna.codigos[self.seleccion(mascara)]
+            codigos = codigos[codigos >= 0]
+            presentes = np.bincount(codigos, minlength=len(columna.etiquetas)) > 0
+
+        return sorted(set(columna.etiquetas[presentes]))
+
+    def seleccion(self, mascara):
+        return np.unpackbits(mascara, count=self.n).view(bool)
+
+    def contar(self, mascara):
+        return int(np.unpackbits(mascara, count=self.n).sum())
+
+    def aplicar(self, df, mascara):
+        if len(df) != self.n:
+            raise ValueError("El índice no corresponde al DataFrame")
+
+        if np.array_equal(mascara, self._todos):
+            return df
+
+        posiciones = np.flatnonzero(self.seleccion(mascara))
+
+        # un tramo contiguo (rango de fechas sobre el DataFrame ordenado)
+        # se devuelve como slice, sin copiar filas
+        if len(posiciones) and posiciones[-1] - posiciones[0] + 1 == len(posiciones):
+            return df.iloc[posiciones[0]:posiciones[-1] + 1]
+
+        return df.iloc[posiciones]
+
+
+# --------------------------------------------------
+# ÍNDICE ORDENADO DE FECHAS
+# --------------------------------------------------
+# El loader entrega el DataFrame ordenado por fecha (vacíos al final):
+# un rango de fechas es un tramo [inicio, fin) que se ubica con búsqueda
+# binaria, y cada mes es una lista de tramos (uno por año) tomada de la
+# tabla de cortes. Los tramos se convierten a bitmap para combinarlos
+# con IndiceFiltros antes de los filtros por categoría.
+
+class IndiceFechas:
+
+    def __init__(self, fechas):
+        valores = fechas.to_numpy(dtype="datetime64[ns]")
+        validos = ~np.isnat(valores)
+
+        self.n = len(valores)
+        self.n_validos = int(validos.sum())
+
+        # si por algún motivo no viene ordenado, se trabaja sobre el orden
+        ordenado = (
+            validos[:self.n_validos].all()
+            and (np.diff(valores[:self.n_validos].view("i8")) >= 0).all()
+        )
+        if ordenado:
+            self.orden = None
+            self.valores = valores[:self.n_validos]
+        else:
+            self.orden = np.argsort(
+                np.where(validos, valores.view("i8"), np.iinfo(np.int64).max),
+                kind="stable"
+            )
+            self.valores = valores[self.orden[:self.n_validos]]
+
+        # tabla de cortes por año-mes: mes (1-12) -> [(inicio, fin), ...]
+        periodos = self.valores.astype("datetime64[M]").view("i8")
+        cortes = np.flatnonzero(np.diff(periodos)) + 1
+        inicios = np.r_[0, cortes].astype(np.int64)
+        fines = np.r_[cortes, self.n_validos].astype(np.int64)
+
+        self.tramos_por_mes = {}
+        if self.n_validos:
+            for a, b in zip(inicios, fines):
+                mes = int(periodos[a] % 12) + 1
+                self.tramos_por_mes.setdefault(mes, []).append((int(a), int(b)))
+
+    @property
+    def nbytes(self):
+        total = self.valores.nbytes
+        if self.orden is not None:
+            total += self.orden.nbytes
+        return total
+
+    def todas(self):
+        return [(0, self.n_validos)] if self.n_validos else []
+
+    def tramos_mes(self, mes):
+        if isinstance(mes, str):
+            numeros = {nombre: num for num, nombre in MESES_ES.items()}
+            mes = numeros.get(mes)
+        return list(self.tramos_por_mes.get(mes, []))
+
+    def tramo(self, inicio, fin):
+        # fin inclusive, igual que fecha <= fin
+        a = np.searchsorted(self.valores, np.datetime64(pd.Timestamp(inicio), "ns"), side="left")
+        b = np.searchsorted(self.valores, np.datetime64(pd.Timestamp(fin), "ns"), side="right")
+        return [(int(a), int(max(a, b)))]
+
+    def meses_completos(self, inicio, fin):
+        # Si [inicio, fin] toma meses enteros de los datos devuelve el
+        # primer día del primer y del último mes; si corta alguno, None
+        (a, b), = self.tramo(inicio, fin)
+        if a >= b:
+            return None
+
+        def mes(i):
+            return self.valores[i].astype("datetime64[M]")
+
+        if a > 0 and mes(a - 1) == mes(a):
+            return None
+        if b < self.n_validos and mes(b) == mes(b - 1):
+            return None
+
+        return pd.Timestamp(mes(a)), pd.Timestamp(mes(b - 1))
+
+    def rango(self, tramos):
+        tramos = [(a, b) for a, b in tramos if a < b]
+        if not tramos:
+            return pd.NaT, pd.NaT
+
+        inicio = min(a for a, _ in tramos)
+        fin = max(b for _, b in tramos)
+        return pd.Timestamp(self.valores[inicio]), pd.Timestamp(self.valores[fin - 1])
+
+    def extremos(self, mascara):
+        # primera y última fecha entre las filas marcadas en el bitmap
+        seleccion = np.unpackbits(mascara, count=self.n).view(bool)
+        if self.orden is not None:
+            seleccion = seleccion[self.orden]
+
+        posiciones = np.flatnonzero(seleccion[:self.n_validos])
+        if not len(posiciones):
+            return pd.NaT, pd.NaT
+
+        return self.rango([(posiciones[0], posiciones[-1] + 1)])
+
+    def mascara(self, tramos):
+        seleccion = np.zeros(self.n, dtype=bool)
+        for a, b in tramos:
+            if self.orden is None:
+                seleccion[a:b] = True
+            else:
+                seleccion[self.orden[a:b]] = True
+        return np.packbits(seleccion)
+
+
+_cache_indices = CacheLRU(CACHE_INDICES_MAX_BYTES, medir=lambda i: i.nbytes)
+
+
+def _indice_cacheado(df, clase, *args):
+    version = df.attrs.get("version")
+
+    # sin versión (archivo en memoria) no hay con qué reutilizarlo
+    if version is None:
+        return clase(*args)
+
+    clave = (clase.__name__, version, len(df))
+    indice = _cache_indices.get(clave)
+
+    if indice is None:
+        indice = clase(*args)
+
+    # volver a medir: las columnas se indexan a medida que se usan
+    _cache_indices.put(clave, indice)
+
+    return indice
+
+
+def indice_filtros(df):
+    indice = _indice_cacheado(df, IndiceFiltros, df)
+    indice.fuente(df)
+    return indice
+
+
+def indice_fechas(df):
+    return _indice_cacheado(df, IndiceFechas, df["fecha"])
@@ -0,0 +1,214 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.tseries.api import guess_datetime_format
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+# --------------------------------------------------
+# INGESTA STREAMING DE XLSX
+# --------------------------------------------------
+# Lee la primera hoja fila a fila (calamine si está instalado, si no
+# openpyxl en modo read_only) sin materializar el modelo del libro.
+# Cada bloque de filas se convierte de inmediato: las columnas de fecha
+# y de monto van a arreglos numpy ya reservados, así nunca conviven el
+# texto original, la copia en str y el float de todo el archivo.
+
+TAMANO_BLOQUE = 20000
+
+
+def _filas_calamine(archivo):
+    if isinstance(archivo, (str, os.PathLike)):
+        libro = CalamineWorkbook.from_path(os.fspath(archivo))
+    else:
+        libro = CalamineWorkbook.from_filelike(archivo)
+
+    hoja = libro.get_sheet_by_index(0)
+
+    def filas():
+        for fila in hoja.iter_rows():
+            # calamine devuelve "" para celdas vacías
+            yield [None if v == "" else v for v in fila]
+
+    return filas(), hoja.height
+
+
+def _filas_openpyxl(archivo):
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    hoja = libro.worksheets[0]
+
+    # en read_only openpyxl recorre solo el rango de la etiqueta
+    # <dimension>, que muchos exportadores dejan mal ("A1"): se descarta
+    # y se leen todas las filas. Sin ese dato no hay tamaño estimado
+    hoja.reset_dimensions()
+
+    def filas():
+        try:
+            yield from hoja.iter_rows(values_only=True)
+        finally:
+            libro.close()
+
+    return filas(), None
+
+
+def _encabezados(fila, normalizar):
+    columnas = []
+    vistos = {}
+
+    for i, valor in enumerate(fila):
+        nombre = f"Unnamed: {i}" if valor is None else str(valor)
+        nombre = normalizar(nombre)
+
+        # mismo criterio que pandas para columnas repetidas
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+
+        columnas.append(nombre)
+
+    return columnas
+
+
+def _formato_fechas(valores):
+    # Formato de las fechas en texto, deducido del primer valor no vacío
+    # de la columna como haría pd.to_datetime con la columna entera. Se
+    # decide una vez por archivo: cada bloque deduciendo el suyo podía
+    # leer "03/02/2024" como día/mes en uno y mes/día en otro.
+    # Si el primer valor no es texto (fecha de Excel) o no se deduce,
+    # "mixed": cada texto se interpreta por separado, sin depender del
+    # bloque en que cayó
+    for valor in valores:
+        if valor is not None:
+            formato = guess_datetime_format(valor) if isinstance(valor, str) else None
+            return formato or "mixed"
+    return "mixed"
+
+
+def _a_fechas(valores, formato=None):
+    return pd.to_datetime(
+        pd.Series(valores, dtype=object), format=formato, errors="coerce"
+    ).to_numpy(dtype="datetime64[ns]")
+
+
+def _a_montos(valores):
+    serie = pd.Series(valores, dtype=object)
+
+    try:
+        return serie.astype(float).to_numpy()
+    except (TypeError, ValueError):
+        texto = serie.where(serie.isna(), serie.astype(str).str.replace(",", "", regex=False))
+        return pd.to_numeric(texto).to_numpy(dtype=float)
+
+
+def _crecer(arreglo, minimo):
+    nuevo = np.empty(max(minimo, len(arreglo) * 2), dtype=arreglo.dtype)
+    if arreglo.dtype.kind == "M":
+        nuevo[:] = np.datetime64("NaT")
+    nuevo[:len(arreglo)] = arreglo
+    return nuevo
+
+
+def leer_xlsx(
+    archivo,
+    normalizar=str,
+    columnas_fecha=("fecha",),
+    columnas_monto=("total_general_s",),
+    tamano_bloque=TAMANO_BLOQUE
+):
+    inicio = time.perf_counter()
+
+    if CalamineWorkbook is not None:
+        motor = "calamine"
+        filas, estimado = _filas_calamine(archivo)
+    else:
+        motor = "openpyxl"
+        filas, estimado = _filas_openpyxl(archivo)
+
+    filas = iter(filas)
+    columnas = _encabezados(next(filas, []), normalizar)
+    n_cols = len(columnas)
+
+    # El total de filas declarado por el libro puede faltar o ser
+    # inexacto: se reserva esa cantidad y se crece si hace falta
+    capacidad = max((estimado or 0) - 1, tamano_bloque)
+
+    datos = {}
+    for col in columnas:
+        if col in columnas_fecha:
+            datos[col] = np.full(capacidad, np.datetime64("NaT"), dtype="datetime64[ns]")
+        elif col in columnas_monto:
+            datos[col] = np.full(capacidad, np.nan)
+        else:
+            datos[col] = np.empty(capacidad, dtype=object)
+
+    n = 0
+    ultima_no_vacia = 0
+    bloque = []
+
+    # columna de fecha -> formato, desde el primer bloque con valores
+    formatos = {}
+
+    def volcar(bloque, desde):
+        hasta = desde + len(bloque)
+
+        for j, col in enumerate(columnas):
+            if len(datos[col]) < hasta:
+                datos[col] = _crecer(datos[col], hasta)
+
+            valores = [fila[j] for fila in bloque]
+
+            if col in columnas_fecha:
+                if col not in formatos and any(v is not None for v in valores):
+                    formatos[col] = _formato_fechas(valores)
+                datos[col][desde:hasta] = _a_fechas(valores, formatos.get(col))
+            elif col in columnas_monto:
+                datos[col][desde:hasta] = _a_montos(valores)
+            else:
+                datos[col][desde:hasta] = valores
+
+    for fila in filas:
+        fila = list(fila[:n_cols]) + [None] * (n_cols - len(fila))
+        bloque.append(fila)
+
+        if any(v is not None for v in fila):
+            ultima_no_vacia = n + len(bloque)
+
+        if len(bloque) >= tamano_bloque:
+            volcar(bloque, n)
+            n += len(bloque)
+            bloque = []
+
+    if bloque:
+        volcar(bloque, n)
+        n += len(bloque)
+
+    # igual que pandas: se descartan solo las filas vacías del final
+    n = ultima_no_vacia
+
+    columnas_df = {}
+    for col in columnas:
+        # copiar recorta la reserva sobrante y libera el arreglo grande
+        arr = datos.pop(col)[:n].copy()
+        columnas_df[col] = pd.Series(arr).infer_objects() if arr.dtype == object else arr
+
+    df = pd.DataFrame(columnas_df)
+
+    segundos = time.perf_counter() - inicio
+
+    estadisticas = {
+        "motor": motor,
+        "filas": n,
+        "columnas": n_cols,
+        "segundos": segundos,
+        "filas_por_segundo": n / segundos if segundos > 0 else float("inf"),
+    }
+
+    return df, estadisticas
@@ -0,0 +1,90 @@
+import streamlit as st
+
+# --------------------------------------------------
+# PANEL DE FILTROS: EN VIVO O POR LOTE
+# --------------------------------------------------
+# En vivo, cada multiselect, "✔ Todos", el mes o el rango de fechas
+# vuelve a ejecutar la página completa: armar una vista con cinco
+# filtros eran cinco recálculos de agregados, tabla, gráfico y
+# exportaciones. Por lote, el panel es un fragmento: tocar un filtro
+# vuelve a dibujar solo el panel (las opciones en cascada salen del
+# índice de bitmaps, que es barato) y la página se recalcula una sola
+# vez, con "Aplicar filtros".
+#
+# Por lote los widgets son un borrador. Lo aplicado es una foto aparte
+# (CLAVE_APLICADOS) que solo cambia con "Aplicar filtros": cualquier
+# otra ejecución completa (otro widget de la página, una exportación
+# que terminó, el login) sigue usando la foto, y la URL, de la que
+# salen los links compartidos, se deja como estaba mientras haya
+# cambios sin aplicar.
+# No se usa st.form porque dentro de un formulario las opciones de un
+# filtro no se pueden acotar según lo elegido en los otros.
+
+# por encima de estas filas el panel arranca por lote
+FILAS_POR_LOTE = 50_000
+
+CLAVE_APLICADOS = "filtros_aplicados"
+
+
+def filtros_por_lote(df, modo_lectura):
+    # en modo lectura los filtros no se editan
+    if modo_lectura:
+        return False
+
+    return st.sidebar.toggle(
+        "Aplicar filtros con botón",
+        value=len(df) > FILAS_POR_LOTE,
+        key="filtros_por_lote",
+        help="Los cambios de filtros se acumulan y la página se recalcula al aplicarlos"
+    )
+
+
+def _aplicar(origen, firma, resultado):
+    st.session_state[CLAVE_APLICADOS] = {
+        "origen": origen, "firma": firma, "resultado": resultado
+    }
+
+
+def _panel(dibujar, origen):
+    # la URL antes de dibujar: el borrador no debe quedar en ella
+    url = st.query_params.to_dict()
+
+    firma, resultado = dibujar()
+
+    # primera vez (o datos nuevos, u otra página): lo que muestra el
+    # panel, que salió de la URL, queda aplicado
+    aplicados = st.session_state.get(CLAVE_APLICADOS)
+    if aplicados is None or aplicados["origen"] != origen:
+        _aplicar(origen, firma, resultado)
+        aplicados = st.session_state[CLAVE_APLICADOS]
+
+    pendiente = firma != aplicados["firma"]
+    if pendiente:
+        st.caption("Hay cambios de filtros sin aplicar")
+
+    if st.button(
+        "✅ Aplicar filtros", key="aplicar_filtros", type="primary",
+        disabled=not pendiente, use_container_width=True
+    ):
+        # la URL queda con lo que escribió dibujar()
+        _aplicar(origen, firma, resultado)
+        st.rerun(scope="app")
+
+    if pendiente and st.query_params.to_dict() != url:
+        st.query_params.from_dict(url)
+
+    return aplicados["resultado"]
+
+
+def panel_filtros(dibujar, por_lote, df):
+    # `dibujar()`: dibuja los filtros con st.* (va dentro de la barra
+    # lateral) y devuelve (firma, resultado); la firma es la selección,
+    # comparable con ==. Devuelve el resultado aplicado
+    with st.sidebar:
+        if not por_lote:
+            # al pasar a por lote se aplica lo que se ve en ese momento
+            st.session_state.pop(CLAVE_APLICADOS, None)
+            return dibujar()[1]
+
+        origen = (df.attrs.get("version"), len(df))
+        return st.fragment(_panel)(dibujar, origen)
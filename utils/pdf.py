@@ -0,0 +1,211 @@
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import PageBreak, Paragraph, Table, TableStyle
+
+# --------------------------------------------------
+# TABLAS PAGINADAS PARA PDF (REPORTLAB)
+# --------------------------------------------------
+# Las celdas se arman por columna: texto plano y el color de cada fila
+# como comandos TEXTCOLOR de TableStyle (un comando por tramo de filas
+# seguidas del mismo tipo, sacado de una máscara de EGRESO). Solo las
+# celdas cuyo texto no entra en el ancho de su columna se convierten en
+# Paragraph para que hagan wrap.
+#
+# La tabla se corta en páginas antes de llegar a ReportLab: el alto de
+# cada fila se calcula con las líneas que ocupa su texto, y cada página
+# es una Table propia (encabezado + filas + subtotal) seguida de un
+# PageBreak. ReportLab nunca tiene que partir una tabla gigante y el
+# tiempo de armado crece en línea recta con las filas.
+
+FUENTE = "Helvetica"
+FUENTE_NEGRITA = "Helvetica-Bold"
+TAMANO_FUENTE = 9
+INTERLINEADO = 11
+
+# LEFTPADDING + RIGHTPADDING por defecto de Table
+RELLENO_HORIZONTAL = 12
+# TOPPADDING + BOTTOMPADDING del estilo de la tabla
+RELLENO_VERTICAL = 12
+
+# margen por página para diferencias de redondeo de ReportLab
+HOLGURA_PAGINA = 6
+
+COLOR_EGRESO = colors.HexColor("#BE2323")
+COLOR_INGRESO = colors.HexColor("#269161")
+FONDO_SUBTOTAL = colors.HexColor("#EEEEEE")
+
+ETIQUETA_SUBTOTAL = "Subtotal página"
+
+_estilo_celda = {
+    color: ParagraphStyle(
+        name=f"Celda{nombre}",
+        fontName=FUENTE,
+        fontSize=TAMANO_FUENTE,
+        leading=INTERLINEADO,
+        textColor=color
+    )
+    for nombre, color in [("Egreso", COLOR_EGRESO), ("Ingreso", COLOR_INGRESO)]
+}
+
+_estilo_encabezado = ParagraphStyle(
+    name="CeldaEncabezado",
+    fontName=FUENTE_NEGRITA,
+    fontSize=TAMANO_FUENTE,
+    leading=INTERLINEADO
+)
+
+
+def formato_soles(montos):
+    return montos.map(lambda x: f"S/ {x:,.2f}" if pd.notna(x) else "")
+
+
+def _lineas(textos, ancho, fuente):
+    # líneas que ocupa cada texto en su columna (una medición por texto
+    # distinto); 1 si entra sin wrap
+    util = ancho - RELLENO_HORIZONTAL
+    lineas = {}
+
+    for texto in pd.unique(textos):
+        if stringWidth(texto, fuente, TAMANO_FUENTE) <= util:
+            lineas[texto] = 1
+        else:
+            lineas[texto] = max(len(simpleSplit(texto, fuente, TAMANO_FUENTE, util)), 1)
+
+    return textos.map(lineas).to_numpy()
+
+
+def _tramos(mascara):
+    # (inicio, fin) de cada racha de True, fin inclusive
+    bordes = np.diff(np.concatenate(([0], mascara.astype(np.int8), [0])))
+    return zip(np.flatnonzero(bordes == 1), np.flatnonzero(bordes == -1) - 1)
+
+
+def _celdas(textos, lineas, egreso):
+    celdas = textos.to_numpy(dtype=object).copy()
+
+    for i in np.flatnonzero(lineas > 1):
+        color = COLOR_EGRESO if egreso[i] else COLOR_INGRESO
+        celdas[i] = Paragraph(escape(celdas[i]), _estilo_celda[color])
+
+    return celdas
+
+
+def _paginas(alturas, alto, alto_primera):
+    # cortes [inicio, fin) para que cada página entre en su alto
+    acumulado = np.concatenate(([0.0], np.cumsum(alturas)))
+    cortes = []
+    inicio = 0
+
+    while inicio < len(alturas):
+        capacidad = alto_primera if not cortes else alto
+        fin = int(np.searchsorted(acumulado, acumulado[inicio] + capacidad, side="right")) - 1
+        # al menos una fila por página
+        fin = max(fin, inicio + 1)
+        cortes.append((inicio, fin))
+        inicio = fin
+
+    return cortes or [(0, 0)]
+
+
+def tabla_paginada(
+    df,
+    ancho_total,
+    alto_pagina,
+    alto_primera=None,
+    columna_tipo="ingresoegreso",
+    columna_monto=None
+):
+    # Flowables de la tabla: una Table por página con su encabezado y,
+    # si hay columna_monto (numérica), el subtotal de la página.
+    # alto_primera: lo que queda libre en la página donde empieza.
+    num_cols = len(df.columns)
+    anchos = [ancho_total / num_cols] * num_cols
+
+    if alto_primera is None:
+        alto_primera = alto_pagina
+
+    if columna_tipo in df.columns:
+        egreso = df[columna_tipo].astype(str).str.upper().eq("EGRESO").to_numpy()
+    else:
+        egreso = np.zeros(len(df), dtype=bool)
+
+    textos = []
+    for i, col in enumerate(df.columns):
+        serie = df.iloc[:, i].reset_index(drop=True)
+        if col == columna_monto:
+            textos.append(formato_soles(serie))
+        else:
+            textos.append(serie.astype(str))
+
+    lineas = [_lineas(t, a, FUENTE) for t, a in zip(textos, anchos)]
+    columnas = [_celdas(t, l, egreso) for t, l in zip(textos, lineas)]
+
+    # encabezado
+    titulos = pd.Series([str(c) for c in df.columns])
+    lineas_titulo = [
+        _lineas(titulos.iloc[[i]], anchos[i], FUENTE_NEGRITA)[0] for i in range(num_cols)
+    ]
+    encabezado = [
+        Paragraph(f"<b>{escape(t)}</b>", _estilo_encabezado) if n > 1 else t
+        for t, n in zip(titulos, lineas_titulo)
+    ]
+
+    alto_fila = np.max(np.vstack(lineas), axis=0) * INTERLINEADO + RELLENO_VERTICAL
+    alto_fijo = max(lineas_titulo) * INTERLINEADO + RELLENO_VERTICAL + HOLGURA_PAGINA
+    if columna_monto is not None:
+        lineas_subtotal = _lineas(pd.Series([ETIQUETA_SUBTOTAL]), anchos[0], FUENTE_NEGRITA)[0]
+        alto_fijo += lineas_subtotal * INTERLINEADO + RELLENO_VERTICAL
+        etiqueta = ETIQUETA_SUBTOTAL
+        if lineas_subtotal > 1:
+            etiqueta = Paragraph(f"<b>{escape(ETIQUETA_SUBTOTAL)}</b>", _estilo_encabezado)
+
+    indice_monto = list(df.columns).index(columna_monto) if columna_monto is not None else None
+    montos = df[columna_monto].to_numpy(dtype=float) if columna_monto is not None else None
+
+    flowables = []
+    for inicio, fin in _paginas(alto_fila, alto_pagina - alto_fijo, alto_primera - alto_fijo):
+
+        filas = [encabezado] + [list(f) for f in zip(*(c[inicio:fin] for c in columnas))]
+
+        estilo = [
+            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+            ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+            ("FONT", (0,0), (-1,0), FUENTE_NEGRITA, TAMANO_FUENTE, INTERLINEADO),
+            ("FONT", (0,1), (-1,-1), FUENTE, TAMANO_FUENTE, INTERLINEADO),
+            ("TEXTCOLOR", (0,1), (-1,-1), COLOR_INGRESO),
+            ("VALIGN", (0,0), (-1,-1), "TOP"),
+            ("ALIGN", (1,1), (-1,-1), "LEFT"),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 6),
+            ("TOPPADDING", (0,0), (-1,-1), 6),
+        ]
+
+        # fila 0 es el encabezado
+        for a, b in _tramos(egreso[inicio:fin]):
+            estilo.append(("TEXTCOLOR", (0, a + 1), (-1, b + 1), COLOR_EGRESO))
+
+        if indice_monto is not None:
+            subtotal = [""] * num_cols
+            subtotal[0] = etiqueta
+            subtotal[indice_monto] = f"S/ {np.nansum(montos[inicio:fin]):,.2f}"
+            filas.append(subtotal)
+            estilo += [
+                ("FONT", (0,-1), (-1,-1), FUENTE_NEGRITA, TAMANO_FUENTE, INTERLINEADO),
+                ("TEXTCOLOR", (0,-1), (-1,-1), colors.black),
+                ("BACKGROUND", (0,-1), (-1,-1), FONDO_SUBTOTAL),
+            ]
+
+        if flowables:
+            flowables.append(PageBreak())
+
+        tabla = Table(filas, colWidths=anchos, repeatRows=1)
+        tabla.setStyle(TableStyle(estilo))
+        flowables.append(tabla)
+
+    return flowables
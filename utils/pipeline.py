@@ -0,0 +1,77 @@
+from utils.resultados import (
+    clave_resultado, encadenar_clave, obtener_resultado, guardar_resultado
+)
+
+# --------------------------------------------------
+# PIPELINE DE LA PÁGINA POR ETAPAS
+# --------------------------------------------------
+# Cada página recorre las mismas etapas en orden: carga → filtros (mes,
+# categorías, fechas) → datos agregables → agregado → KPIs/tabla →
+# gráfico → exportaciones. Antes todos los resultados compartían una
+# sola clave con todo el estado de la vista. Ahora cada etapa tiene su
+# propia clave, encadenada desde la anterior con solo las entradas que
+# agrega esa etapa:
+#
+#     clave(etapa) = hash(clave(etapa anterior), nombre, entradas)
+#
+# La etapa de filtros recibe el hash de la vista (utils.vistas): la
+# misma vista comparte resultados y exportaciones venga de donde venga.
+# Cambiar "Agrupar gráfico por" cambia solo la clave del gráfico: los
+# datos filtrados, el agregado y la tabla salen de la cache y se
+# recalcula únicamente el gráfico.
+# Una etapa se usa igual que antes obtener/guardar_resultado:
+#
+#     tabla = pipeline.etapa("tabla", columnas_groupby)
+#     if tabla is None:
+#         tabla = ...
+#         pipeline.guardar("tabla", tabla)
+#
+# Las secciones que son fragmentos (gráfico) se vuelven a ejecutar sin
+# el resto de la página: su primera etapa indica `desde` qué etapa
+# sigue, porque la última clave de la cadena puede ser la de la
+# ejecución anterior del fragmento.
+
+
+class Pipeline:
+
+    def __init__(self, df, pagina):
+        # la carga es la raíz: versión del dataset (None sin versión, y
+        # entonces no se memoiza nada)
+        self._clave = clave_resultado(df, pagina)
+        self._claves = {}
+
+        # etapas que se calcularon (el resto salió de cache)
+        self.ejecutadas = []
+
+    def paso(self, nombre, *entradas, desde=None):
+        # avanza la cadena sin guardar resultado (etapas baratas, como
+        # los ANDs de bitmaps de los filtros)
+        anterior = self._clave if desde is None else self._claves[desde]
+        self._clave = encadenar_clave(anterior, nombre, *entradas)
+        self._claves[nombre] = self._clave
+        return self._clave
+
+    def etapa(self, nombre, *entradas, desde=None):
+        # resultado guardado de la etapa; None si hay que calcularlo
+        clave = self.paso(nombre, *entradas, desde=desde)
+
+        valor = obtener_resultado(clave, nombre)
+        if valor is None:
+            self.ejecutadas.append(nombre)
+        return valor
+
+    def guardar(self, nombre, valor):
+        return guardar_resultado(self._claves[nombre], nombre, valor)
+
+    def clave(self, nombre=None):
+        # clave de una etapa (la última si no se indica)
+        if nombre is None:
+            return self._clave
+        return self._claves.get(nombre)
+
+    def identidad(self, *respaldo):
+        # lo que identifica todo lo calculado hasta aquí (exportaciones):
+        # la última clave, o los propios datos si no hay versión
+        if self._clave is None:
+            return respaldo
+        return self._clave
@@ -0,0 +1,97 @@
+import io
+import os
+import sys
+
+from multiprocessing import reduction, resource_tracker, spawn, util
+from multiprocessing.context import SpawnContext, SpawnProcess, set_spawning_popen
+
+from utils.imagenes import calentar_renderizador, metricas_renderizador
+
+# --------------------------------------------------
+# PUNTO DE ENTRADA DE LOS PROCESOS DE EXPORTACIÓN
+# --------------------------------------------------
+# Streamlit instala la página que corre como __main__ y spawn vuelve a
+# ejecutar el __main__ del padre en cada proceso nuevo: un worker
+# correría la página entera. Los procesos de exportación arrancan con
+# este módulo como __main__ (solo define funciones), sin tocar la
+# página, sys.modules ni la configuración de spawn de otros procesos.
+# Lo demás (sys.path, directorio, argv) se hereda igual que con spawn.
+
+
+def iniciar_proceso():
+    # Chromium arranca una vez por worker y queda caliente para todas
+    # las exportaciones que atienda (ver utils.imagenes). Va antes del
+    # nice: con la prioridad ya bajada el arranque de kaleido a veces no
+    # termina nunca, y el worker (y el cierre del servidor, que lo
+    # espera) quedaba colgado
+    calentar_renderizador()
+
+    # los workers ceden CPU a los reruns interactivos
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+def calentar():
+    # trabajo vacío: obliga al pool a arrancar un worker (y su Chromium)
+    return os.getpid(), metricas_renderizador()
+
+
+def _preparacion(nombre):
+    datos = spawn.get_preparation_data(nombre)
+    datos.pop("init_main_from_path", None)
+    datos["init_main_from_name"] = __name__
+    return datos
+
+
+if sys.platform != "win32":
+
+    from multiprocessing.popen_spawn_posix import Popen
+
+    class _Popen(Popen):
+
+        # igual que Popen._launch de spawn, salvo los datos de arranque
+        def _launch(self, process_obj):
+            tracker_fd = resource_tracker.getfd()
+            self._fds.append(tracker_fd)
+            datos = _preparacion(process_obj._name)
+            fp = io.BytesIO()
+            set_spawning_popen(self)
+            try:
+                reduction.dump(datos, fp)
+                reduction.dump(process_obj, fp)
+            finally:
+                set_spawning_popen(None)
+
+            parent_r = child_w = child_r = parent_w = None
+            try:
+                parent_r, child_w = os.pipe()
+                child_r, parent_w = os.pipe()
+                cmd = spawn.get_command_line(tracker_fd=tracker_fd, pipe_handle=child_r)
+                self._fds.extend([child_r, child_w])
+                self.pid = util.spawnv_passfds(spawn.get_executable(), cmd, self._fds)
+                self.sentinel = parent_r
+                with open(parent_w, "wb", closefd=False) as f:
+                    f.write(fp.getbuffer())
+            finally:
+                fds_to_close = [fd for fd in (parent_r, parent_w) if fd is not None]
+                self.finalizer = util.Finalize(self, util.close_fds, fds_to_close)
+
+                for fd in (child_r, child_w):
+                    if fd is not None:
+                        os.close(fd)
+
+    class _ProcesoExportacion(SpawnProcess):
+
+        @staticmethod
+        def _Popen(process_obj):
+            return _Popen(process_obj)
+
+else:
+    # en Windows se usa el spawn estándar (la página sí se vuelve a
+    # importar en cada worker)
+    _ProcesoExportacion = SpawnProcess
+
+
+class ContextoExportacion(SpawnContext):
+    # spawn: no se copia el estado (hilos, caches) del servidor
+    Process = _ProcesoExportacion
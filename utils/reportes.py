@@ -0,0 +1,309 @@
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+
+from utils.imagenes import imagen_figura, imagenes_figuras
+from utils.excel import LibroExcel, escribir_detalle
+from utils.pdf import tabla_paginada
+
+# --------------------------------------------------
+# GENERADORES DE REPORTES
+# --------------------------------------------------
+# Arman los archivos que se descargan desde las páginas. Viven en un
+# módulo (y no dentro de cada página) para poder ejecutarse en los
+# procesos de exportación: reciben solo datos y devuelven bytes.
+# `avance(fraccion, texto)` informa el progreso a la pantalla.
+# `imagen` son los parámetros de kaleido ya resueltos en la página.
+# Un generador puede devolver la ruta de un archivo temporal en vez de
+# los bytes (reportes grandes).
+
+# PDF con más filas en la tabla resumen: se escribe a un temporal
+FILAS_PDF_EN_MEMORIA = 2000
+
+
+def _avanzar(avance, fraccion, texto):
+    if avance is not None:
+        avance(fraccion, texto)
+
+
+def _tramo(avance, desde, hasta):
+    # progreso de un paso (0 a 1) dentro del total del reporte
+    if avance is None:
+        return None
+    return lambda fraccion, texto: avance(desde + (hasta - desde) * fraccion, texto)
+
+
+# --------------------------------------------------
+# ANÁLISIS INDIVIDUAL: EXCEL + GRÁFICOS (ZIP)
+# --------------------------------------------------
+
+def exportar_dashboard(
+    tabla,
+    total_ingresos,
+    total_egresos,
+    saldo,
+    fig_pie,
+    fig_bar,
+    nombre_excel,
+    imagen=None,
+    avance=None
+):
+    imagen = imagen or {}
+    zip_buffer = BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+
+        # -----------------------------
+        # Excel
+        # -----------------------------
+        _avanzar(avance, 0.1, "Excel")
+        excel_buffer = BytesIO()
+
+        with LibroExcel(excel_buffer) as libro:
+            # Resumen
+            df_resumen = pd.DataFrame({
+                "Concepto": ["Total Ingresos", "Total Egresos", "Saldo"],
+                "Monto": [total_ingresos, total_egresos, saldo]
+            })
+
+            libro.hoja("Resumen", df_resumen, moneda=["Monto"])
+
+            # Resultado filtrado: el monto va como número con formato S/
+            libro.hoja(
+                "Resultado_Filtrado",
+                tabla,
+                moneda=["total_general_s"]
+            )
+
+        excel_buffer.seek(0)
+        zipf.writestr(nombre_excel, excel_buffer.read())
+
+        # -----------------------------
+        # Gráficos
+        # -----------------------------
+        _avanzar(avance, 0.5, "Gráficos")
+        png_pie, png_bar = imagenes_figuras([fig_pie, fig_bar], **imagen)
+
+        zipf.writestr("grafico_ingresos_egresos.png", png_pie)
+        zipf.writestr("grafico_resultados.png", png_bar)
+
+    return zip_buffer.getvalue()
+
+
+# --------------------------------------------------
+# ANÁLISIS INDIVIDUAL: PDF EJECUTIVO
+# --------------------------------------------------
+
+def exportar_pdf_ejecutivo(
+    total_ingresos,
+    total_egresos,
+    saldo,
+    tabla_resumen,
+    fig_pie,
+    fig_bar,
+    ultima_fecha,
+    fecha_inicio,
+    fecha_fin,
+    imagen=None,
+    avance=None
+):
+    imagen = imagen or {}
+
+    # un reporte grande se escribe a un archivo temporal (el worker lo
+    # mueve a data/exports) en lugar de juntar todo el PDF en memoria
+    if len(tabla_resumen) > FILAS_PDF_EN_MEMORIA:
+        descriptor, salida = tempfile.mkstemp(suffix=".pdf")
+        os.close(descriptor)
+    else:
+        salida = BytesIO()
+
+    doc = SimpleDocTemplate(
+        salida,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm
+    )
+
+    styles = getSampleStyleSheet()
+    story = []
+
+    # -------------------------------
+    # TÍTULO DEL PDF
+    # -------------------------------
+    story.append(Paragraph("<b>REPORTE EJECUTIVO – CONTROL DE CAJA</b>", styles["Title"]))
+    story.append(Spacer(1, 12))
+
+    fecha_generacion = datetime.now().strftime("%d/%m/%Y %H:%M")
+
+    fecha_inicio_fmt = pd.to_datetime(fecha_inicio).strftime("%d/%m/%Y")
+    fecha_fin_fmt = pd.to_datetime(fecha_fin).strftime("%d/%m/%Y")
+
+    story.append(
+        Paragraph(
+            f"<b>Fecha de generación:</b> {fecha_generacion}",
+            styles["Normal"]
+        )
+    )
+
+    story.append(Spacer(1, 6))
+
+    story.append(
+        Paragraph(
+            f"<b>Rango de Análisis:</b> {fecha_inicio_fmt} al {fecha_fin_fmt}",
+            styles["Normal"]
+        )
+    )
+    story.append(Spacer(1, 12))
+
+    # -------------------------------
+    # KPIs
+    # -------------------------------
+    kpi_data = [
+        ["Total Ingresos", f"S/ {total_ingresos:,.2f}"],
+        ["Total Egresos", f"S/ {abs(total_egresos):,.2f}"],
+        ["Saldo", f"S/ {saldo:,.2f}"]
+    ]
+
+    tabla_kpi = Table(kpi_data, colWidths=[7*cm, 6*cm])
+    tabla_kpi.setStyle(TableStyle([
+        ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+        ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+        ("FONT", (0,0), (-1,-1), "Helvetica"),
+        ("ALIGN", (1,0), (-1,-1), "RIGHT"),
+    ]))
+
+    story.append(tabla_kpi)
+    story.append(Spacer(1, 16))
+
+    # -------------------------------
+    # EXPORTAR GRÁFICOS A IMAGEN
+    # -------------------------------
+    # cada gráfico se renderiza una sola vez (mismos PNG que el ZIP,
+    # salen de la cache de imágenes) y se inserta una vez en el PDF
+    _avanzar(avance, 0.2, "Gráficos")
+    png_pie, png_bar = imagenes_figuras([fig_pie, fig_bar], **imagen)
+    pie_img = BytesIO(png_pie)
+    bar_img = BytesIO(png_bar)
+
+    story.append(Paragraph("<b>Distribución de Ingresos y Egresos</b>", styles["Heading2"]))
+    story.append(Spacer(1, 8))
+    story.append(Image(pie_img, width=14*cm, height=9*cm))
+    story.append(Spacer(1, 16))
+
+    story.append(Paragraph("<b>Resultados según filtros</b>", styles["Heading2"]))
+    story.append(Spacer(1, 8))
+    story.append(Image(bar_img, width=15*cm, height=9*cm))
+    story.append(Spacer(1, 16))
+
+    # -------------------------------
+    # TABLA RESUMEN
+    # -------------------------------
+    _avanzar(avance, 0.4, "Tabla resumen")
+
+    # la tabla empieza en una página nueva: cada página lleva su
+    # encabezado y el subtotal de TOTAL (ver utils.pdf)
+    titulo_tabla = Paragraph("<b>Resumen de Resultados</b>", styles["Heading2"])
+    _, alto_titulo = titulo_tabla.wrap(doc.width, doc.height)
+    alto_titulo += titulo_tabla.getSpaceBefore() + titulo_tabla.getSpaceAfter() + 8
+
+    # el Frame de SimpleDocTemplate tiene 6 pt de padding por lado
+    alto_pagina = doc.height - 12
+
+    story.append(PageBreak())
+    story.append(titulo_tabla)
+    story.append(Spacer(1, 8))
+    story.extend(tabla_paginada(
+        tabla_resumen,
+        doc.width,
+        alto_pagina,
+        alto_primera=alto_pagina - alto_titulo,
+        columna_monto="TOTAL" if "TOTAL" in tabla_resumen.columns else None
+    ))
+
+    # -------------------------------
+    _avanzar(avance, 0.5, "Armando PDF")
+
+    def progreso(tipo, valor):
+        # ReportLab informa primero el total estimado y luego lo hecho
+        if tipo == "SIZE_EST":
+            progreso.total = max(valor, 1)
+        elif tipo == "PROGRESS" and avance is not None:
+            _avanzar(avance, 0.5 + 0.5 * min(valor / progreso.total, 1), "Armando PDF")
+
+    progreso.total = max(len(story), 1)
+    doc.setProgressCallBack(progreso)
+    doc.build(story)
+
+    if isinstance(salida, BytesIO):
+        return salida.getvalue()
+    return salida
+
+
+# --------------------------------------------------
+# COMPARATIVOS: EXCEL COMPLETO Y GRÁFICO PNG
+# --------------------------------------------------
+
+COLUMNAS_MONEDA_COMPARATIVO = ["Ejecutado", "Proyectado", "Diferencia", "total_general_s"]
+
+
+def exportar_excel_comparativo(tabla, graf_pivot, detalle, formato_detalle=None, avance=None):
+    # formato_detalle None: todo en un .xlsx; "csv"/"parquet": ZIP con
+    # el Excel de resúmenes y el detalle aparte (ver utils.excel)
+    buffer_excel = BytesIO()
+
+    with LibroExcel(buffer_excel) as libro:
+
+        # Hoja tabla comparativa
+        _avanzar(avance, 0.05, "Hoja Comparativo")
+        libro.hoja(
+            "Comparativo", tabla,
+            moneda=COLUMNAS_MONEDA_COMPARATIVO, porcentaje=["% Cumplimiento"]
+        )
+
+        # Hoja datos del gráfico
+        _avanzar(avance, 0.1, "Hoja Datos Grafico")
+        libro.hoja(
+            "Datos Grafico", graf_pivot,
+            moneda=COLUMNAS_MONEDA_COMPARATIVO, porcentaje=["% Cumplimiento"]
+        )
+
+        # Hoja detalle filtrado
+        if formato_detalle is None:
+            libro.hoja(
+                "Detalle", detalle,
+                moneda=COLUMNAS_MONEDA_COMPARATIVO,
+                avance=_tramo(avance, 0.15, 0.9)
+            )
+
+        _avanzar(avance, 0.9, "Guardando libro")
+
+    if formato_detalle is None:
+        return buffer_excel.getvalue()
+
+    zip_buffer = BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("comparativo.xlsx", buffer_excel.getvalue())
+        escribir_detalle(
+            zipf, "detalle", detalle, formato_detalle,
+            avance=_tramo(avance, 0.9, 1.0)
+        )
+
+    return zip_buffer.getvalue()
+
+
+def exportar_png(fig, imagen=None, avance=None):
+    _avanzar(avance, 0.1, "Renderizando gráfico")
+    return imagen_figura(fig, **(imagen or {}))
@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+import plotly.io as pio
+
+from utils.cache import CacheLRU, medir_objeto
+
+# --------------------------------------------------
+# CACHE DE RESULTADOS POR VISTA (COMPARTIDA)
+# --------------------------------------------------
+# La mayoría de las visitas son usuarios de lectura que abren el mismo
+# link compartido: cada sesión volvía a calcular los mismos agregados,
+# tablas y gráficos. Los resultados de cada etapa se guardan una vez
+# por servidor con clave = (versión del dataset, estado canónico de la
+# vista), así el siguiente visitante de la vista los toma de aquí.
+#
+# Lo que sale de la cache es compartido por todas las sesiones: no se
+# modifica. Las figuras son la excepción: se guardan como JSON y cada
+# sesión recibe una figura nueva, porque las páginas las siguen
+# ajustando (update_layout, etc.).
+
+CACHE_RESULTADOS_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _FiguraJSON(str):
+    pass
+
+
+def _medir(valor):
+    if isinstance(valor, str):
+        return len(valor)
+    nbytes = getattr(valor, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return medir_objeto(valor)
+
+
+_cache_resultados = CacheLRU(CACHE_RESULTADOS_MAX_BYTES, medir=_medir)
+
+
+def _canonico(valor):
+    # fechas, numpy, etc. como texto; dicts con las claves ordenadas
+    return json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def clave_resultado(df, *estado):
+    # None si el dataset no tiene versión: no hay con qué invalidar
+    version = df.attrs.get("version")
+    if version is None:
+        return None
+
+    return (version, hashlib.sha256(_canonico(list(estado)).encode()).hexdigest())
+
+
+def encadenar_clave(clave, *estado):
+    # clave de una etapa a partir de la clave de la etapa anterior: la
+    # etapa cambia si cambia su estado o el de cualquier etapa previa
+    if clave is None:
+        return None
+
+    texto = clave[1] + _canonico(list(estado))
+    return (clave[0], hashlib.sha256(texto.encode()).hexdigest())
+
+
+def obtener_resultado(clave, etapa):
+    if clave is None:
+        return None
+
+    valor = _cache_resultados.get((clave, etapa))
+    if isinstance(valor, _FiguraJSON):
+        return pio.from_json(str(valor))
+    return valor
+
+
+def guardar_resultado(clave, etapa, valor):
+    if clave is None:
+        return valor
+
+    if hasattr(valor, "to_plotly_json"):
+        _cache_resultados.put((clave, etapa), _FiguraJSON(valor.to_json()))
+    else:
+        _cache_resultados.put((clave, etapa), valor)
+
+    return valor
+
+
+def estadisticas_resultados():
+    return _cache_resultados.estadisticas()
@@ -0,0 +1,121 @@
+import numpy as np
+import streamlit as st
+
+# --------------------------------------------------
+# TABLAS DE RESULTADOS SIN FORMATO POR CELDA
+# --------------------------------------------------
+# Antes las tablas se mostraban con Styler.format + apply/applymap: un
+# callback de Python por fila o celda y cada monto convertido a texto
+# ("S/. 1,234.00") antes de enviarlo. Ahora los montos viajan como
+# números y el navegador los formatea (column_config); los colores
+# salen de máscaras calculadas de una vez sobre las columnas y se pasan
+# al Styler como un solo arreglo de estilos.
+
+COLOR_NEGATIVO = "#BE2323"
+COLOR_POSITIVO = "green"
+
+# por encima de esta cantidad de celdas los colores van como una columna
+# de marcas (COLUMNA_MARCA) en lugar del Styler: con Styler, Streamlit
+# serializa además el texto y el CSS de cada celda (5000 filas: ~0.4 s
+# y 4 veces el payload; sin Styler, 0.01 s)
+MAX_CELDAS_ESTILO = 5_000
+
+COLUMNA_MARCA = "●"
+MARCA_NEGATIVO = "🔴"
+MARCA_POSITIVO = "🟢"
+
+
+def configuracion_columnas(tabla, moneda=(), porcentaje=()):
+    config = {}
+
+    for col in moneda:
+        if col in tabla.columns:
+            config[col] = st.column_config.NumberColumn(
+                f"{col} (S/.)", format="localized", step=0.01
+            )
+
+    for col in porcentaje:
+        if col in tabla.columns:
+            config[col] = st.column_config.NumberColumn(col, format="%.2f %%")
+
+    return config
+
+
+def estilos_tabla(tabla, filas_rojas=None, signo=None, negrita=()):
+    # arreglo (filas x columnas) de CSS; None si no hay nada que pintar
+    estilos = np.full(tabla.shape, "", dtype=object)
+
+    if filas_rojas is not None:
+        estilos[np.asarray(filas_rojas, dtype=bool)] = f"color: {COLOR_NEGATIVO}"
+
+    if signo is not None and signo in tabla.columns:
+        j = tabla.columns.get_loc(signo)
+        valores = tabla[signo].to_numpy(dtype=float, na_value=np.nan)
+        estilos[valores < 0, j] = f"color: {COLOR_NEGATIVO}"
+        estilos[valores > 0, j] = f"color: {COLOR_POSITIVO}"
+
+    for col in negrita:
+        if col in tabla.columns:
+            j = tabla.columns.get_loc(col)
+            estilos[:, j] = np.where(
+                estilos[:, j] == "", "font-weight: bold", estilos[:, j] + "; font-weight: bold"
+            )
+
+    if not (estilos != "").any():
+        return None
+    return estilos
+
+
+def marcar_filas(tabla, filas_rojas=None, signo=None):
+    # La misma señal que los colores, como texto por fila: rojo si la fila
+    # va en rojo o `signo` es negativo, verde si `signo` es positivo.
+    # None si no hay nada que marcar
+    if filas_rojas is None and (signo is None or signo not in tabla.columns):
+        return None, None
+
+    rojas = np.zeros(len(tabla), dtype=bool)
+    verdes = np.zeros(len(tabla), dtype=bool)
+    ayuda = []
+
+    if filas_rojas is not None:
+        rojas |= np.asarray(filas_rojas, dtype=bool)
+        ayuda.append(f"{MARCA_NEGATIVO} fila en rojo")
+
+    if signo is not None and signo in tabla.columns:
+        valores = tabla[signo].to_numpy(dtype=float, na_value=np.nan)
+        rojas |= valores < 0
+        verdes |= (valores > 0) & ~rojas
+        ayuda.append(f"{signo}: {MARCA_NEGATIVO} negativo, {MARCA_POSITIVO} positivo")
+
+    marcas = np.where(rojas, MARCA_NEGATIVO, np.where(verdes, MARCA_POSITIVO, ""))
+    return marcas, "; ".join(ayuda)
+
+
+def mostrar_tabla(
+    tabla,
+    moneda=(),
+    porcentaje=(),
+    filas_rojas=None,
+    signo=None,
+    negrita=(),
+    **kwargs
+):
+    # `filas_rojas`: máscara de filas con texto en rojo; `signo`: columna
+    # en rojo si es negativa y en verde si es positiva
+    config = configuracion_columnas(tabla, moneda, porcentaje)
+
+    datos = tabla
+    if tabla.size <= MAX_CELDAS_ESTILO:
+        estilos = estilos_tabla(tabla, filas_rojas, signo, negrita)
+        if estilos is not None:
+            datos = tabla.style.apply(lambda _: estilos, axis=None)
+    else:
+        marcas, ayuda = marcar_filas(tabla, filas_rojas, signo)
+        if marcas is not None:
+            datos = tabla.copy(deep=False)
+            datos.insert(0, COLUMNA_MARCA, marcas)
+            config[COLUMNA_MARCA] = st.column_config.TextColumn(
+                COLUMNA_MARCA, help=ayuda, width="small"
+            )
+
+    st.dataframe(datos, column_config=config, **kwargs)
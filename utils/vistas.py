@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# --------------------------------------------------
+# VISTAS COMPARTIDAS (URL CORTA)
+# --------------------------------------------------
+# Cada vista (los filtros de la URL) se guarda en una base SQLite con
+# índice por id y por hash canónico de los filtros. El id sale del hash
+# (sus primeros LARGO_ID caracteres): la misma vista tiene el mismo id
+# para todos los usuarios y páginas, y abrir un link es una búsqueda por
+# clave primaria. Antes era un JSON por vista en
+# data/views; esos archivos se siguen leyendo y se pasan a la base la
+# primera vez que alguien abre su link.
+# Las vistas que nadie abre en TTL_VISTAS se borran (limpiar_vistas).
+
+RUTA_VISTAS = os.path.join("data", "vistas.db")
+CARPETA_VISTAS_ANTIGUAS = os.path.join("data", "views")
+
+TTL_VISTAS = 90 * 24 * 60 * 60  # segundos
+
+LARGO_ID = 8
+
+# cada cuánto se corre la limpieza al guardar
+INTERVALO_LIMPIEZA = 60 * 60  # segundos
+
+_lock = threading.Lock()
+_base_lista = None
+_ultima_limpieza = 0.0
+
+
+def _crear_base(conexion):
+    # WAL: las lecturas no esperan a las escrituras de otras sesiones
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS vistas (
+            id TEXT PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,
+            filtros TEXT NOT NULL,
+            creada REAL NOT NULL,
+            usada REAL NOT NULL
+        )
+    """)
+    conexion.execute("CREATE INDEX IF NOT EXISTS vistas_usada ON vistas (usada)")
+
+
+def _preparar_base():
+    # la creación (y el paso a WAL) se hace una sola vez por proceso
+    global _base_lista
+
+    if _base_lista == RUTA_VISTAS:
+        return
+
+    with _lock:
+        if _base_lista != RUTA_VISTAS:
+            os.makedirs(os.path.dirname(RUTA_VISTAS), exist_ok=True)
+            with sqlite3.connect(RUTA_VISTAS, timeout=10) as conexion:
+                _crear_base(conexion)
+            conexion.close()
+            _base_lista = RUTA_VISTAS
+
+
+@contextmanager
+def _conectar(escritura=False):
+    # Una conexión por operación (las sesiones corren en hilos distintos)
+    # y sin lock del proceso: la concurrencia la resuelve SQLite (WAL y
+    # `timeout`). `escritura` toma el lock de escritura de SQLite desde
+    # el principio (BEGIN IMMEDIATE), para operaciones que leen y después
+    # escriben según lo leído. Commit al salir sin error
+    _preparar_base()
+
+    conexion = sqlite3.connect(RUTA_VISTAS, timeout=10)
+    try:
+        with conexion:
+            if escritura:
+                conexion.execute("BEGIN IMMEDIATE")
+            yield conexion
+    finally:
+        conexion.close()
+
+
+def normalizar_filtros(filtros):
+    # Forma de la URL: listas como "a,b" y todo lo demás como texto. Las
+    # páginas arman el dict distinto (unas parten las comas, otras no) y
+    # así la misma vista queda igual en todas; al cargarla, las dos
+    # formas de restaurar aceptan el texto.
+    return {
+        str(k): ",".join(str(x) for x in v) if isinstance(v, (list, tuple)) else str(v)
+        for k, v in filtros.items()
+    }
+
+
+def _canonico(filtros):
+    # mismo texto para los mismos filtros, sin importar el orden
+    return json.dumps(
+        normalizar_filtros(filtros), sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def hash_vista(filtros):
+    # también es la clave de la etapa de filtros de las páginas (ver
+    # vista_filtros), de la que cuelgan agregados, gráficos y exportaciones
+    return hashlib.sha256(_canonico(filtros).encode()).hexdigest()
+
+
+def vista_filtros(columnas, filtros, mes, fechas, modo):
+    # Los filtros aplicados con los nombres de la URL: misma vista, mismo
+    # hash, venga de los widgets o de un link
+    vista = {"columnas": columnas, "mes": mes, "modo": modo}
+    vista.update(filtros)
+
+    if fechas is not None and len(fechas) == 2:
+        vista["fecha_inicio"] = str(fechas[0])
+        vista["fecha_fin"] = str(fechas[1])
+
+    return vista
+
+
+def id_vista(filtros):
+    # id esperado de la vista; solo cambia si hubo colisión (guardar_vista)
+    return hash_vista(filtros)[:LARGO_ID]
+
+
+def guardar_vista(filtros):
+    # Devuelve el id de la vista; si ya existe no se escribe nada nuevo
+    texto = _canonico(filtros)
+    digest = hashlib.sha256(texto.encode()).hexdigest()
+    ahora = time.time()
+
+    # dos sesiones que guardan la misma vista no eligen ids por separado
+    with _conectar(escritura=True) as conexion:
+        fila = conexion.execute(
+            "SELECT id FROM vistas WHERE hash = ?", (digest,)
+        ).fetchone()
+
+        if fila is not None:
+            conexion.execute("UPDATE vistas SET usada = ? WHERE id = ?", (ahora, fila[0]))
+            view_id = fila[0]
+        else:
+            # colisión: el prefijo ya es de otra vista (o de un id antiguo),
+            # se alarga hasta que quede libre
+            for largo in range(LARGO_ID, len(digest) + 1, 2):
+                view_id = digest[:largo]
+                ocupado = conexion.execute(
+                    "SELECT 1 FROM vistas WHERE id = ?", (view_id,)
+                ).fetchone()
+                if ocupado is None:
+                    break
+
+            conexion.execute(
+                "INSERT INTO vistas (id, hash, filtros, creada, usada) VALUES (?, ?, ?, ?, ?)",
+                (view_id, digest, texto, ahora, ahora)
+            )
+
+    _limpiar_cada_tanto()
+    return view_id
+
+
+def _importar_antigua(conexion, view_id):
+    # vista guardada como data/views/<id>.json (formato anterior)
+    ruta = os.path.join(CARPETA_VISTAS_ANTIGUAS, f"{os.path.basename(view_id)}.json")
+
+    try:
+        with open(ruta) as f:
+            filtros = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    texto = _canonico(filtros)
+    ahora = time.time()
+
+    # si la misma vista ya tiene otro id, el link viejo igual funciona
+    conexion.execute(
+        "INSERT OR IGNORE INTO vistas (id, hash, filtros, creada, usada) VALUES (?, ?, ?, ?, ?)",
+        (view_id, hashlib.sha256(texto.encode()).hexdigest(), texto, ahora, ahora)
+    )
+    return filtros
+
+
+def cargar_vista(view_id):
+    with _conectar() as conexion:
+        fila = conexion.execute(
+            "SELECT filtros FROM vistas WHERE id = ?", (view_id,)
+        ).fetchone()
+
+        if fila is None:
+            return _importar_antigua(conexion, view_id)
+
+        conexion.execute("UPDATE vistas SET usada = ? WHERE id = ?", (time.time(), view_id))
+
+    return json.loads(fila[0])
+
+
+# --------------------------------------------------
+# LIMPIEZA
+# --------------------------------------------------
+
+def limpiar_vistas(ttl=TTL_VISTAS):
+    # borra las vistas que nadie guardó ni abrió en `ttl` segundos
+    # (también los JSON antiguos); devuelve cuántas se borraron
+    limite = time.time() - ttl
+
+    with _conectar() as conexion:
+        borradas = conexion.execute("DELETE FROM vistas WHERE usada < ?", (limite,)).rowcount
+
+    if os.path.isdir(CARPETA_VISTAS_ANTIGUAS):
+        for entrada in os.scandir(CARPETA_VISTAS_ANTIGUAS):
+            try:
+                if entrada.name.endswith(".json") and entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+                    borradas += 1
+            except OSError:
+                pass
+
+    return borradas
+
+
+def _limpiar_cada_tanto():
+    global _ultima_limpieza
+
+    ahora = time.time()
+    if ahora - _ultima_limpieza < INTERVALO_LIMPIEZA:
+        return
+    _ultima_limpieza = ahora
+
+    limpiar_vistas()
+
+
+def estadisticas_vistas():
+    with _conectar() as conexion:
+        total, ultima = conexion.execute(
+            "SELECT COUNT(*), MAX(usada) FROM vistas"
+        ).fetchone()
+
+    return {
+        "vistas": total,
+        "ultima_usada": ultima,
+        "bytes": os.path.getsize(RUTA_VISTAS) if os.path.exists(RUTA_VISTAS) else 0,
+    }
+
+
+# --------------------------------------------------
+# BOTÓN DE URL CORTA
+# --------------------------------------------------
+
+def boton_url_corta(filtros):
+    # La vista se guarda solo al pedir la URL (no en cada rerun); el id
+    # queda en la sesión mientras los filtros no cambien
+    digest = hash_vista(filtros)
+    compartida = st.session_state.get("vista_compartida")
+
+    if compartida is None or compartida[0] != digest:
+        hueco = st.empty()
+        if not hueco.button("🔗 Generar URL corta", key="generar_url_corta"):
+            return
+        hueco.empty()
+
+        compartida = (digest, guardar_vista(filtros))
+        st.session_state["vista_compartida"] = compartida
+
+    view_id = compartida[1]
+
+    components.html(f"""
+    <div style="margin-top:10px">
+
+    <button onclick="copyUrl()" style="
+    background:#2E8B57;
+    color:white;
+    border:none;
+    padding:10px 16px;
+    border-radius:8px;
+    cursor:pointer;
+    font-size:14px;
+    width:100%;
+    ">
+    📋 Copiar URL corta
+    </button>
+
+    </div>
+
+    <script>
+
+    function copyUrl() {{
+
+    const base = window.parent.location.origin + window.parent.location.pathname;
+    const url = base + "?v={view_id}";
+
+    navigator.clipboard.writeText(url).then(function() {{
+        alert("✅ URL copiada:\\n" + url);
+    }});
+
+    }}
+
+    </script>
+    """, height=80)